@@ -1,38 +1,124 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import os
+import asyncio
+import hashlib
+import json
+import shutil
 import tempfile
-import uuid
 from typing import Optional
 
+from app.core.data_collection.video_collector import VideoCollector, youtube_video_id
+from app.core.data_collection.media_store import MediaStore
 from app.core.data_collection.transcriber import Transcriber
+from app.core.data_collection.transcript_cache import TranscriptCache
 from app.core.preprocessing.preprocessor import TextPreprocessor
 from app.core.model.openai_interface import GPTInterface
+from app.core.model.async_openai_interface import AsyncGPTInterface
+from app.core.model.rate_limiter import RateLimiter, INTERACTIVE, BATCH
+from app.core.model.completion_cache import CompletionCache
 from app.core.few_shot.few_shot_learner import FewShotLearner
+from app.core.few_shot.example_index import ExampleIndex
 from app.core.few_shot.prompt_templates import PromptTemplates
-from app.core.formatting.output_formatter import OutputFormatter
+from app.core.few_shot.token_counter import PromptTooLargeError
+from app.core.formatting.output_formatter import OutputFormatter, FORMATS, MEDIA_TYPES
+from app.core.summarization.map_reduce import MapReduceSummarizer
+from app.core.jobs.job_queue import JobQueue
+from app.core.jobs.pipeline import VideoPipeline
+from app.core.jobs.worker_pool import JobWorkerPool
+from app.core.monitoring.metrics import metrics
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start the job workers, and stop them and close the pooled model client on shutdown.
+
+    Jobs of a process that died are taken over when their leases expire, so
+    starting a worker never disturbs jobs its sibling processes are running.
+    """
+    worker_pool.start()
+    yield
+    await asyncio.to_thread(worker_pool.stop)
+    await gpt_interface.aclose()
 
 app = FastAPI(
     title="Video Recap AI",
     description="API for generating concise summaries of tutorial videos",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configuration
 API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-3.5-turbo")
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH", "./data/cache/completions.sqlite3")
+TRANSCRIPT_CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", "./data/cache/transcripts.sqlite3")
+EXAMPLES_PATH = os.getenv("EXAMPLES_PATH")
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "64"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "./data/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Jobs of a worker process that stops renewing its leases are taken over after this long
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+MEDIA_DIR = os.getenv("MEDIA_DIR", "./data/media")
+MEDIA_QUOTA_GB = float(os.getenv("MEDIA_QUOTA_GB", "20"))
+# Shared by every worker process using the same database, so together they stay under the limits
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "0")) or None
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "0")) or None
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "./data/ratelimit.sqlite3")
+# Metrics are per process; each server worker exposes its own /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+metrics.configure(enabled=METRICS_ENABLED)
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # Initialize components
-transcriber = Transcriber(use_openai=True, api_key=API_KEY)
-preprocessor = TextPreprocessor()
-gpt_interface = GPTInterface(api_key=API_KEY, model=MODEL_NAME)
-few_shot_learner = FewShotLearner()
-output_formatter = OutputFormatter()
+transcriber = Transcriber(use_openai=True, api_key=API_KEY, cache=TranscriptCache(TRANSCRIPT_CACHE_PATH))
+completion_cache = CompletionCache(COMPLETION_CACHE_PATH)
+rate_limiter = (RateLimiter(RATE_LIMIT_DB_PATH, requests_per_minute=OPENAI_RPM, tokens_per_minute=OPENAI_TPM)
+                if OPENAI_RPM or OPENAI_TPM else None)
+# Interactive requests are admitted ahead of video jobs when the rate limit is tight
+gpt_interface = AsyncGPTInterface(api_key=API_KEY, model=MODEL_NAME, cache=completion_cache,
+                                  max_concurrency=OPENAI_MAX_CONCURRENCY,
+                                  max_connections=OPENAI_MAX_CONNECTIONS, timeout=OPENAI_TIMEOUT,
+                                  rate_limiter=rate_limiter, priority=INTERACTIVE)
+few_shot_learner = FewShotLearner(model=MODEL_NAME,
+                                  index=ExampleIndex.open(EXAMPLES_PATH) if EXAMPLES_PATH else None)
+# Segment budgets are counted with the model's own tokenizer
+preprocessor = TextPreprocessor(token_counter=few_shot_learner.token_counter(MODEL_NAME).count)
+
+# Video jobs run on worker threads with the blocking model client
+job_queue = JobQueue(JOB_DB_PATH, lease_seconds=JOB_LEASE_SECONDS, retry_delay=JOB_RETRY_DELAY)
+media_store = MediaStore(MEDIA_DIR, max_bytes=int(MEDIA_QUOTA_GB * 1024 ** 3))
+pipeline = VideoPipeline(
+    VideoCollector(media_store=media_store),
+    transcriber,
+    preprocessor,
+    MapReduceSummarizer(GPTInterface(api_key=API_KEY, model=MODEL_NAME, cache=completion_cache,
+                                     rate_limiter=rate_limiter, priority=BATCH),
+                        few_shot_learner=few_shot_learner, cacheable=True),
+    job_queue=job_queue
+)
+
+def run_job(job, set_stage):
+    """Run a video job through the pipeline and format its summary.
+
+    The structured summary is stored with the result so the job can later be
+    rendered in any format without parsing or summarizing it again.
+    """
+    payload = job["payload"]
+    raw_summary = pipeline.run(job["kind"], payload, on_stage=set_stage)
+    formatter = OutputFormatter(format_type=payload.get("format", "markdown"))
+    structured = formatter.structure(raw_summary, {"source": payload.get("url") or payload.get("filename")})
+    return {"summary": formatter.render(structured), "raw_summary": raw_summary, "structured": structured}
+
+worker_pool = JobWorkerPool(job_queue, run_job, num_workers=JOB_WORKERS)
 
 # Request models
 class TranscriptRequest(BaseModel):
@@ -46,23 +132,168 @@ class YouTubeRequest(BaseModel):
 class TranscriptResponse(BaseModel):
     summary: str
 
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    stage: Optional[str] = None
+    summary: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
 @app.post("/api/summarize/text", response_model=TranscriptResponse)
 async def summarize_text(request: TranscriptRequest):
     """Summarize a text transcript."""
+    check_format(request.format)
     try:
-        # Preprocess the transcript
-        cleaned_text = preprocessor.clean_transcript(request.text)
+        # Preprocess the transcript off the event loop
+        cleaned_text = await asyncio.to_thread(preprocessor.clean_transcript, request.text)
         
         # Create the prompt
         template = PromptTemplates.chapter_summary_template()
-        prompt = few_shot_learner.create_prompt(cleaned_text, template=template)
+        prompt = await asyncio.to_thread(few_shot_learner.create_prompt, cleaned_text,
+                                         template=template, max_tokens=1000)
         
         # Generate the summary
-        summary = gpt_interface.generate_completion(prompt)
+        summary = await gpt_interface.generate_completion(prompt, max_tokens=1000)
         
         # Format the output
-        formatted_summary = output_formatter.format_summary(summary, {"source": "Text transcript"})
+        formatter = OutputFormatter(format_type=request.format)
+        formatted_summary = formatter.format_summary(summary, {"source": "Text transcript"})
         
         return {"summary": formatted_summary}
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/summarize/text/stream")
+async def summarize_text_stream(request: TranscriptRequest):
+    """Summarize a text transcript, streaming the summary as Server-Sent Events.
+
+    Each ``delta`` event carries the next piece of raw summary text. A final
+    ``done`` event carries the formatted summary, or an ``error`` event the
+    failure if generation breaks after the stream has started.
+    """
+    check_format(request.format)
+    try:
+        cleaned_text = await asyncio.to_thread(preprocessor.clean_transcript, request.text)
+        template = PromptTemplates.chapter_summary_template()
+        prompt = await asyncio.to_thread(few_shot_learner.create_prompt, cleaned_text,
+                                         template=template, max_tokens=1000)
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    async def events():
+        parts = []
+        try:
+            async for delta in gpt_interface.stream_completion(prompt, max_tokens=1000):
+                parts.append(delta)
+                yield sse_event("delta", {"text": delta})
+            formatter = OutputFormatter(format_type=request.format)
+            summary = formatter.format_summary("".join(parts), {"source": "Text transcript"})
+            yield sse_event("done", {"summary": summary})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def check_format(format_type):
+    """Reject an unknown output format before any work is done."""
+    if format_type not in FORMATS:
+        raise HTTPException(status_code=422, detail=f"Unknown format {format_type!r}; expected one of "
+                                                    f"{', '.join(FORMATS)}")
+
+def sse_event(event, data):
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/jobs/youtube", response_model=JobResponse, status_code=202)
+async def submit_youtube_job(request: YouTubeRequest):
+    """Queue a YouTube video for summarization and return its job ID."""
+    check_format(request.format)
+    try:
+        youtube_video_id(request.url)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    job_id = await asyncio.to_thread(job_queue.submit, "youtube", {"url": request.url, "format": request.format})
+    worker_pool.notify()
+    return {"job_id": job_id, "status": "queued"}
+
+@app.post("/api/jobs/upload", response_model=JobResponse, status_code=202)
+async def submit_upload_job(file: UploadFile = File(...), format: str = Form("markdown")):
+    """Store an uploaded video, queue it for summarization and return its job ID."""
+    check_format(format)
+    path = await asyncio.to_thread(save_upload, file)
+    job_id = await asyncio.to_thread(job_queue.submit, "upload",
+                                     {"path": path, "filename": file.filename, "format": format})
+    worker_pool.notify()
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/api/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """Return the status of a job, with its summary once it is done."""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "summary": job["result"]["summary"] if job["result"] else None,
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+
+@app.get("/api/jobs/{job_id}/summary")
+async def get_job_summary(job_id: str, format: str = Query("markdown")):
+    """Return a finished job's summary in any format, rendered from its stored structured summary.
+
+    No model call is made; the output is streamed as it renders.
+    """
+    check_format(format)
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job["result"]:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, not done")
+    formatter = OutputFormatter(format_type=format)
+    structured = job["result"].get("structured")
+    if structured is None:
+        # Jobs finished before structured summaries were stored
+        structured = formatter.structure(job["result"]["raw_summary"],
+                                         {"source": job["payload"].get("url") or job["payload"].get("filename")})
+    return StreamingResponse(formatter.render_stream(structured), media_type=MEDIA_TYPES[format])
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Expose stage timings, token counts, cost, retries and cache hits for Prometheus."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+def save_upload(file):
+    """Copy an upload into the upload directory under its content hash and return the path.
+
+    Identical uploads map to the same file, so their pipeline stages are shared.
+    """
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, delete=False) as tmp:
+        while chunk := file.file.read(1024 * 1024):
+            digest.update(chunk)
+            tmp.write(chunk)
+    extension = os.path.splitext(file.filename or "")[1] or ".mp4"
+    path = os.path.join(UPLOAD_DIR, digest.hexdigest() + extension)
+    if os.path.exists(path):
+        os.remove(tmp.name)
+    else:
+        shutil.move(tmp.name, path)
+    return path
@@ -0,0 +1,158 @@
+import os
+import subprocess
+import tempfile
+import wave
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+class AudioChunker:
+    def __init__(self, window_seconds=300, overlap_seconds=5, search_seconds=15, frame_ms=30):
+        """Initialize the chunker with window, overlap and silence-search sizes.
+
+        Cut points are placed near every ``window_seconds`` mark, at the quietest
+        frame within ``search_seconds`` of it. Each chunk extends
+        ``overlap_seconds`` past its cut points so words at the boundary are
+        heard in full by at least one chunk.
+        """
+        if overlap_seconds * 2 >= window_seconds:
+            raise ValueError("overlap_seconds must be less than half of window_seconds")
+        self.window_seconds = window_seconds
+        self.overlap_seconds = overlap_seconds
+        self.search_seconds = min(search_seconds, window_seconds / 2 - overlap_seconds)
+        self.frame_ms = frame_ms
+
+    def split(self, audio):
+        """Split samples into overlapping chunks cut at silence boundaries.
+
+        Returns a list of dicts with the chunk ``samples``, its ``offset`` and
+        ``duration`` in seconds, and the ``keep_start``/``keep_end`` interval (in
+        global seconds) whose segments belong to this chunk when merging.
+        """
+        return list(self.split_stream([audio]))
+
+    def split_stream(self, blocks):
+        """Yield the same chunks as split() from an iterable of sample blocks.
+
+        A chunk is yielded as soon as the samples after its cut point have
+        arrived, and samples before the start of the next chunk are dropped, so
+        only about one window of audio is held at a time. Blocks can come
+        straight from ``VideoCollector.stream_audio``.
+        """
+        window = int(self.window_seconds * SAMPLE_RATE)
+        overlap = int(self.overlap_seconds * SAMPLE_RATE)
+        radius = int(self.search_seconds * SAMPLE_RATE)
+
+        buffer = np.zeros(0, dtype=np.float32)
+        base = 0  # Global index of buffer[0]
+        previous_cut = 0
+        position = window
+        index = 0
+        blocks = iter(blocks)
+        finished = False
+        while not finished:
+            block = next(blocks, None)
+            if block is None:
+                finished = True
+            elif len(block):
+                buffer = np.concatenate([buffer, np.asarray(block, dtype=np.float32)])
+            end = base + len(buffer)
+
+            # Cut once the search range and overlap past it have arrived, so the
+            # cut is where split() would put it with the whole recording in hand
+            while position < end - window // 2 and (finished or end >= position + radius + overlap):
+                cut = base + self._quietest_point(buffer, position - base)
+                yield self._chunk(buffer, base, index, previous_cut, cut, min(end, cut + overlap), last=False)
+                index += 1
+                start = max(0, cut - overlap)
+                buffer = buffer[start - base:]
+                base = start
+                previous_cut = cut
+                position = cut + window
+
+        yield self._chunk(buffer, base, index, previous_cut, base + len(buffer), base + len(buffer), last=True)
+
+    def _chunk(self, buffer, base, index, start_cut, end_cut, stop, last):
+        """Return the chunk between two cut points, extended by the overlap."""
+        start = max(0, start_cut - int(self.overlap_seconds * SAMPLE_RATE))
+        samples = buffer[start - base:stop - base]
+        return {
+            "samples": samples,
+            "offset": start / SAMPLE_RATE,
+            "duration": len(samples) / SAMPLE_RATE,
+            "keep_start": start_cut / SAMPLE_RATE if index > 0 else float("-inf"),
+            "keep_end": float("inf") if last else end_cut / SAMPLE_RATE
+        }
+
+    @staticmethod
+    def merge(chunks, results):
+        """Merge per-chunk transcription results into one transcript.
+
+        Segment timestamps are shifted by the chunk offset, and a segment is only
+        kept by the chunk whose keep interval contains its midpoint, which drops
+        the duplicates transcribed in the overlap.
+        """
+        segments = []
+        language = None
+        for chunk, result in zip(chunks, results):
+            language = language or result.get("language")
+            chunk_segments = result.get("segments") or []
+            if not chunk_segments and result.get("text"):
+                # Backends without timestamps return a single untimed segment
+                chunk_segments = [{"start": 0.0, "end": chunk["duration"],
+                                   "text": result["text"]}]
+            for segment in chunk_segments:
+                start = segment["start"] + chunk["offset"]
+                end = segment["end"] + chunk["offset"]
+                midpoint = (start + end) / 2
+                if chunk["keep_start"] <= midpoint < chunk["keep_end"]:
+                    segments.append({"start": start, "end": end, "text": segment["text"]})
+
+        text = " ".join(segment["text"].strip() for segment in segments if segment["text"].strip())
+        return {"text": text, "language": language, "segments": segments}
+
+    @staticmethod
+    def write_wav(samples, path=None):
+        """Write float samples to a 16-bit PCM WAV file and return its path."""
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=".wav")
+            os.close(fd)
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+        with wave.open(path, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(SAMPLE_RATE)
+            wav_file.writeframes(pcm.tobytes())
+        return path
+
+    @staticmethod
+    def encode_ogg(samples, ffmpeg="ffmpeg", bitrate="32k"):
+        """Encode float samples as Ogg/Opus in memory through an ffmpeg pipe and return the bytes.
+
+        Speech at 32 kbit/s is about an eighth of the size of 16 kHz PCM WAV,
+        so even long recordings stay far below the transcription API's upload
+        limit.
+        """
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+        process = subprocess.run(
+            [ffmpeg, "-nostdin", "-loglevel", "error", "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1",
+             "-i", "-", "-c:a", "libopus", "-b:a", bitrate, "-application", "voip", "-f", "ogg", "-"],
+            input=pcm.tobytes(), capture_output=True, check=False
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to encode audio: {process.stderr.decode(errors='replace')[-500:]}")
+        return process.stdout
+
+    def _quietest_point(self, audio, position):
+        """Return the sample index of the lowest-energy frame near a position."""
+        frame = max(1, int(self.frame_ms * SAMPLE_RATE / 1000))
+        radius = int(self.search_seconds * SAMPLE_RATE)
+        lo = max(0, position - radius)
+        hi = min(len(audio), position + radius)
+        n_frames = (hi - lo) // frame
+        if n_frames == 0:
+            return position
+
+        frames = audio[lo:lo + n_frames * frame].reshape(n_frames, frame)
+        energy = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+        return lo + int(np.argmin(energy)) * frame + frame // 2
@@ -0,0 +1,328 @@
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from app.core.monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class MediaStore:
+    def __init__(self, root="./data/media", max_bytes=20 * 1024 ** 3, segment_bytes=8 * 1024 * 1024,
+                 max_retries=5):
+        """Initialize a content-addressed store for downloaded media and extracted audio.
+
+        Entries are looked up by key, such as ``youtube:<video id>:audio``, and
+        stored once per content hash under ``root/objects``, so the same media
+        is never downloaded or kept twice. Downloads go to ``.part`` files in
+        ``segment_bytes`` HTTP range requests and resume where they stopped after
+        a failure or restart; a file lock makes concurrent fetches of one key,
+        from threads or processes, share a single download. When the store,
+        counting downloads still in progress, grows past ``max_bytes`` the
+        least recently used entries are deleted, except those with outstanding
+        references from acquire(). References are recorded per process, and
+        those of processes that have exited on this host are dropped, so a
+        crashed worker cannot pin entries forever and a starting one never
+        clears references that live workers hold.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.max_retries = max_retries
+        self.db_path = os.path.join(root, "media.sqlite3")
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "partial"), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS media ("
+                "key TEXT PRIMARY KEY, "
+                "path TEXT, "
+                "content_hash TEXT, "
+                "size INTEGER NOT NULL DEFAULT 0, "
+                "accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS refs ("
+                "key TEXT NOT NULL, "
+                "host TEXT NOT NULL, "
+                "pid INTEGER NOT NULL, "
+                "count INTEGER NOT NULL, "
+                "PRIMARY KEY (key, host, pid))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_media_accessed ON media (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_media_hash ON media (content_hash)")
+
+    def get(self, key):
+        """Return the stored path for a key, or None if it is not stored."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT path FROM media WHERE key = ? AND path IS NOT NULL",
+                               (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row[0]):
+                conn.execute("UPDATE media SET path = NULL, content_hash = NULL, size = 0 WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE media SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def fetch(self, key, url, extension=""):
+        """Return the stored path for a key, downloading it from ``url`` if needed.
+
+        ``url`` may be a callable returning the URL, so resolving it (which can
+        take a network round trip) is skipped when the media is already stored.
+        """
+        path = self.get(key)
+        metrics.record_cache("media", path is not None)
+        if path is not None:
+            return path
+
+        part_path = os.path.join(self.root, "partial", hashlib.sha256(key.encode()).hexdigest() + ".part")
+        with self._file_lock(part_path + ".lock"):
+            # Another thread or process may have finished the download while we waited
+            path = self.get(key)
+            if path is not None:
+                return path
+            self._download(url() if callable(url) else url, part_path)
+            return self.add(key, part_path, extension=extension)
+
+    def add(self, key, file_path, extension=None):
+        """Move a file into the store under a key and return its stored path.
+
+        A file whose content is already stored is discarded in favor of the
+        existing copy.
+        """
+        if extension is None:
+            extension = os.path.splitext(file_path)[1]
+        content_hash = _file_hash(file_path)
+        path = self._stored_path(content_hash)
+        if path is not None:
+            os.remove(file_path)
+        else:
+            directory = os.path.join(self.root, "objects", content_hash[:2])
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, content_hash + extension)
+            shutil.move(file_path, path)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO media (key, path, content_hash, size, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET path = excluded.path, content_hash = excluded.content_hash, "
+                "size = excluded.size, accessed_at = excluded.accessed_at",
+                (key, path, content_hash, os.path.getsize(path), time.time())
+            )
+        self.evict(keep=key)
+        return path
+
+    def _stored_path(self, content_hash):
+        """Return the existing file holding some content, or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT path FROM media WHERE content_hash = ? AND path IS NOT NULL LIMIT 1",
+                               (content_hash,)).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            return None
+        return row[0]
+
+    def content_hash(self, key):
+        """Return the content hash of a stored key, or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT content_hash FROM media WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def acquire(self, key):
+        """Add a reference from this process to a key, which may not be stored yet, protecting it from eviction."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO refs (key, host, pid, count) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT(key, host, pid) DO UPDATE SET count = count + 1",
+                (key, socket.gethostname(), os.getpid())
+            )
+
+    def release(self, key):
+        """Drop a reference added by acquire() in this process."""
+        with self._connect() as conn:
+            params = (key, socket.gethostname(), os.getpid())
+            conn.execute("UPDATE refs SET count = count - 1 WHERE key = ? AND host = ? AND pid = ?", params)
+            conn.execute("DELETE FROM refs WHERE key = ? AND host = ? AND pid = ? AND count <= 0", params)
+
+    @contextmanager
+    def reference(self, key):
+        """Hold a reference to a key for the duration of a block."""
+        self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def prune_references(self):
+        """Drop references held by processes on this host that have exited; return how many processes had them.
+
+        evict() does this itself before deciding what it may delete.
+        """
+        with self._connect() as conn:
+            return self._prune_references(conn)
+
+    def evict(self, keep=None):
+        """Delete least recently used, unreferenced entries until the store fits its quota.
+
+        The ``keep`` key is never evicted, so a file just added survives even
+        when referenced entries fill the quota.
+        """
+        with self._connect() as conn:
+            total = self._total_bytes(conn)
+            if total <= self.max_bytes:
+                return
+            self._prune_references(conn)
+            rows = conn.execute(
+                "SELECT key, path, size FROM media WHERE path IS NOT NULL AND key IS NOT ? "
+                "AND key NOT IN (SELECT key FROM refs) ORDER BY accessed_at",
+                (keep,)
+            ).fetchall()
+            for key, path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM media WHERE key = ?", (key,))
+                # Files are shared by keys with the same content
+                shared = conn.execute("SELECT 1 FROM media WHERE path = ? LIMIT 1", (path,)).fetchone()
+                if shared is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    total -= size
+
+    def stats(self):
+        """Return the number of entries and bytes stored."""
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM media WHERE path IS NOT NULL").fetchone()[0]
+            return {"entries": entries, "bytes": self._total_bytes(conn), "partial_bytes": self._partial_bytes(),
+                    "max_bytes": self.max_bytes}
+
+    def _download(self, url, part_path):
+        """Download a URL into a .part file in range requests, resuming from its current size."""
+        import httpx
+
+        total = None
+        failures = 0
+        with httpx.Client(follow_redirects=True, timeout=httpx.Timeout(60.0, connect=10.0)) as client:
+            while True:
+                offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                if total is not None and offset >= total:
+                    return
+                headers = {"Range": f"bytes={offset}-{offset + self.segment_bytes - 1}"}
+                try:
+                    with client.stream("GET", url, headers=headers) as response:
+                        if response.status_code == 416:
+                            # The range starts at the end: the file is complete
+                            return
+                        response.raise_for_status()
+                        if response.status_code == 206:
+                            total = _content_range_total(response.headers.get("content-range"), total)
+                            mode = "ab"
+                        else:
+                            # The server ignored the range and sends the whole file
+                            total = None
+                            mode = "wb"
+                        written = 0
+                        with open(part_path, mode) as f:
+                            for chunk in response.iter_bytes(1024 * 1024):
+                                f.write(chunk)
+                                written += len(chunk)
+                    failures = 0
+                    # The growing download counts toward the quota, so make room as it arrives
+                    self.evict()
+                    # Without a total size, a short segment marks the end of the file
+                    if mode == "wb" or (total is None and written < self.segment_bytes):
+                        return
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                        raise
+                    failures += 1
+                    if failures >= self.max_retries:
+                        raise
+                    logger.warning(f"Download interrupted at {offset} bytes, resuming: {e}")
+                    time.sleep(min(2 ** failures, 30))
+
+    @staticmethod
+    def _prune_references(conn):
+        """Delete references of exited processes on this host."""
+        host = socket.gethostname()
+        pids = [row[0] for row in conn.execute("SELECT DISTINCT pid FROM refs WHERE host = ?", (host,))]
+        dead = [pid for pid in pids if not _process_alive(pid)]
+        for pid in dead:
+            conn.execute("DELETE FROM refs WHERE host = ? AND pid = ?", (host, pid))
+        return len(dead)
+
+    def _total_bytes(self, conn):
+        """Return the bytes used by stored files, counting shared files once, and by partial downloads."""
+        row = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT path, size FROM media WHERE path IS NOT NULL)"
+        ).fetchone()
+        return row[0] + self._partial_bytes()
+
+    def _partial_bytes(self):
+        """Return the bytes written so far by downloads in progress or interrupted."""
+        total = 0
+        with os.scandir(os.path.join(self.root, "partial")) as entries:
+            for entry in entries:
+                if entry.name.endswith(".part"):
+                    try:
+                        total += entry.stat().st_size
+                    except FileNotFoundError:
+                        # Finished and moved into the store meanwhile
+                        pass
+        return total
+
+    @staticmethod
+    @contextmanager
+    def _file_lock(lock_path):
+        """Hold an exclusive lock on a file, shared by threads and processes."""
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and always closes."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+def _file_hash(path, block_size=1024 * 1024):
+    """Return the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _process_alive(pid):
+    """Return whether a process with this ID is running on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # It exists but belongs to another user
+        return True
+    return True
+
+def _content_range_total(header, default=None):
+    """Return the total size from a ``Content-Range: bytes a-b/total`` header."""
+    if header and "/" in header:
+        total = header.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+    return default
@@ -1,39 +1,252 @@
 import os
-import whisper
-from openai import OpenAI
+import hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.core.monitoring.metrics import metrics
+
+# whisper (and torch), openai and numpy are imported on the code paths that
+# need them, so importing this module stays cheap for text-only runs.
+
+# Whisper model preloaded in each chunked-transcription worker process
+_worker_model = None
+
+def _init_worker(model_name, threads):
+    """Load the Whisper model once per worker process."""
+    global _worker_model
+    import torch
+    import whisper
+    torch.set_num_threads(threads)
+    _worker_model = whisper.load_model(model_name)
+
+def _transcribe_chunk_local(samples, language):
+    """Transcribe one chunk of samples with the worker's preloaded model."""
+    result = _worker_model.transcribe(samples, language=language)
+    return {
+        "text": result["text"],
+        "language": result.get("language", language),
+        "segments": [
+            {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+            for segment in result.get("segments", [])
+        ]
+    }
+
+def _is_path(audio):
+    """Return whether audio is a file path rather than decoded samples."""
+    return isinstance(audio, (str, os.PathLike))
 
 class Transcriber:
-    def __init__(self, model_name="base", use_openai=False, api_key=None):
-        """Initialize the transcriber with model specifications."""
+    def __init__(self, model_name="base", use_openai=False, api_key=None, language=None, cache=None,
+                 chunked=False, max_workers=None, chunker=None):
+        """Initialize the transcriber with model specifications and an optional transcript cache.
+
+        With ``chunked=True`` audio is split at silence into overlapping windows
+        that are transcribed concurrently, on a process pool with the model
+        preloaded per worker for local Whisper or on a thread pool for the API.
+        """
         self.use_openai = use_openai
+        self.language = language
+        self.cache = cache
+        self.chunked = chunked
+        self.max_workers = max_workers or (8 if use_openai else max(1, (os.cpu_count() or 1) // 2))
+        self.chunker = chunker
+        self._executor = None
         if use_openai:
+            from openai import OpenAI
+            self.model_name = "whisper-1"
             self.client = OpenAI(api_key=api_key)
         else:
-            self.model = whisper.load_model(model_name)
-        
+            self.model_name = model_name
+            # The model is loaded on first use; chunked mode loads it in the worker processes
+            self.model = None
+
     def transcribe_local(self, audio_path):
         """Transcribe audio using local Whisper model."""
+        return self._transcribe_local_result(audio_path)["text"]
+
+    def transcribe_openai(self, audio_path):
+        """Transcribe audio using OpenAI's API."""
+        return self._transcribe_openai_result(audio_path)["text"]
+
+    def transcribe(self, audio):
+        """Transcribe audio using the configured method."""
+        return self.transcribe_detailed(audio)["text"]
+
+    @metrics.timed("transcribe")
+    def transcribe_detailed(self, audio):
+        """Transcribe audio and return the text with timestamped segments.
+
+        ``audio`` is a file path or 16 kHz mono float32 samples, such as the
+        output of ``VideoCollector.decode_audio``. Results are looked up in the
+        transcript cache by audio fingerprint, model and language before any
+        transcription is run.
+        """
+        if self.cache is None:
+            return self._transcribe_result(audio)
+
+        if _is_path(audio):
+            audio_hash = self.cache.fingerprint(audio)
+        else:
+            audio_hash = self.cache.fingerprint_samples(audio)
+        key = self.cache.make_key(audio_hash, self.model_name, self.language)
+        result = self.cache.get(key)
+        metrics.record_cache("transcript", result is not None)
+        if result is None:
+            result = self._transcribe_result(audio)
+            self.cache.set(key, result, audio_hash, self.model_name, self.language)
+        return result
+
+    @metrics.timed("transcribe")
+    def transcribe_stream(self, blocks, source_id=None):
+        """Transcribe a stream of 16 kHz sample blocks, such as ``VideoCollector.stream_audio``.
+
+        The stream is cut into chunks as it is decoded and each chunk is
+        transcribed as soon as it is complete, with at most twice
+        ``max_workers`` chunks held at a time, so the recording is never
+        decoded in full or written to disk. The stream cannot be fingerprinted
+        before it is read, so results are cached under ``source_id`` (such as a
+        video ID) when one is given. Returns the result dict of
+        transcribe_detailed().
+        """
+        key = None
+        if self.cache is not None and source_id is not None:
+            audio_hash = hashlib.sha256(f"source:{source_id}".encode()).hexdigest()
+            key = self.cache.make_key(audio_hash, self.model_name, self.language)
+            result = self.cache.get(key)
+            metrics.record_cache("transcript", result is not None)
+            if result is not None:
+                return result
+
+        result = self._transcribe_chunks(self._get_chunker().split_stream(blocks))
+
+        if key is not None:
+            self.cache.set(key, result, audio_hash, self.model_name, self.language)
+        return result
+
+    def close(self):
+        """Shut down the chunked-transcription worker pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _transcribe_result(self, audio_path):
+        """Run the configured transcription backend."""
+        if self.chunked:
+            return self._transcribe_chunked_result(audio_path)
+        if self.use_openai:
+            return self._transcribe_openai_result(audio_path)
+        else:
+            return self._transcribe_local_result(audio_path)
+
+    def _transcribe_chunked_result(self, audio):
+        """Transcribe overlapping chunks concurrently and stitch the results.
+
+        Files are decoded through an ffmpeg pipe as they are chunked, so the API
+        path does not need Whisper installed.
+        """
+        if _is_path(audio):
+            from app.core.data_collection.video_collector import stream_audio
+            blocks = stream_audio(audio)
+        else:
+            blocks = [audio]
+        return self._transcribe_chunks(self._get_chunker().split_stream(blocks))
+
+    def _transcribe_chunks(self, chunks):
+        """Transcribe chunks as they arrive, holding at most twice ``max_workers`` at a time."""
+        chunker = self._get_chunker()
+        executor = self._get_executor()
+        timings = []
+        pending = deque()
+        results = []
+        for chunk in chunks:
+            # Empty audio still ends in one chunk, and there is nothing to send for it
+            if len(chunk["samples"]) == 0:
+                continue
+            pending.append(self._submit_chunk(executor, chunk))
+            # Only the timing of a chunk is needed to merge its result
+            timings.append({name: value for name, value in chunk.items() if name != "samples"})
+            if len(pending) >= 2 * self.max_workers:
+                results.append(pending.popleft().result())
+        results.extend(future.result() for future in pending)
+        return chunker.merge(timings, results)
+
+    def _submit_chunk(self, executor, chunk):
+        """Start transcribing one chunk on the worker pool."""
+        if self.use_openai:
+            return executor.submit(self._transcribe_openai_result, chunk["samples"])
+        return executor.submit(_transcribe_chunk_local, chunk["samples"], self.language)
+
+    def _get_chunker(self):
+        """Return the audio chunker, creating the default one on first use."""
+        if self.chunker is None:
+            from app.core.data_collection.audio_chunker import AudioChunker
+            self.chunker = AudioChunker()
+        return self.chunker
+
+    def _get_executor(self):
+        """Return the worker pool for chunked transcription, starting it on first use."""
+        if self._executor is None:
+            if self.use_openai:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            else:
+                threads = max(1, (os.cpu_count() or 1) // self.max_workers)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, threads)
+                )
+        return self._executor
+
+    def _transcribe_local_result(self, audio_path):
+        """Transcribe audio with the local Whisper model, keeping segment timestamps."""
         if not self.use_openai:
-            result = self.model.transcribe(audio_path)
-            return result["text"]
+            if self.model is None:
+                import whisper
+                self.model = whisper.load_model(self.model_name)
+            result = self.model.transcribe(audio_path, language=self.language)
+            return {
+                "text": result["text"],
+                "language": result.get("language", self.language),
+                "segments": [
+                    {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+                    for segment in result.get("segments", [])
+                ]
+            }
         else:
             raise ValueError("Method called with OpenAI configuration. Use transcribe_openai instead.")
-    
-    def transcribe_openai(self, audio_path):
-        """Transcribe audio using OpenAI's API."""
+
+    def _transcribe_openai_result(self, audio_path):
+        """Transcribe audio with OpenAI's API, keeping segment timestamps."""
         if self.use_openai:
-            with open(audio_path, "rb") as audio_file:
+            options = {"language": self.language} if self.language else {}
+            if _is_path(audio_path):
+                with open(audio_path, "rb") as audio_file:
+                    transcript = self.client.audio.transcriptions.create(
+                        model=self.model_name,
+                        file=audio_file,
+                        response_format="verbose_json",
+                        **options
+                    )
+            else:
+                # Samples are uploaded as Ogg/Opus encoded in memory; 16 kHz WAV
+                # would pass the 25 MB upload limit after about 13 minutes
+                from app.core.data_collection.audio_chunker import AudioChunker
                 transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file
+                    model=self.model_name,
+                    file=("audio.ogg", AudioChunker.encode_ogg(audio_path)),
+                    response_format="verbose_json",
+                    **options
                 )
-            return transcript.text
+            metrics.record_transcription(self.model_name, getattr(transcript, "duration", None))
+            return {
+                "text": transcript.text,
+                "language": getattr(transcript, "language", None) or self.language,
+                "segments": [
+                    {"start": segment.start, "end": segment.end, "text": segment.text}
+                    for segment in (getattr(transcript, "segments", None) or [])
+                ]
+            }
         else:
             raise ValueError("Method called with local configuration. Use transcribe_local instead.")
-    
-    def transcribe(self, audio_path):
-        """Transcribe audio using the configured method."""
-        if self.use_openai:
-            return self.transcribe_openai(audio_path)
-        else:
-            return self.transcribe_local(audio_path)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+class TranscriptCache:
+    def __init__(self, cache_path="./data/cache/transcripts.sqlite3", max_entries=500):
+        """Initialize a persistent transcript store.
+
+        Transcripts are keyed by a content hash of the audio plus the model name
+        and language, so the same recording is only ever transcribed once per
+        configuration. The store lives in SQLite so CLI runs and API workers can
+        share it, and it is bounded to ``max_entries`` with LRU eviction.
+        """
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "key TEXT PRIMARY KEY, "
+                "audio_hash TEXT NOT NULL, "
+                "model TEXT NOT NULL, "
+                "language TEXT, "
+                "result TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transcripts_accessed "
+                "ON transcripts (accessed_at)"
+            )
+
+    @staticmethod
+    def fingerprint(audio_path, block_size=1024 * 1024):
+        """Return the SHA-256 of an audio file's contents."""
+        digest = hashlib.sha256()
+        with open(audio_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def fingerprint_samples(samples):
+        """Return the SHA-256 of decoded audio samples."""
+        return hashlib.sha256(samples.tobytes()).hexdigest()
+
+    @staticmethod
+    def make_key(audio_hash, model, language=None):
+        """Return the store key for an audio fingerprint and transcription settings."""
+        payload = f"{audio_hash}\0{model}\0{language or ''}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached transcription result for a key, or None on a miss."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result FROM transcripts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE transcripts SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                )
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, result, audio_hash, model, language=None):
+        """Store a transcription result and evict the least recently used entries."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO transcripts "
+                "(key, audio_hash, model, language, result, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, audio_hash, model, language, json.dumps(result), now, now)
+            )
+            conn.execute(
+                "DELETE FROM transcripts WHERE key IN ("
+                "SELECT key FROM transcripts ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        """Return hit/miss counters and the number of stored transcripts."""
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries
+        }
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that waits for concurrent writers instead of failing."""
+        conn = sqlite3.connect(self.cache_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
@@ -1,18 +1,58 @@
 import os
-import requests
-import youtube_dl
-from pytube import YouTube
-from moviepy.editor import VideoFileClip
+import re
+import hashlib
+import logging
+import subprocess
+import tempfile
+from contextlib import nullcontext
+
+from app.core.monitoring.metrics import metrics
+
+# pytube, moviepy and numpy are imported inside the methods that use them, so
+# the collector can be constructed without paying for their import time.
+
+logger = logging.getLogger(__name__)
+
+# Whisper works on 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+# Files the transcriber can take directly, without extracting an audio track
+AUDIO_EXTENSIONS = {".m4a", ".mp3", ".wav", ".webm", ".ogg", ".opus", ".flac"}
+
+YOUTUBE_ID_PATTERN = re.compile(r"(?:v=|youtu\.be/|shorts/|embed/|live/)([\w-]{11})")
+
+def youtube_video_id(url):
+    """Return the 11-character video ID of a YouTube URL."""
+    match = YOUTUBE_ID_PATTERN.search(url)
+    if match is None:
+        raise ValueError(f"Not a YouTube video URL: {url}")
+    return match.group(1)
 
 class VideoCollector:
-    def __init__(self, output_dir="./data/raw"):
-        """Initialize the video collector with output directory."""
+    def __init__(self, output_dir="./data/raw", ffmpeg="ffmpeg", media_store=None):
+        """Initialize the video collector with output directory and ffmpeg binary.
+
+        With a MediaStore, downloads and extracted audio are kept in the store
+        under the video ID or source file instead of in ``output_dir``: they are
+        fetched once, resumed after interruptions and evicted under its quota.
+        ``output_filename`` arguments are then ignored.
+        """
         self.output_dir = output_dir
+        self.ffmpeg = ffmpeg
+        self.media_store = media_store
         os.makedirs(output_dir, exist_ok=True)
         
+    @metrics.timed("download")
     def download_from_youtube(self, url, output_filename=None):
         """Download a video from YouTube."""
         try:
+            if self.media_store is not None:
+                return self.media_store.fetch(
+                    f"youtube:{youtube_video_id(url)}:video",
+                    lambda: self._best_progressive_stream(url).url,
+                    extension=".mp4"
+                )
+            from pytube import YouTube
             yt = YouTube(url)
             if output_filename is None:
                 output_filename = f"{yt.title.replace(' ', '_')}.mp4"
@@ -21,12 +61,66 @@ class VideoCollector:
             yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first().download(output_path=self.output_dir, filename=output_filename)
             return output_path
         except Exception as e:
-            print(f"Error downloading from YouTube: {e}")
+            logger.error(f"Error downloading from YouTube: {e}")
             return None
             
+    @metrics.timed("download")
+    def download_audio_from_youtube(self, url, output_filename=None):
+        """Download only the best audio stream of a YouTube video.
+
+        This is typically a few percent of the size of a progressive video
+        download. The file keeps its original container (m4a or webm), which
+        the transcriber reads directly; the extension of ``output_filename`` is
+        replaced to match it.
+        """
+        try:
+            if self.media_store is not None:
+                # The stream is only resolved when the audio is not stored yet
+                key = f"youtube:{youtube_video_id(url)}:audio"
+                path = self.media_store.get(key)
+                if path is None:
+                    stream = self._best_audio_stream(url)
+                    extension = ".m4a" if stream.subtype == "mp4" else f".{stream.subtype}"
+                    path = self.media_store.fetch(key, stream.url, extension=extension)
+                return path
+
+            stream = self._best_audio_stream(url)
+            extension = ".m4a" if stream.subtype == "mp4" else f".{stream.subtype}"
+            if output_filename is None:
+                output_filename = f"{stream.title.replace(' ', '_')}{extension}"
+            else:
+                output_filename = os.path.splitext(output_filename)[0] + extension
+            output_path = os.path.join(self.output_dir, output_filename)
+
+            stream.download(output_path=self.output_dir, filename=output_filename)
+            return output_path
+        except Exception as e:
+            logger.error(f"Error downloading audio from YouTube: {e}")
+            return None
+
+    def audio_stream_url(self, url):
+        """Return the URL of the best audio stream of a YouTube video, for decoding without a download."""
+        return self._best_audio_stream(url).url
+
+    @metrics.timed("extract_audio")
     def extract_audio(self, video_path, output_filename=None):
-        """Extract audio from a video file."""
+        """Extract audio from a video file.
+
+        With a media store, hold ``media_reference(audio_key(video_path))``
+        until the audio is no longer needed, so it is not evicted in between.
+        """
         try:
+            if self.media_store is not None:
+                key = self.audio_key(video_path)
+                path = self.media_store.get(key)
+                if path is None:
+                    from moviepy.editor import VideoFileClip
+                    temp_path = os.path.join(self.output_dir, f"{hashlib.sha256(key.encode()).hexdigest()[:16]}.mp3")
+                    video = VideoFileClip(video_path)
+                    video.audio.write_audiofile(temp_path)
+                    path = self.media_store.add(key, temp_path)
+                return path
+            from moviepy.editor import VideoFileClip
             if output_filename is None:
                 output_filename = os.path.splitext(os.path.basename(video_path))[0] + ".mp3"
             output_path = os.path.join(self.output_dir, output_filename)
@@ -35,5 +129,101 @@ class VideoCollector:
             video.audio.write_audiofile(output_path)
             return output_path
         except Exception as e:
-            print(f"Error extracting audio: {e}")
+            logger.error(f"Error extracting audio: {e}")
             return None
+
+    @metrics.timed("extract_audio")
+    def decode_audio(self, source, sample_rate=SAMPLE_RATE):
+        """Decode the audio of a file or URL to mono float32 samples through an ffmpeg pipe.
+
+        Only the audio track is decoded and nothing is written to disk, so a
+        video never goes through an intermediate MP3. The result can be passed
+        straight to ``Transcriber.transcribe``.
+        """
+        import numpy as np
+        process = subprocess.run(_decode_command(self.ffmpeg, source, sample_rate),
+                                 capture_output=True, check=False)
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {source}: {process.stderr.decode(errors='replace')[-500:]}")
+        pcm = np.frombuffer(process.stdout, dtype=np.int16, count=len(process.stdout) // 2)
+        return pcm.astype(np.float32) / 32768.0
+
+    def stream_audio(self, source, block_seconds=30, sample_rate=SAMPLE_RATE):
+        """Yield mono float32 sample blocks of about ``block_seconds`` as ffmpeg decodes them.
+
+        The blocks can be passed to ``Transcriber.transcribe_stream``.
+        """
+        return stream_audio(source, self.ffmpeg, block_seconds, sample_rate)
+
+    def audio_key(self, video_path):
+        """Return the media store key of the audio extracted from a video file."""
+        return f"audio:{self._source_key(video_path)}"
+
+    def media_reference(self, key):
+        """Return a context that protects a media store key from eviction, or does nothing without a store or key."""
+        if self.media_store is None or key is None:
+            return nullcontext()
+        return self.media_store.reference(key)
+
+    def _source_key(self, path):
+        """Identify a source file by its content hash if it is in the media store, else by path and mtime."""
+        stat = os.stat(path)
+        content_hash = os.path.splitext(os.path.basename(path))[0]
+        if os.path.abspath(path).startswith(os.path.abspath(self.media_store.root)) and len(content_hash) == 64:
+            return content_hash
+        identity = f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    @staticmethod
+    def _best_progressive_stream(url):
+        """Return the highest-resolution progressive MP4 stream of a YouTube video."""
+        from pytube import YouTube
+        return YouTube(url).streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
+
+    @staticmethod
+    def _best_audio_stream(url):
+        """Return the highest-bitrate audio-only stream of a YouTube video, preferring m4a."""
+        from pytube import YouTube
+        streams = YouTube(url).streams.filter(only_audio=True)
+        stream = (streams.filter(subtype='mp4').order_by('abr').desc().first()
+                  or streams.order_by('abr').desc().first())
+        if stream is None:
+            raise ValueError(f"No audio stream found for {url}")
+        return stream
+
+def stream_audio(source, ffmpeg="ffmpeg", block_seconds=30, sample_rate=SAMPLE_RATE):
+    """Yield mono float32 sample blocks of a file or URL's audio as ffmpeg decodes them.
+
+    Raises RuntimeError with the end of ffmpeg's error output if decoding fails.
+    """
+    import numpy as np
+    block_bytes = int(block_seconds * sample_rate) * 2
+    # A file rather than a pipe, so a chatty ffmpeg cannot block on a full stderr pipe
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(_decode_command(ffmpeg, source, sample_rate),
+                                   stdout=subprocess.PIPE, stderr=errors)
+        finished = False
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                # An odd byte count can only happen at the very end of the stream
+                data = data[:len(data) // 2 * 2]
+                yield np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+            finished = True
+        finally:
+            process.stdout.close()
+            if not finished:
+                # The consumer stopped early
+                process.kill()
+            returncode = process.wait()
+        if returncode != 0:
+            errors.seek(0)
+            message = errors.read().decode(errors="replace")[-500:]
+            raise RuntimeError(f"ffmpeg failed to decode {source}: {message}")
+
+def _decode_command(ffmpeg, source, sample_rate):
+    """Return the ffmpeg command that writes 16-bit mono PCM of the audio track to stdout."""
+    return [ffmpeg, "-nostdin", "-loglevel", "error", "-i", source,
+            "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-acodec", "pcm_s16le", "-"]
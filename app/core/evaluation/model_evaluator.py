@@ -1,13 +1,64 @@
+import os
+import re
+import json
+import time
+import hashlib
+import functools
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from rouge_score import rouge_scorer
+from rouge_score import rouge_scorer, tokenize, tokenizers
+from nltk.stem import porter
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
-from bert_score import score
+
+# bert_score and torch are imported only when BERTScore is computed
+
+ROUGE_TYPES = ['rouge1', 'rouge2', 'rougeL']
+
+# Lowercased word tokens for BLEU, independent of NLTK tokenizer data
+BLEU_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Below this many pairs the process pool costs more than it saves
+MIN_PARALLEL_PAIRS = 64
+
+class CachedStemmingTokenizer(tokenizers.Tokenizer):
+    def __init__(self):
+        """Initialize ROUGE's default stemming tokenizer with memoized stems.
+
+        Porter stemming dominates ROUGE scoring time and summaries reuse a small
+        vocabulary, so each distinct word is stemmed once; scores are unchanged.
+        """
+        self._stemmer = porter.PorterStemmer("ORIGINAL_ALGORITHM")
+        self._stemmer.stem = functools.lru_cache(maxsize=1 << 16)(self._stemmer.stem)
+
+    def tokenize(self, text):
+        """Lowercase, split and stem text the way ROUGE's default tokenizer does."""
+        return tokenize.tokenize(text, self._stemmer)
+
+def new_rouge_scorer():
+    """Return a stemming ROUGE scorer for ROUGE_TYPES."""
+    return rouge_scorer.RougeScorer(ROUGE_TYPES, tokenizer=CachedStemmingTokenizer())
 
 class ModelEvaluator:
-    def __init__(self, reference_summaries=None):
-        """Initialize the model evaluator with reference summaries."""
+    def __init__(self, reference_summaries=None, bert_model="distilbert-base-uncased", bert_batch_size=32,
+                 embedding_cache_dir="./data/cache/bertscore", num_layers=None):
+        """Initialize the model evaluator with reference summaries.
+
+        BERTScore uses ``bert_model`` on the CPU in batches of
+        ``bert_batch_size``; the default is a small model so thousands of pairs
+        score in minutes. The embeddings come from bert_score's recommended
+        layer for the model, or from ``num_layers`` layers when given, which is
+        required for models bert_score does not list. Reference embeddings are
+        stored under ``embedding_cache_dir`` by model and text, so re-evaluating
+        the same regression set only embeds the generated summaries. Pass None
+        to disable the cache.
+        """
         self.reference_summaries = reference_summaries or {}
-        self.rouge_scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
+        self.rouge_scorer = new_rouge_scorer()
+        self.bert_model = bert_model
+        self.bert_batch_size = bert_batch_size
+        self.num_layers = num_layers
+        self.embedding_cache_dir = embedding_cache_dir
+        self._bert = None
         
     def add_reference(self, transcript_id, summary):
         """Add a reference summary for a transcript."""
@@ -26,3 +77,190 @@ class ModelEvaluator:
             'rouge2': scores['rouge2'].fmeasure,
             'rougeL': scores['rougeL'].fmeasure
         }
+
+    def evaluate_bleu(self, transcript_id, generated_summary):
+        """Evaluate a generated summary using smoothed sentence BLEU."""
+        if transcript_id not in self.reference_summaries:
+            raise ValueError(f"No reference summary found for transcript ID: {transcript_id}")
+        return bleu(self.reference_summaries[transcript_id], generated_summary)
+
+    def evaluate_corpus(self, pairs, workers=None, bert=True):
+        """Score many generated/reference pairs and return an aggregate report.
+
+        ``pairs`` is an iterable of dicts with ``generated`` and ``reference``
+        text and an optional ``id``, such as the output of read_pairs(). ROUGE
+        and BLEU run on a pool of ``workers`` processes (all CPUs by default);
+        BERTScore, unless ``bert`` is False, runs in batches in this process.
+        The report holds per-item scores and the mean, median, minimum and
+        maximum of every metric.
+        """
+        start = time.perf_counter()
+        pairs = list(pairs)
+        items = [{"id": pair.get("id", i)} for i, pair in enumerate(pairs)]
+        references = [pair["reference"] for pair in pairs]
+        generated = [pair["generated"] for pair in pairs]
+
+        for item, scores in zip(items, self._lexical_scores(references, generated, workers)):
+            item.update(scores)
+        if bert and pairs:
+            for item, scores in zip(items, self.bert_scores(references, generated)):
+                item.update(scores)
+
+        metrics = [key for key in items[0] if key != "id"] if items else []
+        aggregate = {}
+        for metric in metrics:
+            values = np.array([item[metric] for item in items], dtype=np.float64)
+            aggregate[metric] = {
+                "mean": float(values.mean()),
+                "median": float(np.median(values)),
+                "min": float(values.min()),
+                "max": float(values.max())
+            }
+        return {
+            "count": len(items),
+            "bert_model": self.bert_model if bert else None,
+            "elapsed_seconds": time.perf_counter() - start,
+            "aggregate": aggregate,
+            "items": items
+        }
+
+    def bert_scores(self, references, generated):
+        """Return BERTScore precision, recall and F1 for each pair of texts.
+
+        Scores match ``bert_score.score`` with its defaults (no IDF weighting
+        or baseline rescaling): tokens are matched greedily by cosine
+        similarity, and special tokens such as [CLS] and [SEP] can be matched
+        but are left out of the averages.
+        """
+        reference_embeddings = self._reference_embeddings(references)
+        generated_embeddings = self._embed(generated)
+        scores = []
+        for (ref, ref_counted), (gen, gen_counted) in zip(reference_embeddings, generated_embeddings):
+            if not ref_counted.any() or not gen_counted.any():
+                scores.append({"bert_precision": 0.0, "bert_recall": 0.0, "bert_f1": 0.0})
+                continue
+            similarity = gen @ ref.T
+            precision = float(similarity.max(axis=1)[gen_counted].mean())
+            recall = float(similarity.max(axis=0)[ref_counted].mean())
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+            scores.append({"bert_precision": precision, "bert_recall": recall, "bert_f1": f1})
+        return scores
+
+    def _lexical_scores(self, references, generated, workers):
+        """Compute ROUGE and BLEU for every pair, on a process pool for large corpora."""
+        pairs = list(zip(references, generated))
+        workers = workers or os.cpu_count() or 1
+        if len(pairs) < MIN_PARALLEL_PAIRS or workers == 1:
+            return [_lexical_pair_scores(self.rouge_scorer, reference, text) for reference, text in pairs]
+        chunksize = max(1, len(pairs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_lexical_worker) as executor:
+            return list(executor.map(_score_lexical_pair, pairs, chunksize=chunksize))
+
+    def _reference_embeddings(self, references):
+        """Return normalized token embeddings of the references, computing only those not cached."""
+        if self.embedding_cache_dir is None:
+            return self._embed(references)
+        model_dir = self.bert_model.replace("/", "--")
+        if self.num_layers is not None:
+            model_dir += f"--L{self.num_layers}"
+        cache_dir = os.path.join(self.embedding_cache_dir, model_dir)
+        paths = [os.path.join(cache_dir, hashlib.sha256(text.encode("utf-8")).hexdigest() + ".npz")
+                 for text in references]
+        embeddings = [_load_embedding(path) if os.path.exists(path) else None for path in paths]
+
+        missing = sorted({text for text, embedding in zip(references, embeddings) if embedding is None})
+        if missing:
+            os.makedirs(cache_dir, exist_ok=True)
+            computed = dict(zip(missing, self._embed(missing)))
+            for i, (text, path) in enumerate(zip(references, paths)):
+                if embeddings[i] is None:
+                    embeddings[i] = computed[text]
+                    # Write then rename, so a concurrent reader never sees a partial file
+                    temp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(temp_path, "wb") as f:
+                        np.savez(f, embeddings=embeddings[i][0], counted=embeddings[i][1])
+                    os.replace(temp_path, path)
+        return embeddings
+
+    def _embed(self, texts):
+        """Return each text's L2-normalized token embeddings and a mask of the non-special tokens."""
+        import torch
+        model, tokenizer = self._load_bert()
+        # Similar lengths in a batch keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = [None] * len(texts)
+        with torch.no_grad():
+            for start in range(0, len(order), self.bert_batch_size):
+                batch = order[start:start + self.bert_batch_size]
+                encoded = tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                    return_tensors="pt", return_special_tokens_mask=True)
+                special = encoded.pop("special_tokens_mask").bool()
+                hidden = model(**encoded)[0]
+                hidden = torch.nn.functional.normalize(hidden, dim=-1)
+                mask = encoded["attention_mask"].bool()
+                for row, i in enumerate(batch):
+                    embeddings[i] = (hidden[row][mask[row]].numpy().astype(np.float32),
+                                     (~special[row][mask[row]]).numpy())
+        return embeddings
+
+    def _load_bert(self):
+        """Load the BERTScore model and tokenizer once, with bert_score's layer choice or ``num_layers``."""
+        if self._bert is None:
+            from bert_score.utils import get_model, get_tokenizer, model2layers
+            num_layers = self.num_layers if self.num_layers is not None else model2layers.get(self.bert_model)
+            if num_layers is None:
+                raise ValueError(f"bert_score has no default layer for {self.bert_model}; pass num_layers")
+            tokenizer = get_tokenizer(self.bert_model, use_fast=True)
+            model = get_model(self.bert_model, num_layers, all_layers=False)
+            model.eval()
+            self._bert = (model, tokenizer)
+        return self._bert
+
+def _load_embedding(path):
+    """Read cached token embeddings and their mask of non-special tokens."""
+    with np.load(path) as data:
+        return data["embeddings"], data["counted"]
+
+def read_pairs(path, generated_key="generated", reference_key="reference", id_key="id"):
+    """Read generated/reference pairs from a JSONL file, skipping blank lines."""
+    pairs = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if generated_key not in record or reference_key not in record:
+                raise ValueError(f"{path}:{line_number} needs '{generated_key}' and '{reference_key}' fields")
+            pairs.append({
+                "id": record.get(id_key, line_number),
+                "generated": record[generated_key],
+                "reference": record[reference_key]
+            })
+    return pairs
+
+def bleu(reference, generated):
+    """Return smoothed sentence BLEU of a generated text against one reference."""
+    reference_tokens = BLEU_TOKEN_PATTERN.findall(reference.lower())
+    generated_tokens = BLEU_TOKEN_PATTERN.findall(generated.lower())
+    if not reference_tokens or not generated_tokens:
+        return 0.0
+    return sentence_bleu([reference_tokens], generated_tokens,
+                         smoothing_function=SmoothingFunction().method1)
+
+_worker_rouge_scorer = None
+
+def _init_lexical_worker():
+    """Build one ROUGE scorer per pool process."""
+    global _worker_rouge_scorer
+    _worker_rouge_scorer = new_rouge_scorer()
+
+def _score_lexical_pair(pair):
+    """Score one (reference, generated) pair in a pool process."""
+    return _lexical_pair_scores(_worker_rouge_scorer, *pair)
+
+def _lexical_pair_scores(scorer, reference, generated):
+    """Return ROUGE F-measures and BLEU for one pair."""
+    scores = scorer.score(reference, generated)
+    result = {rouge_type: scores[rouge_type].fmeasure for rouge_type in ROUGE_TYPES}
+    result["bleu"] = bleu(reference, generated)
+    return result
@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import zlib
+import numpy as np
+
+TERM_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Postings added since the last compaction are merged into the base view once
+# they outnumber it, or this many, so adds cost amortized constant time
+MIN_COMPACT_POSTINGS = 1 << 16
+
+class ExampleIndex:
+    # Arrays persisted by save() and memory-mapped by load()
+    ARRAY_FILES = ("indptr", "indices", "counts", "doc_freq", "term_ptr", "posting_rows", "posting_weights")
+
+    # Version of the posting weights in saved indexes; older ones are rebuilt on load
+    POSTINGS_VERSION = 2
+
+    def __init__(self, dims=2 ** 20):
+        """Initialize an empty TF-IDF index over transcript/summary example pairs.
+
+        Each example input is stored as a sparse row of hashed term counts
+        (CSR arrays in NumPy) and as postings of its length-normalized
+        log-scaled term frequencies. IDF weights are applied to the query's
+        terms when searching, so adding an example only appends its own
+        postings and a query only touches the postings of its terms. Postings
+        of recent additions are kept per term and merged into the base arrays,
+        which are persisted with the index, once they outnumber them.
+        """
+        self.dims = dims
+        self.examples = []
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._counts = np.zeros(0, dtype=np.float32)
+        self._nnz = 0
+        self._doc_freq = np.zeros(dims, dtype=np.int32)
+        # Base inverted view, and postings added since it was built as term -> ([rows], [weights])
+        self._base_postings = (np.zeros(dims + 1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                               np.zeros(0, dtype=np.float32))
+        self._recent_postings = {}
+        self._recent_nnz = 0
+
+    def __len__(self):
+        return len(self.examples)
+
+    def add_example(self, input_text, output_text):
+        """Add one example pair and return its position in the index."""
+        position = len(self.examples)
+        terms, counts = self._term_counts(input_text)
+        self._indices = _append(self._indices, self._nnz, terms)
+        self._counts = _append(self._counts, self._nnz, counts)
+        self._nnz += len(terms)
+        self._indptr = _append(self._indptr, position + 1, np.array([self._nnz]))
+
+        if not self._doc_freq.flags.writeable:
+            self._doc_freq = np.array(self._doc_freq)
+        self._doc_freq[terms] += 1
+        for term, weight in zip(terms.tolist(), _row_weights(counts).tolist()):
+            rows, weights = self._recent_postings.setdefault(term, ([], []))
+            rows.append(position)
+            weights.append(weight)
+        self._recent_nnz += len(terms)
+
+        self.examples.append({"input": input_text, "output": output_text})
+        if self._recent_nnz > max(len(self._base_postings[1]), MIN_COMPACT_POSTINGS):
+            self._compact()
+        return position
+
+    def add_examples(self, examples):
+        """Add multiple example pairs."""
+        for example in examples:
+            self.add_example(example["input"], example["output"])
+
+    def search(self, text, k=3):
+        """Return ``(score, position)`` pairs for the ``k`` most similar examples.
+
+        An example scores the sum over shared terms of the query's normalized
+        TF-IDF weight, the term's IDF and the example's normalized log term
+        frequency. Ties are broken by insertion order, so results are
+        deterministic.
+        """
+        n = len(self.examples)
+        if n == 0 or k <= 0:
+            return []
+
+        terms, counts = self._term_counts(text)
+        idf = self._idf(terms)
+        query = (1 + np.log(counts)) * idf
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm * idf
+
+        # Only the postings of the query's terms contribute to the scores
+        term_ptr, rows, weights = self._base_postings
+        starts = term_ptr[terms]
+        lengths = term_ptr[terms + 1] - starts
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        scores = np.bincount(rows[positions], weights=weights[positions] * np.repeat(query, lengths),
+                             minlength=n).astype(np.float64, copy=False)
+        if self._recent_postings:
+            for term, term_weight in zip(terms.tolist(), query.tolist()):
+                recent = self._recent_postings.get(term)
+                if recent is not None:
+                    np.add.at(scores, recent[0], np.asarray(recent[1]) * term_weight)
+
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [(float(scores[i]), int(i)) for i in order]
+
+    def top_k(self, text, k=3):
+        """Return the ``k`` examples most similar to the text, most similar first."""
+        return [self.examples[i] for _, i in self.search(text, k)]
+
+    def save(self, path):
+        """Write the index to a directory of .npy arrays plus the examples as JSONL."""
+        os.makedirs(path, exist_ok=True)
+        if self._recent_postings:
+            self._compact()
+        n = len(self.examples)
+        arrays = {
+            "indptr": self._indptr[:n + 1],
+            "indices": self._indices[:self._nnz],
+            "counts": self._counts[:self._nnz],
+            "doc_freq": self._doc_freq,
+        }
+        arrays.update(zip(("term_ptr", "posting_rows", "posting_weights"), self._base_postings))
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+        with open(os.path.join(path, "examples.jsonl"), "w") as f:
+            for example in self.examples:
+                f.write(json.dumps(example) + "\n")
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"dims": self.dims, "examples": n, "postings_version": self.POSTINGS_VERSION}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load an index saved with save(), memory-mapping its arrays by default."""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        index = cls(dims=meta["dims"])
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+                  for name in cls.ARRAY_FILES}
+        with open(os.path.join(path, "examples.jsonl")) as f:
+            index.examples = [json.loads(line) for line in f if line.strip()]
+
+        index._indptr = arrays["indptr"]
+        index._indices = arrays["indices"]
+        index._counts = arrays["counts"]
+        index._nnz = len(arrays["indices"])
+        index._doc_freq = arrays["doc_freq"]
+        if meta.get("postings_version") == cls.POSTINGS_VERSION:
+            index._base_postings = (arrays["term_ptr"], arrays["posting_rows"], arrays["posting_weights"])
+        else:
+            index._compact()
+        return index
+
+    @classmethod
+    def from_file(cls, path, input_key="transcript", output_key="summary", dims=2 ** 20):
+        """Build an index from a JSON array or JSONL file of example pairs.
+
+        This reads the same transcript/summary records that scripts/finetune.py
+        prepares; records missing either field are skipped.
+        """
+        index = cls(dims=dims)
+        for record in _read_records(path):
+            input_text = record.get(input_key) or record.get("input")
+            output_text = record.get(output_key) or record.get("output")
+            if input_text and output_text:
+                index.add_example(input_text, output_text)
+        return index
+
+    @classmethod
+    def open(cls, path):
+        """Load a saved index directory, or build an index from an examples file."""
+        if os.path.isdir(path):
+            return cls.load(path)
+        return cls.from_file(path)
+
+    def _term_counts(self, text):
+        """Return sorted unique hashed term ids of a text and their counts."""
+        words = TERM_PATTERN.findall(text.lower())
+        if not words:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        hashes = np.fromiter(map(zlib.crc32, map(str.encode, words)), dtype=np.int64,
+                             count=len(words)) % self.dims
+        terms, counts = np.unique(hashes, return_counts=True)
+        return terms.astype(np.int32), counts.astype(np.float32)
+
+    def _idf(self, terms):
+        """Return smoothed inverse document frequencies for term ids."""
+        n = len(self.examples)
+        return np.log((1 + n) / (1 + self._doc_freq[terms].astype(np.float32))) + 1
+
+    def _compact(self):
+        """Rebuild the base inverted view ``(term_ptr, rows, weights)`` from the stored rows.
+
+        Postings of term ``t`` are ``term_ptr[t]:term_ptr[t + 1]``; each holds an
+        example position and its normalized log term frequency.
+        """
+        n = len(self.examples)
+        indptr = self._indptr[:n + 1]
+        indices = self._indices[:self._nnz]
+        lengths = np.diff(indptr)
+        rows = np.repeat(np.arange(n, dtype=np.int32), lengths)
+        weights = 1 + np.log(self._counts[:self._nnz])
+        norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=n))
+        weights = (weights / np.where(norms > 0, norms, 1)[rows]).astype(np.float32)
+
+        order = np.argsort(indices, kind="stable")
+        term_ptr = np.zeros(self.dims + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indices, minlength=self.dims), out=term_ptr[1:])
+        self._base_postings = (term_ptr, rows[order], weights[order])
+        self._recent_postings = {}
+        self._recent_nnz = 0
+
+def _row_weights(counts):
+    """Return the normalized log-scaled term frequencies of one example."""
+    weights = 1 + np.log(counts)
+    norm = np.linalg.norm(weights)
+    return weights / norm if norm > 0 else weights
+
+def _append(array, length, values):
+    """Write values after the first ``length`` items, growing the buffer geometrically."""
+    needed = length + len(values)
+    if needed > len(array) or not array.flags.writeable:
+        grown = np.empty(max(needed, 2 * len(array), 16), dtype=array.dtype)
+        grown[:length] = array[:length]
+        array = grown
+    array[length:needed] = values
+    return array
+
+def _read_records(path):
+    """Yield records from a JSON array file or a JSONL file."""
+    with open(path) as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from json.load(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
@@ -1,31 +1,116 @@
+import logging
+
+from app.core.few_shot.token_counter import TokenCounter, PromptTooLargeError, MESSAGE_OVERHEAD_TOKENS
+from app.core.monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE = "I want you to summarize video transcripts into concise chapter summaries.\n\nHere are some examples:\n\n{examples}\n\nNow summarize the following transcript:\n{input}"
+
 class FewShotLearner:
-    def __init__(self, examples=None):
-        """Initialize the few-shot learner with example pairs."""
+    def __init__(self, examples=None, model="gpt-3.5-turbo", index=None):
+        """Initialize the few-shot learner with example pairs and the target model.
+
+        If an ExampleIndex is given, examples are stored in it and each prompt
+        uses the examples most similar to its input instead of a fixed prefix.
+        """
         self.examples = examples or []
-        
+        self.model = model
+        self.index = index
+        self._token_counters = {}
+        if self.index is not None and self.examples:
+            self.index.add_examples(self.examples)
+            self.examples = []
+
     def add_example(self, input_text, output_text):
         """Add an example pair to the few-shot learner."""
-        self.examples.append({"input": input_text, "output": output_text})
-        
+        if self.index is not None:
+            self.index.add_example(input_text, output_text)
+        else:
+            self.examples.append({"input": input_text, "output": output_text})
+
     def add_examples(self, examples):
         """Add multiple example pairs to the few-shot learner."""
         for example in examples:
             self.add_example(example["input"], example["output"])
-    
-    def create_prompt(self, input_text, n_shots=3, template=None):
+
+    def token_counter(self, model=None):
+        """Return the cached token counter for a model."""
+        model = model or self.model
+        if model not in self._token_counters:
+            self._token_counters[model] = TokenCounter(model)
+        return self._token_counters[model]
+
+    def create_prompt(self, input_text, n_shots=3, template=None, model=None, max_tokens=0):
         """Create a few-shot prompt with the given input text."""
+        return self.create_packed_prompt(input_text, n_shots, template, model, max_tokens)["prompt"]
+
+    @metrics.timed("build_prompt")
+    def create_packed_prompt(self, input_text, n_shots=3, template=None, model=None, max_tokens=0,
+                             context_window=None):
+        """Create a few-shot prompt that fits the model's context window.
+
+        ``max_tokens`` is reserved for the completion. Examples are packed in a
+        fixed order until ``n_shots`` are used or the budget runs out, so the
+        template and example prefix are identical across requests and can be
+        reused by provider-side prompt caching. With an index the order is by
+        similarity to the input, which is still deterministic for a given
+        input and index, so the completion cache keeps working. Returns a dict with the
+        ``prompt``, ``prompt_tokens``, ``remaining_tokens`` and the number of
+        ``examples`` used. Raises PromptTooLargeError, before anything is sent,
+        if the input does not fit even without examples.
+        """
         if template is None:
-            template = "I want you to summarize video transcripts into concise chapter summaries.\n\nHere are some examples:\n\n{examples}\n\nNow summarize the following transcript:\n{input}"
-        
-        # Select n_shots random examples if we have more than needed
-        import random
-        selected_examples = self.examples
-        if len(self.examples) > n_shots:
-            selected_examples = random.sample(self.examples, n_shots)
-            
-        examples_text = ""
-        for example in selected_examples:
-            examples_text += f"Transcript:\n{example['input']}\n\nSummary:\n{example['output']}\n\n---\n\n"
-            
-        prompt = template.format(examples=examples_text, input=input_text)
-        return prompt
+            template = DEFAULT_TEMPLATE
+        counter = self.token_counter(model)
+        budget = (context_window or counter.context_window) - max_tokens - MESSAGE_OVERHEAD_TOKENS
+
+        base_tokens = counter.count(template.format(examples="", input=input_text))
+        if base_tokens > budget:
+            raise PromptTooLargeError(
+                f"Prompt needs {base_tokens} tokens but only {budget} are available for "
+                f"{model or self.model}; split the input first",
+                base_tokens, budget
+            )
+
+        selected = []
+        used = base_tokens
+        for example in self._candidate_examples(input_text, n_shots):
+            example_tokens = counter.count(self._format_example(example))
+            if used + example_tokens > budget:
+                break
+            selected.append(example)
+            used += example_tokens
+
+        prompt = self._render(template, selected, input_text)
+        prompt_tokens = counter.count(prompt)
+        # Tokens can merge differently across part boundaries; drop examples until it fits
+        while prompt_tokens > budget and selected:
+            selected.pop()
+            prompt = self._render(template, selected, input_text)
+            prompt_tokens = counter.count(prompt)
+
+        logger.debug(f"Packed {len(selected)} example(s) into a {prompt_tokens}-token prompt for "
+                     f"{model or self.model}; {budget - prompt_tokens} tokens of the budget left")
+        return {
+            "prompt": prompt,
+            "prompt_tokens": prompt_tokens,
+            "remaining_tokens": budget - prompt_tokens,
+            "examples": len(selected)
+        }
+
+    def _candidate_examples(self, input_text, n_shots):
+        """Return up to ``n_shots`` examples in a deterministic order."""
+        if self.index is not None:
+            return self.index.top_k(input_text, n_shots)
+        return self.examples[:n_shots]
+
+    def _render(self, template, examples, input_text):
+        """Fill the template with the formatted examples and the input."""
+        examples_text = "".join(self._format_example(example) for example in examples)
+        return template.format(examples=examples_text, input=input_text)
+
+    @staticmethod
+    def _format_example(example):
+        """Format one example pair as it appears in the prompt."""
+        return f"Transcript:\n{example['input']}\n\nSummary:\n{example['output']}\n\n---\n\n"
@@ -18,5 +18,58 @@ Now, create a summary for the following tutorial transcript. Focus on:
 Make sure the summary is well-structured, informative, and captures the educational value of the original tutorial without watching it.
 
 Tutorial Transcript:
+{input}
+"""
+
+    @staticmethod
+    def chapter_summary_template():
+        """Return a template for summarizing a single section of a transcript."""
+        return """
+I want you to act as a tutorial summarizer. You will be given one section of a longer tutorial transcript.
+
+Here are some examples of tutorial transcripts and their summaries:
+
+{examples}
+
+Summarize the following section as a short chapter. Keep every topic, key point, technique and practical tip it mentions, and do not add an introduction or conclusion for the whole tutorial.
+
+Transcript Section:
+{input}
+"""
+
+    @staticmethod
+    def merge_summaries_template():
+        """Return a template for combining partial chapter summaries into one recap."""
+        return """
+I want you to act as a tutorial summarizer that can create concise and informative summaries of educational videos.
+
+Here are some examples of tutorial transcripts and their summaries:
+
+{examples}
+
+The following are summaries of consecutive sections of one tutorial, in order. Combine them into a single summary. Focus on:
+1. Main topics covered
+2. Key points for each topic
+3. Important techniques or methods explained
+4. Any practical tips or best practices mentioned
+
+Merge repeated points, keep the original order of topics, and make sure the summary is well-structured.
+
+Section Summaries:
+{input}
+"""
+
+    @staticmethod
+    def running_summary_update_template():
+        """Return a template for folding new chapter summaries into a running summary."""
+        return """
+I want you to act as a tutorial summarizer that keeps a running summary of a tutorial that is still in progress.
+
+Here are some examples of tutorial transcripts and their summaries:
+
+{examples}
+
+Below are the current summary of everything so far, followed by summaries of the sections that came after it, in order. Rewrite the current summary so it also covers the new sections. Keep every topic already in the summary, add the new topics in order, and merge points that repeat. Make sure the summary stays well-structured and concise.
+
 {input}
 """
@@ -0,0 +1,131 @@
+import math
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Context window sizes in tokens, matched by longest model-name prefix
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-instruct": 4096,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "davinci-002": 16384,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# Tokens the chat format adds around a single user message
+MESSAGE_OVERHEAD_TOKENS = 8
+
+# Characters per token assumed when tiktoken is not installed
+FALLBACK_CHARS_PER_TOKEN = 4
+
+class PromptTooLargeError(ValueError):
+    """Raised locally when a prompt cannot fit the model's context window."""
+
+    def __init__(self, message, prompt_tokens, budget):
+        super().__init__(message)
+        self.prompt_tokens = prompt_tokens
+        self.budget = budget
+
+def base_model_name(model):
+    """Return the base model of a fine-tuned model name such as ``ft:gpt-3.5-turbo:org::id``."""
+    if model.startswith("ft:"):
+        return model.split(":")[1]
+    return model
+
+def context_window(model):
+    """Return the context window of a model, in tokens."""
+    name = base_model_name(model)
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if name.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """Return the cached tiktoken encoding for a model, or None if tiktoken is unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(base_model_name(model))
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken fetches its BPE files on first use, which fails offline
+        logger.warning(f"Could not load tokenizer for {model}, estimating token counts: {e}")
+        return None
+
+class TokenCounter:
+    def __init__(self, model="gpt-3.5-turbo"):
+        """Initialize a token counter for a model, using tiktoken when it is installed."""
+        self.model = model
+        self.encoding = get_encoding(model)
+        self.context_window = context_window(model)
+
+    def count(self, text):
+        """Return the number of tokens in a text."""
+        if self.encoding is None:
+            return math.ceil(len(text) / FALLBACK_CHARS_PER_TOKEN)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def check_prompt(self, prompt, max_tokens):
+        """Raise PromptTooLargeError if a chat prompt cannot fit with a ``max_tokens`` completion."""
+        prompt_tokens = self.count(prompt) + MESSAGE_OVERHEAD_TOKENS
+        budget = self.context_window - max_tokens
+        if prompt_tokens > budget:
+            raise PromptTooLargeError(
+                f"Prompt needs {prompt_tokens} tokens but {self.model} has room for {budget} "
+                f"after reserving {max_tokens} for the completion",
+                prompt_tokens, budget
+            )
+        return prompt_tokens
+
+    def split(self, text, max_tokens):
+        """Split text into consecutive pieces of at most ``max_tokens`` tokens.
+
+        Pieces end at whitespace where possible so words are not cut in half.
+        """
+        if max_tokens < 1:
+            raise ValueError("max_tokens must be at least 1")
+        if self.encoding is None:
+            return self._split_chars(text, max_tokens * FALLBACK_CHARS_PER_TOKEN)
+
+        tokens = self.encoding.encode(text, disallowed_special=())
+        pieces = []
+        start = 0
+        while start < len(tokens):
+            end = min(len(tokens), start + max_tokens)
+            if end < len(tokens):
+                # Move the cut back to a token that starts a new word, if one is close
+                for j in range(end, max(start, end - 64), -1):
+                    if self.encoding.decode_single_token_bytes(tokens[j])[:1].isspace():
+                        end = j
+                        break
+            pieces.append(self.encoding.decode(tokens[start:end]))
+            start = end
+        return [piece.strip() for piece in pieces if piece.strip()]
+
+    @staticmethod
+    def _split_chars(text, max_chars):
+        """Split text into pieces of at most ``max_chars`` characters at whitespace."""
+        pieces = []
+        start = 0
+        while start < len(text):
+            end = start + max_chars
+            if end < len(text):
+                cut = text.rfind(" ", start, end)
+                if cut > start:
+                    end = cut
+            pieces.append(text[start:end])
+            start = end
+        return [piece.strip() for piece in pieces if piece.strip()]
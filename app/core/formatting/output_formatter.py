@@ -0,0 +1,293 @@
+import os
+import re
+import html
+import json
+from functools import lru_cache
+
+FORMATS = ("markdown", "html", "json")
+
+MEDIA_TYPES = {
+    "markdown": "text/markdown; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+    "json": "application/json"
+}
+
+FORMAT_EXTENSIONS = {"markdown": ".md", "html": ".html", "json": ".json"}
+
+DEFAULT_TITLE = "Video Summary"
+
+# Characters of JSON gathered before a piece is yielded by a streaming render
+JSON_CHUNK_CHARS = 64 * 1024
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+BOLD_HEADING_PATTERN = re.compile(r"^\*\*([^*]+?):?\*\*:?\s*$")
+BULLET_PATTERN = re.compile(r"^(\s*)(?:[-*+•]|(\d+)[.)])\s+(.*)$")
+# A timestamp such as [12:30], (1:02:03) or 12:30 - at the start of a line
+TIMESTAMP_PATTERN = re.compile(r"^[\[(]?((?:\d{1,2}:)?\d{1,2}:\d{2})[\])]?(?:\s*[-–—:]\s*|\s+)")
+
+BOLD_PATTERN = re.compile(r"\*\*(.+?)\*\*")
+ITALIC_PATTERN = re.compile(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?![*\w])")
+CODE_PATTERN = re.compile(r"`([^`]+)`")
+
+class OutputFormatter:
+    def __init__(self, format_type="markdown"):
+        """Initialize a formatter rendering summaries as markdown, html or json.
+
+        A raw model summary is parsed once into a structured summary (title,
+        sections, bullets and timestamps) and every format is rendered from
+        that structure, so switching formats never needs another model call.
+        """
+        if format_type not in FORMATS:
+            raise ValueError(f"Unknown format {format_type!r}; expected one of {', '.join(FORMATS)}")
+        self.format_type = format_type
+
+    def format_summary(self, summary, metadata=None):
+        """Return a raw model summary rendered in this formatter's format."""
+        return self.render(self.structure(summary, metadata))
+
+    def structure(self, summary, metadata=None):
+        """Return the structured summary of a raw model summary, with its metadata.
+
+        Parses are cached by summary text and shared, so treat the result as
+        read-only.
+        """
+        parsed = parse_summary(summary or "")
+        metadata = dict(metadata or {})
+        return {
+            "title": parsed["title"] or metadata.get("title") or DEFAULT_TITLE,
+            "metadata": metadata,
+            "sections": parsed["sections"]
+        }
+
+    def render(self, structured):
+        """Render a structured summary as one string."""
+        return "".join(self.render_stream(structured))
+
+    def render_stream(self, structured):
+        """Render a structured summary piece by piece, a section at a time.
+
+        Large summaries can be written or sent as they render instead of being
+        built in memory first.
+        """
+        if self.format_type == "json":
+            return _render_json(structured)
+        if self.format_type == "html":
+            return _render_html(structured)
+        return _render_markdown(structured)
+
+def output_paths(output, formats):
+    """Return the file each format is written to.
+
+    A single format is written to ``output`` itself; several formats are
+    written next to it, each with its own extension.
+    """
+    formats = list(dict.fromkeys(formats))
+    if len(formats) == 1:
+        return {formats[0]: output}
+    base = os.path.splitext(output)[0]
+    return {format_type: base + FORMAT_EXTENSIONS[format_type] for format_type in formats}
+
+def write_summary(structured, paths):
+    """Render a structured summary in every format of ``paths``, streaming each to its file."""
+    for format_type, path in paths.items():
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            for piece in OutputFormatter(format_type).render_stream(structured):
+                f.write(piece)
+
+@lru_cache(maxsize=256)
+def parse_summary(text):
+    """Parse a raw markdown-like model summary into a title and sections.
+
+    Each section has a title (None for text before the first heading), a
+    heading level, an optional timestamp and a list of items; an item is a
+    bullet (with its nesting depth and whether it is numbered) or a paragraph.
+    Timestamps at the start of a heading or item are split off as seconds and
+    the label the model wrote.
+    """
+    title = None
+    sections = []
+    section = None
+    paragraph = []
+
+    def flush_paragraph():
+        if paragraph:
+            current_section()["items"].append(_item("paragraph", " ".join(paragraph)))
+            paragraph.clear()
+
+    def current_section():
+        nonlocal section
+        if section is None:
+            section = {"title": None, "level": 2, "timestamp": None, "items": []}
+            sections.append(section)
+        return section
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            flush_paragraph()
+            continue
+
+        heading = HEADING_PATTERN.match(stripped)
+        level = len(heading.group(1)) if heading else 3
+        heading_text = heading.group(2) if heading else None
+        if heading is None:
+            bold = BOLD_HEADING_PATTERN.match(stripped)
+            heading_text = bold.group(1).strip() if bold else None
+        if heading_text is not None:
+            flush_paragraph()
+            if level == 1 and title is None and not sections:
+                title = heading_text
+                continue
+            timestamp, heading_text = _split_timestamp(heading_text)
+            section = {"title": heading_text, "level": level, "timestamp": timestamp, "items": []}
+            sections.append(section)
+            continue
+
+        bullet = BULLET_PATTERN.match(line)
+        if bullet:
+            flush_paragraph()
+            indent = len(bullet.group(1).expandtabs(4))
+            item = _item("bullet", bullet.group(3))
+            item["depth"] = indent // 2
+            item["ordered"] = bullet.group(2) is not None
+            current_section()["items"].append(item)
+            continue
+
+        paragraph.append(stripped)
+
+    flush_paragraph()
+    return {"title": title, "sections": sections}
+
+def parse_timestamp(label):
+    """Return the seconds of a ``[h:]mm:ss`` timestamp label."""
+    seconds = 0
+    for part in label.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def _split_timestamp(text):
+    """Split a leading timestamp off a line; return ``(timestamp or None, rest)``."""
+    match = TIMESTAMP_PATTERN.match(text)
+    if match is None or not text[match.end():].strip():
+        return None, text
+    label = match.group(1)
+    return {"seconds": parse_timestamp(label), "label": label}, text[match.end():].strip()
+
+def _item(kind, text):
+    timestamp, text = _split_timestamp(text.strip())
+    return {"type": kind, "text": text, "timestamp": timestamp}
+
+def _render_markdown(structured):
+    """Yield a structured summary as markdown, one block per section."""
+    lines = [f"# {structured['title']}", ""]
+    for key, value in structured["metadata"].items():
+        if key != "title" and value is not None:
+            lines.append(f"**{key.replace('_', ' ').capitalize()}:** {value}  ")
+    yield "\n".join(lines).rstrip() + "\n"
+
+    for section in structured["sections"]:
+        lines = [""]
+        if section["title"] is not None:
+            lines.append(f"{'#' * max(section['level'], 2)} {_timestamp_prefix(section)}{section['title']}")
+            lines.append("")
+        # Last number used by the ordered list open at each depth
+        numbers = {}
+        for item in section["items"]:
+            if item["type"] == "paragraph":
+                if lines[-1]:
+                    lines.append("")
+                lines.append(_timestamp_prefix(item) + item["text"])
+                lines.append("")
+                numbers.clear()
+                continue
+            numbers = {depth: n for depth, n in numbers.items() if depth <= item["depth"]}
+            if item["ordered"]:
+                numbers[item["depth"]] = numbers.get(item["depth"], 0) + 1
+                marker = f"{numbers[item['depth']]}."
+            else:
+                numbers.pop(item["depth"], None)
+                marker = "-"
+            lines.append(f"{'  ' * item['depth']}{marker} {_timestamp_prefix(item)}{item['text']}")
+        yield "\n".join(lines).rstrip() + "\n"
+
+def _render_html(structured):
+    """Yield a structured summary as a standalone HTML document, one block per section."""
+    title = html.escape(structured["title"])
+    parts = ["<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n",
+             f"<title>{title}</title>\n</head>\n<body>\n<article class=\"summary\">\n<h1>{title}</h1>\n"]
+    metadata = [(key, value) for key, value in structured["metadata"].items() if key != "title" and value is not None]
+    if metadata:
+        parts.append("<dl class=\"metadata\">\n")
+        for key, value in metadata:
+            parts.append(f"<dt>{html.escape(key.replace('_', ' ').capitalize())}</dt>"
+                         f"<dd>{_inline_html(str(value))}</dd>\n")
+        parts.append("</dl>\n")
+    yield "".join(parts)
+
+    for section in structured["sections"]:
+        parts = ["<section>\n"]
+        if section["title"] is not None:
+            level = min(max(section["level"], 2), 6)
+            parts.append(f"<h{level}>{_timestamp_html(section)}{_inline_html(section['title'])}</h{level}>\n")
+        # Stack of open lists as (depth, tag)
+        open_lists = []
+        for item in section["items"]:
+            if item["type"] == "paragraph":
+                while open_lists:
+                    parts.append(f"</li>\n</{open_lists.pop()[1]}>\n")
+                parts.append(f"<p>{_timestamp_html(item)}{_inline_html(item['text'])}</p>\n")
+                continue
+            tag = "ol" if item["ordered"] else "ul"
+            while open_lists and open_lists[-1][0] > item["depth"]:
+                parts.append(f"</li>\n</{open_lists.pop()[1]}>\n")
+            if open_lists and open_lists[-1][0] == item["depth"]:
+                parts.append("</li>\n")
+                if open_lists[-1][1] != tag:
+                    parts.append(f"</{open_lists.pop()[1]}>\n")
+            if not open_lists or open_lists[-1][0] < item["depth"]:
+                parts.append(f"<{tag}>\n")
+                open_lists.append((item["depth"], tag))
+            parts.append(f"<li>{_timestamp_html(item)}{_inline_html(item['text'])}")
+        while open_lists:
+            parts.append(f"</li>\n</{open_lists.pop()[1]}>\n")
+        parts.append("</section>\n")
+        yield "".join(parts)
+
+    yield "</article>\n</body>\n</html>\n"
+
+def _render_json(structured):
+    """Yield a structured summary as indented JSON in pieces of about JSON_CHUNK_CHARS."""
+    buffer = []
+    size = 0
+    for piece in json.JSONEncoder(indent=2, ensure_ascii=False).iterencode(structured):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= JSON_CHUNK_CHARS:
+            yield "".join(buffer)
+            buffer.clear()
+            size = 0
+    buffer.append("\n")
+    yield "".join(buffer)
+
+def _timestamp_prefix(entry):
+    """Return the markdown prefix for an entry's timestamp."""
+    timestamp = entry["timestamp"]
+    return f"[{timestamp['label']}] " if timestamp else ""
+
+def _timestamp_html(entry):
+    """Return the HTML for an entry's timestamp."""
+    timestamp = entry["timestamp"]
+    if not timestamp:
+        return ""
+    return (f"<time class=\"timestamp\" data-seconds=\"{timestamp['seconds']}\">"
+            f"{html.escape(timestamp['label'])}</time> ")
+
+def _inline_html(text):
+    """Escape text for HTML, converting markdown bold, italics and code spans."""
+    text = html.escape(text, quote=False)
+    text = CODE_PATTERN.sub(r"<code>\1</code>", text)
+    text = BOLD_PATTERN.sub(r"<strong>\1</strong>", text)
+    return ITALIC_PATTERN.sub(r"<em>\1</em>", text)
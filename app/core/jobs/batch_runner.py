@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import ExitStack
+
+from app.core.formatting.output_formatter import FORMAT_EXTENSIONS, output_paths, write_summary
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("download", "extract_audio", "transcribe", "summarize")
+
+# Placed on a stage queue once per worker when the previous stage has finished
+_DONE = object()
+
+class BatchRunner:
+    def __init__(self, pipeline, formatter, concurrency=None, queue_size=4, progress_path=None, formats=None):
+        """Initialize a pipelined batch runner over a VideoPipeline.
+
+        Every stage has its own pool of worker threads, sized by
+        ``concurrency[stage]``, reading from a bounded queue of ``queue_size``
+        items. A stage blocks when the next one falls behind, so downloads,
+        audio extraction, transcription and model calls overlap across videos
+        without piling up intermediate files. Finished items are appended to the
+        JSONL ``progress_path`` and skipped when the batch is run again.
+        Each summary is structured once and written in every one of
+        ``formats`` (the formatter's own by default) next to the item's output.
+        As in ``VideoPipeline.run``, an item holds media store references to
+        its download until its audio is extracted and to its audio until it is
+        transcribed, so eviction cannot delete them while the item is queued.
+        """
+        self.pipeline = pipeline
+        self.formatter = formatter
+        self.formats = list(formats or [formatter.format_type])
+        self.concurrency = {stage: 1 for stage in STAGES}
+        self.concurrency.update(concurrency or {})
+        self.queue_size = queue_size
+        self.progress_path = progress_path
+        self._progress_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def run(self, items):
+        """Process manifest items and return a throughput report."""
+        done = self.completed_ids()
+        pending = [item for item in items if item["id"] not in done]
+        self._stats = {stage: {"items": 0, "seconds": 0.0} for stage in STAGES}
+        self._results = {"completed": 0, "failed": []}
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in STAGES]
+        queues.append(None)
+        remaining = {stage: self.concurrency[stage] for stage in STAGES}
+        threads = []
+        for i, stage in enumerate(STAGES):
+            for n in range(self.concurrency[stage]):
+                thread = threading.Thread(
+                    target=self._work, args=(stage, queues[i], queues[i + 1], remaining, i),
+                    name=f"batch-{stage}-{n}", daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        start = time.perf_counter()
+        for item in pending:
+            queues[0].put(dict(item))
+        for _ in range(self.concurrency[STAGES[0]]):
+            queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        return self._report(len(items), len(items) - len(pending), elapsed)
+
+    def completed_ids(self):
+        """Return the IDs of items recorded as finished in the progress file."""
+        if not self.progress_path or not os.path.exists(self.progress_path):
+            return set()
+        done = set()
+        with open(self.progress_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a partial last line
+                    continue
+                done.add(record["id"])
+        return done
+
+    def _work(self, stage, inbox, outbox, remaining, index):
+        """Run one stage on items from ``inbox`` and pass them on to ``outbox``."""
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                with self._stats_lock:
+                    remaining[stage] -= 1
+                    last = remaining[stage] == 0
+                # The last worker out tells every worker of the next stage to stop
+                if last and outbox is not None:
+                    for _ in range(self.concurrency[STAGES[index + 1]]):
+                        outbox.put(_DONE)
+                return
+
+            started = time.perf_counter()
+            try:
+                ran = getattr(self, f"_{stage}")(item)
+            except Exception as e:
+                logger.error(f"{item['id']}: {stage} failed: {e}")
+                self._release(item)
+                with self._stats_lock:
+                    self._results["failed"].append({"id": item["id"], "stage": stage, "error": str(e)})
+                continue
+            if ran:
+                with self._stats_lock:
+                    self._stats[stage]["items"] += 1
+                    self._stats[stage]["seconds"] += time.perf_counter() - started
+            if outbox is not None:
+                outbox.put(item)
+
+    def _download(self, item):
+        """Download a YouTube item's video."""
+        if "url" not in item:
+            return False
+        self._hold(item, "download", self.pipeline._download_key(item["url"]))
+        item["video_path"] = self.pipeline.download(item["url"])
+        return True
+
+    def _extract_audio(self, item):
+        """Extract the audio of a downloaded or local video."""
+        video_path = item.get("video_path") or item.get("file")
+        if video_path is None:
+            return False
+        try:
+            self._hold(item, "audio", self.pipeline._audio_key(video_path))
+            item["audio_path"] = self.pipeline.extract_audio(video_path)
+        finally:
+            self._release(item, "download")
+        return True
+
+    def _transcribe(self, item):
+        """Transcribe the audio, or read a transcript file item."""
+        if "transcript" in item:
+            with open(item["transcript"]) as f:
+                item["text"] = f.read()
+            return False
+        try:
+            item["text"] = self.pipeline.transcribe(item["audio_path"])
+        finally:
+            self._release(item, "audio")
+        return True
+
+    def _summarize(self, item):
+        """Summarize the transcript and write the formatted outputs."""
+        raw_summary = self.pipeline.summarize(item["text"])
+        source = item.get("url") or item.get("file") or item.get("transcript")
+        structured = self.formatter.structure(raw_summary, {"source": source})
+        write_summary(structured, output_paths(item["output"], self.formats))
+        self._record(item)
+        return True
+
+    def _hold(self, item, name, key):
+        """Take a media store reference to a key that the item keeps until it is released."""
+        references = ExitStack()
+        references.enter_context(self.pipeline._media_reference(key))
+        item.setdefault("_references", {})[name] = references
+
+    @staticmethod
+    def _release(item, name=None):
+        """Release one of the item's media store references, or all of them."""
+        references = item.get("_references", {})
+        for held in [name] if name is not None else list(references):
+            if held in references:
+                references.pop(held).close()
+
+    def _record(self, item):
+        """Append a finished item to the progress file."""
+        with self._stats_lock:
+            self._results["completed"] += 1
+        if not self.progress_path:
+            return
+        with self._progress_lock:
+            with open(self.progress_path, "a") as f:
+                f.write(json.dumps({"id": item["id"], "output": item["output"], "finished_at": time.time()}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _report(self, total, skipped, elapsed):
+        """Summarize item counts, stage busy time and throughput."""
+        stages = {}
+        for stage in STAGES:
+            stats = self._stats[stage]
+            workers = self.concurrency[stage]
+            stages[stage] = {
+                "workers": workers,
+                "items": stats["items"],
+                "mean_seconds": stats["seconds"] / stats["items"] if stats["items"] else 0.0,
+                "utilization": stats["seconds"] / (elapsed * workers) if elapsed > 0 else 0.0
+            }
+        completed = self._results["completed"]
+        return {
+            "items": total,
+            "skipped": skipped,
+            "completed": completed,
+            "failed": self._results["failed"],
+            "elapsed_seconds": elapsed,
+            "items_per_hour": completed * 3600 / elapsed if elapsed > 0 else 0.0,
+            "stages": stages
+        }
+
+def read_manifest(path, output_dir="./recaps", format_type="markdown"):
+    """Read a batch manifest into items.
+
+    Each line is either a JSON object with one of ``url``, ``file`` or
+    ``transcript`` and an optional ``output``, or a bare YouTube URL, video
+    path or ``.txt`` transcript path. Blank lines and ``#`` comments are
+    ignored. An item's ID is its input, so a rerun recognizes finished items.
+    """
+    extension = FORMAT_EXTENSIONS.get(format_type, ".txt")
+    items = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+            elif re.match(r"https?://", line):
+                item = {"url": line}
+            elif line.endswith(".txt"):
+                item = {"transcript": line}
+            else:
+                item = {"file": line}
+
+            source = item.get("url") or item.get("file") or item.get("transcript")
+            if source is None:
+                raise ValueError(f"Manifest entry has no url, file or transcript: {line}")
+            item["id"] = source
+            if "output" not in item:
+                name = re.sub(r"[^\w-]+", "_", source).strip("_")[-80:]
+                item["output"] = os.path.join(output_dir, f"{len(items):04d}-{name}{extension}")
+            items.append(item)
+    return items
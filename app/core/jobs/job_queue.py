@@ -0,0 +1,323 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Columns added after the first release, created on databases that predate them
+MIGRATED_COLUMNS = {
+    "owner": "TEXT",
+    "lease_expires_at": "REAL",
+    "not_before": "REAL NOT NULL DEFAULT 0"
+}
+
+# How often a process waiting for another one's stage checks for its result
+STAGE_POLL_SECONDS = 0.5
+
+class JobQueue:
+    def __init__(self, db_path="./data/jobs.sqlite3", max_attempts=3, lease_seconds=60, retry_delay=30):
+        """Initialize a persistent job queue.
+
+        Jobs are stored in SQLite, so queued work survives restarts and several
+        worker threads and processes can claim jobs without handing the same
+        job out twice. A claimed job is leased to this queue's ``owner`` for
+        ``lease_seconds``, and the owner renews the lease while the job runs;
+        a job whose lease has expired, because its process died, is claimed
+        again by any queue. The same database keeps the results of completed
+        pipeline stages, keyed by what they were computed from, so jobs that
+        reference the same video share downloads, audio and transcripts; a
+        stage being computed is claimed in the database under the same lease,
+        so other processes wait for it instead of computing it again. A job
+        that fails or is interrupted is retried until it has been started
+        ``max_attempts`` times, waiting ``retry_delay`` seconds after the first
+        failure and twice as long after each further one.
+        """
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stage_locks = {}
+        self._stage_locks_guard = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, "
+                "kind TEXT NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "stage TEXT, "
+                "result TEXT, "
+                "error TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in MIGRATED_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stage_results ("
+                "key TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stage_claims ("
+                "key TEXT PRIMARY KEY, "
+                "owner TEXT NOT NULL, "
+                "expires_at REAL NOT NULL)"
+            )
+
+    def submit(self, kind, payload):
+        """Queue a job and return its ID."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, now, now)
+            )
+        return job_id
+
+    def claim(self):
+        """Lease the oldest job that is ready to run and return it, or None if there is none.
+
+        Queued jobs are ready once their retry delay has passed; running jobs
+        are ready again once their lease has expired.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            self._expire_leases(conn, now)
+            row = conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, lease_expires_at = ?, attempts = attempts + 1, "
+                "updated_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = ? AND not_before <= ? "
+                "ORDER BY created_at LIMIT 1) "
+                "RETURNING id, kind, payload, attempts",
+                (RUNNING, self.owner, now + self.lease_seconds, now, QUEUED, now)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "attempts": row[3]}
+
+    def renew(self):
+        """Extend the leases of every job this queue's owner is running; return how many there are."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE owner = ? AND status = ?",
+                (time.time() + self.lease_seconds, self.owner, RUNNING)
+            )
+            return cursor.rowcount
+
+    def set_stage(self, job_id, stage):
+        """Record the stage a running job has reached, renewing its lease."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET stage = ?, lease_expires_at = ?, updated_at = ? "
+                         "WHERE id = ? AND owner = ?",
+                         (stage, now + self.lease_seconds, now, job_id, self.owner))
+
+    def complete(self, job_id, result):
+        """Store a job's result and mark it done; return False if this owner lost the job's lease."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = ?",
+                (DONE, json.dumps(result), time.time(), job_id, self.owner, RUNNING)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, error):
+        """Record a failed attempt, requeueing the job after a backoff delay if it has attempts left.
+
+        Returns False if this owner lost the job's lease.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+                "not_before = ? + ? * (1 << (attempts - 1)), lease_expires_at = NULL, "
+                "error = ?, updated_at = ? WHERE id = ? AND owner = ? AND status = ?",
+                (self.max_attempts, QUEUED, FAILED, now, self.retry_delay, str(error), now,
+                 job_id, self.owner, RUNNING)
+            )
+            return cursor.rowcount == 1
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it does not exist."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, kind, payload, status, stage, result, error, attempts, created_at, updated_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "payload": json.loads(row[2]),
+            "status": row[3],
+            "stage": row[4],
+            "result": json.loads(row[5]) if row[5] is not None else None,
+            "error": row[6],
+            "attempts": row[7],
+            "created_at": row[8],
+            "updated_at": row[9]
+        }
+
+    def requeue_expired(self):
+        """Requeue running jobs whose lease has expired and return how many there were.
+
+        claim() does this itself; calling it is only needed to update job
+        statuses while no worker is claiming.
+        """
+        with self._connect() as conn:
+            return self._expire_leases(conn, time.time())
+
+    def run_stage(self, key, compute, is_valid=None):
+        """Return the stored result of a stage, computing and storing it if needed.
+
+        Concurrent calls with the same key, in this or any other process using
+        the database, run ``compute`` once; the others wait for its result. A
+        claim whose process died expires after ``lease_seconds`` and the stage
+        is computed again. ``is_valid`` can reject a stored result, such as a
+        path to a file that has since been deleted, so it is computed again.
+        Results must be JSON-serializable.
+        """
+        value = self._stage_result(key, is_valid)
+        if value is not None:
+            return value
+        with self._stage_lock(key):
+            while not self._claim_stage(key):
+                value = self._stage_result(key, is_valid)
+                if value is not None:
+                    return value
+                time.sleep(STAGE_POLL_SECONDS)
+            try:
+                # Another process may have finished the stage between our checks
+                value = self._stage_result(key, is_valid)
+                if value is None:
+                    with self._renewing_stage_claim(key):
+                        value = compute()
+                    with self._connect() as conn:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO stage_results (key, value, created_at) VALUES (?, ?, ?)",
+                            (key, json.dumps(value), time.time())
+                        )
+            finally:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM stage_claims WHERE key = ? AND owner = ?", (key, self.owner))
+        return value
+
+    def stats(self):
+        """Return the number of jobs in each status."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def _expire_leases(self, conn, now):
+        """Requeue, or fail when out of attempts, running jobs whose owner stopped renewing them."""
+        cursor = conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+            "error = CASE WHEN attempts < ? THEN error ELSE ? END, owner = NULL, lease_expires_at = NULL, "
+            "updated_at = ? WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+            (self.max_attempts, QUEUED, FAILED, self.max_attempts, "Worker stopped while running the job",
+             now, RUNNING, now)
+        )
+        return cursor.rowcount
+
+    def _stage_result(self, key, is_valid):
+        """Return a stored stage result, or None if it is missing or no longer valid."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM stage_results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        if is_valid is not None and not is_valid(value):
+            return None
+        return value
+
+    @contextmanager
+    def _stage_lock(self, key):
+        """Serialize work on one stage key within this process.
+
+        Locks are reference counted and dropped once no thread holds or waits
+        for them, so they do not accumulate over a long-running process.
+        """
+        with self._stage_locks_guard:
+            entry = self._stage_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._stage_locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._stage_locks[key]
+
+    def _claim_stage(self, key):
+        """Claim a stage key for this owner; return False if another owner holds an unexpired claim."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO stage_claims (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE stage_claims.expires_at < ?",
+                (key, self.owner, now + self.lease_seconds, now)
+            )
+            return cursor.rowcount == 1
+
+    @contextmanager
+    def _renewing_stage_claim(self, key):
+        """Keep renewing this owner's claim on a stage key while the block runs."""
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(self.lease_seconds / 3):
+                try:
+                    with self._connect() as conn:
+                        conn.execute("UPDATE stage_claims SET expires_at = ? WHERE key = ? AND owner = ?",
+                                     (time.time() + self.lease_seconds, key, self.owner))
+                except sqlite3.Error:
+                    # The next attempt may succeed before the claim expires
+                    continue
+
+        thread = threading.Thread(target=renew, name="stage-claim-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and always closes."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
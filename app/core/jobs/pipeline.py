@@ -0,0 +1,132 @@
+import hashlib
+import os
+from contextlib import nullcontext
+
+from app.core.data_collection.video_collector import AUDIO_EXTENSIONS, youtube_video_id
+
+class VideoPipeline:
+    def __init__(self, video_collector, transcriber, preprocessor, summarizer, job_queue=None,
+                 segment_tokens=3000, audio_only=True):
+        """Initialize the video-to-summary pipeline.
+
+        Each stage is a separate method so callers can run them in their own
+        workers. With a ``job_queue`` every stage result is stored under a key
+        derived from its input, so two jobs for the same video download,
+        extract and transcribe it only once, even when they run concurrently.
+        With ``audio_only`` YouTube downloads fetch only the audio stream, which
+        the transcriber reads directly, so there is no audio extraction step.
+        """
+        self.video_collector = video_collector
+        self.transcriber = transcriber
+        self.preprocessor = preprocessor
+        self.summarizer = summarizer
+        self.job_queue = job_queue
+        self.segment_tokens = segment_tokens
+        self.audio_only = audio_only
+
+    def run(self, kind, payload, on_stage=None):
+        """Run every stage for a ``youtube`` (``url``) or ``upload`` (``path``) payload.
+
+        ``on_stage`` is called with the name of each stage as it starts.
+        Returns the raw summary.
+        """
+        on_stage = on_stage or (lambda stage: None)
+        if kind not in ("youtube", "upload"):
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        # Keep the downloaded media and extracted audio from being evicted while the job uses them
+        with self._media_reference(self._download_key(payload["url"]) if kind == "youtube" else None):
+            if kind == "youtube":
+                on_stage("download")
+                video_path = self.download(payload["url"])
+            else:
+                video_path = payload["path"]
+
+            with self._media_reference(self._audio_key(video_path)):
+                on_stage("extract_audio")
+                audio_path = self.extract_audio(video_path)
+                on_stage("transcribe")
+                transcript = self.transcribe(audio_path)
+        on_stage("summarize")
+        return self.summarize(transcript)
+
+    def download(self, url):
+        """Download a YouTube video, or only its audio, once per video ID and return its path."""
+        video_id = youtube_video_id(url)
+
+        def compute():
+            if self.audio_only:
+                path = self.video_collector.download_audio_from_youtube(url, output_filename=f"{video_id}.m4a")
+            else:
+                path = self.video_collector.download_from_youtube(url, output_filename=f"{video_id}.mp4")
+            if not path or not os.path.exists(path):
+                raise RuntimeError(f"Download failed: {url}")
+            return path
+
+        stage = "download-audio" if self.audio_only else "download"
+        return self._stage(f"{stage}:{video_id}", compute, os.path.exists)
+
+    def extract_audio(self, video_path):
+        """Extract the audio track of a video once per file and return its path.
+
+        Audio files are returned unchanged.
+        """
+        if os.path.splitext(video_path)[1].lower() in AUDIO_EXTENSIONS:
+            return video_path
+        key = file_key(video_path)
+
+        def compute():
+            path = self.video_collector.extract_audio(video_path, output_filename=f"{key}.mp3")
+            if not path or not os.path.exists(path):
+                raise RuntimeError(f"Audio extraction failed: {video_path}")
+            return path
+
+        return self._stage(f"audio:{key}", compute, os.path.exists)
+
+    def transcribe(self, audio_path):
+        """Transcribe an audio file once per file and return the text."""
+        return self._stage(f"transcript:{file_key(audio_path)}",
+                           lambda: self.transcriber.transcribe(audio_path))
+
+    def summarize(self, transcript):
+        """Clean, segment and summarize a transcript once per transcript and model."""
+        model = getattr(self.summarizer, "model", None)
+        digest = hashlib.sha256(f"{model}\0{self.segment_tokens}\0{transcript}".encode()).hexdigest()
+
+        def compute():
+            cleaned_text = self.preprocessor.clean_transcript(transcript)
+            segments = self.preprocessor.segment_by_topics(cleaned_text, max_tokens=self.segment_tokens)
+            return self.summarizer.summarize(segments)
+
+        return self._stage(f"summary:{digest}", compute)
+
+    def _media_reference(self, key):
+        """Return a context that holds a media store reference to a key, if there is a store and a key."""
+        if key is None:
+            return nullcontext()
+        return self.video_collector.media_reference(key)
+
+    def _download_key(self, url):
+        """Return the media store key of a YouTube URL's download."""
+        kind = "audio" if self.audio_only else "video"
+        return f"youtube:{youtube_video_id(url)}:{kind}"
+
+    def _audio_key(self, video_path):
+        """Return the media store key of a video's extracted audio, or None if no extraction is needed."""
+        if os.path.splitext(video_path)[1].lower() in AUDIO_EXTENSIONS:
+            return None
+        if getattr(self.video_collector, "media_store", None) is None:
+            return None
+        return self.video_collector.audio_key(video_path)
+
+    def _stage(self, key, compute, is_valid=None):
+        """Run a stage through the job queue's stage store when there is one."""
+        if self.job_queue is None:
+            return compute()
+        return self.job_queue.run_stage(key, compute, is_valid)
+
+def file_key(path):
+    """Return a short key identifying a file by its path, size and modification time."""
+    stat = os.stat(path)
+    identity = f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return hashlib.sha256(identity.encode()).hexdigest()[:16]
@@ -0,0 +1,105 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between retries while the job database keeps failing
+MAX_ERROR_BACKOFF = 60
+
+class JobWorkerPool:
+    def __init__(self, job_queue, handler, num_workers=2, poll_interval=1.0):
+        """Initialize a pool of worker threads that drain a JobQueue.
+
+        ``handler(job, set_stage)`` runs one claimed job and returns its result;
+        ``set_stage(name)`` records progress. Exceptions mark the attempt failed
+        and the queue decides whether the job is retried. Errors from the queue
+        itself, such as a locked database, are logged and retried with
+        exponential backoff instead of stopping the worker. A heartbeat thread
+        renews the leases of running jobs, so other processes only take them
+        over if this one dies.
+        """
+        self.job_queue = job_queue
+        self.handler = handler
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads and the lease heartbeat."""
+        self._stop.clear()
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def notify(self):
+        """Wake idle workers after a job is submitted."""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """Stop the workers after their current jobs finish.
+
+        Jobs still running when the process exits are taken over by any
+        process once their leases expire.
+        """
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _work(self):
+        """Claim and run jobs until stopped."""
+        errors = 0
+        while not self._stop.is_set():
+            try:
+                job = self.job_queue.claim()
+            except Exception as e:
+                errors += 1
+                logger.error(f"Could not claim a job: {e}")
+                self._stop.wait(min(self.poll_interval * 2 ** errors, MAX_ERROR_BACKOFF))
+                continue
+            errors = 0
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        """Run one claimed job and record its outcome."""
+        job_id = job["id"]
+        logger.info(f"Running job {job_id} ({job['kind']}, attempt {job['attempts']})")
+        try:
+            result = self.handler(job, lambda stage: self.job_queue.set_stage(job_id, stage))
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            try:
+                if not self.job_queue.fail(job_id, e):
+                    logger.warning(f"Job {job_id} lease was lost; another worker has taken it over")
+            except Exception as record_error:
+                logger.error(f"Could not record failure of job {job_id}, it is retried once its lease "
+                             f"expires: {record_error}")
+            return
+        try:
+            if self.job_queue.complete(job_id, result):
+                logger.info(f"Job {job_id} done")
+            else:
+                logger.warning(f"Job {job_id} finished after its lease was lost; result discarded")
+        except Exception as e:
+            logger.error(f"Could not store result of job {job_id}, it is run again once its lease "
+                         f"expires: {e}")
+
+    def _heartbeat(self):
+        """Renew the leases of this process's running jobs until stopped."""
+        interval = self.job_queue.lease_seconds / 3
+        while not self._stop.wait(interval):
+            try:
+                self.job_queue.renew()
+            except Exception as e:
+                logger.error(f"Could not renew job leases: {e}")
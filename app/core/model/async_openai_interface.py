@@ -0,0 +1,216 @@
+import asyncio
+import uuid
+import httpx
+from contextlib import aclosing
+from openai import AsyncOpenAI
+
+from app.core.few_shot.token_counter import TokenCounter
+from app.core.model.openai_interface import (RETRYABLE_ERRORS, REQUEST_MAX_TRIES, STREAM_MAX_TRIES,
+                                             ResumableStream, retry_delay)
+from app.core.model.rate_limiter import INTERACTIVE
+from app.core.monitoring.metrics import metrics
+
+class AsyncGPTInterface:
+    def __init__(self, api_key, model="gpt-3.5-turbo", cache=None, max_concurrency=64,
+                 max_connections=100, max_keepalive_connections=20, timeout=60.0, connect_timeout=10.0,
+                 rate_limiter=None, priority=INTERACTIVE):
+        """Initialize an asyncio GPT interface over a shared, pooled HTTP client.
+
+        All requests go through one ``httpx.AsyncClient`` whose connection pool
+        holds at most ``max_connections`` connections, and at most
+        ``max_concurrency`` requests are in flight at once; the rest wait on a
+        semaphore instead of opening more sockets. ``timeout`` bounds each
+        request and ``connect_timeout`` bounds connection setup. Failed calls
+        are retried with exponential backoff using ``asyncio.sleep``, so a slow
+        or failing request never blocks the event loop. A RateLimiter is used
+        as in GPTInterface, polling it without holding a concurrency slot.
+        """
+        self.model = model
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.priority = priority
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive_connections),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout)
+        )
+        # Retries are handled here so they share the concurrency limit
+        self.client = AsyncOpenAI(api_key=api_key, http_client=self.http_client, max_retries=0)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._token_counter = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        """Close the pooled HTTP client."""
+        await self.http_client.aclose()
+
+    async def generate_completion(self, prompt, max_tokens=1000, temperature=0.7, cacheable=None):
+        """Generate a completion, serving deterministic or cacheable requests from the cache.
+
+        Caching follows GPTInterface.generate_completion. Cache lookups run in a
+        worker thread because the cache is backed by SQLite.
+        """
+        prompt_tokens = self._check_prompt_size(prompt, max_tokens)
+        if cacheable is None:
+            cacheable = temperature == 0
+        if self.cache is None or not cacheable:
+            return await self._request_completion(prompt, max_tokens, temperature, prompt_tokens)
+
+        key = self.cache.make_key(self.model, prompt, max_tokens, temperature)
+        completion = await asyncio.to_thread(self.cache.get, key)
+        metrics.record_cache("completion", completion is not None)
+        if completion is None:
+            completion = await self._request_completion(prompt, max_tokens, temperature, prompt_tokens)
+            if completion is not None:
+                await asyncio.to_thread(self.cache.set, key, completion)
+        return completion
+
+    async def stream_completion(self, prompt, max_tokens=1000, temperature=0.7, cacheable=None):
+        """Generate a completion, yielding text deltas as they arrive.
+
+        Caching and resuming after a broken stream follow
+        GPTInterface.stream_completion; waits between attempts use asyncio.sleep.
+        """
+        prompt_tokens = self._check_prompt_size(prompt, max_tokens)
+        if cacheable is None:
+            cacheable = temperature == 0
+        key = None
+        if self.cache is not None and cacheable:
+            key = self.cache.make_key(self.model, prompt, max_tokens, temperature)
+            completion = await asyncio.to_thread(self.cache.get, key)
+            metrics.record_cache("completion", completion is not None)
+            if completion is not None:
+                yield completion
+                return
+
+        stream = ResumableStream(prompt, prompt_tokens, max_tokens, self._token_counter)
+        deltas = metrics.timed_async_stream("generate", self._stream_attempts(stream, temperature),
+                                            first_stage="first_token")
+        # Closed explicitly so an abandoned stream settles its reservation right away
+        async with aclosing(deltas):
+            async for delta in deltas:
+                yield delta
+
+        if key is not None and stream.parts:
+            await asyncio.to_thread(self.cache.set, key, stream.text)
+
+    async def _stream_attempts(self, stream, temperature):
+        """Stream a completion, resuming it after a broken stream; see GPTInterface._stream_attempts."""
+        for attempt in range(1, STREAM_MAX_TRIES + 1):
+            request = stream.start_attempt()
+            if request is None:
+                break
+            messages, remaining = request
+            reserved_tokens = stream.attempt_prompt_tokens + remaining
+            await self._acquire(reserved_tokens)
+            response = None
+            try:
+                async with self._semaphore:
+                    response = await self.client.chat.completions.with_raw_response.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=remaining,
+                        temperature=temperature,
+                        stream=True
+                    )
+                    await self._observe(response.headers)
+                    async with response.parse() as chunks:
+                        async for chunk in chunks:
+                            delta = stream.feed(chunk)
+                            if delta:
+                                yield delta
+                delta = stream.finish_attempt()
+                if delta:
+                    yield delta
+                break
+            except RETRYABLE_ERRORS as e:
+                await self._observe(getattr(getattr(e, "response", None), "headers", None))
+                if attempt == STREAM_MAX_TRIES:
+                    raise
+                metrics.record_retry("stream", e)
+                error = e
+            finally:
+                await self._settle(reserved_tokens, self._stream_usage(stream, response))
+            await asyncio.sleep(retry_delay(error, attempt, self.rate_limiter is not None))
+
+    def _check_prompt_size(self, prompt, max_tokens):
+        """Reject a prompt locally if it cannot fit the context window with the completion.
+
+        Returns the number of prompt tokens.
+        """
+        if self._token_counter is None:
+            self._token_counter = TokenCounter(self.model)
+        return self._token_counter.check_prompt(prompt, max_tokens)
+
+    async def _request_completion(self, prompt, max_tokens, temperature, prompt_tokens):
+        """Call the chat completions API, waiting for rate-limit capacity and a free concurrency slot first."""
+        estimated_tokens = prompt_tokens + max_tokens
+        with metrics.span("generate"):
+            for attempt in range(1, REQUEST_MAX_TRIES + 1):
+                await self._acquire(estimated_tokens)
+                # A failed request has used none of its reservation
+                used_tokens = 0
+                try:
+                    async with self._semaphore:
+                        response = await self.client.chat.completions.with_raw_response.create(
+                            model=self.model,
+                            messages=[{"role": "user", "content": prompt}],
+                            max_tokens=max_tokens,
+                            temperature=temperature
+                        )
+                    await self._observe(response.headers)
+                    completion = response.parse()
+                    used_tokens = None
+                    if completion.usage is not None:
+                        metrics.record_usage(self.model, completion.usage.prompt_tokens,
+                                             completion.usage.completion_tokens)
+                        used_tokens = completion.usage.total_tokens
+                    return completion.choices[0].message.content
+                except RETRYABLE_ERRORS as e:
+                    await self._observe(getattr(getattr(e, "response", None), "headers", None))
+                    if attempt == REQUEST_MAX_TRIES:
+                        raise
+                    metrics.record_retry("completion", e)
+                    error = e
+                finally:
+                    await self._settle(estimated_tokens, used_tokens)
+                await asyncio.sleep(retry_delay(error, attempt, self.rate_limiter is not None))
+
+    def _stream_usage(self, stream, response):
+        """Record and return the tokens a stream attempt used; see GPTInterface._stream_usage."""
+        if response is None:
+            return 0
+        received_tokens = self._token_counter.count(stream.received())
+        metrics.record_usage(self.model, stream.attempt_prompt_tokens, received_tokens)
+        return stream.attempt_prompt_tokens + received_tokens
+
+    async def _acquire(self, tokens):
+        """Wait for rate-limit capacity for one request, sleeping on the event loop between polls."""
+        if self.rate_limiter is None:
+            return
+        ticket = uuid.uuid4().hex
+        try:
+            while True:
+                wait = await asyncio.to_thread(self.rate_limiter.try_acquire, ticket, tokens, self.priority)
+                if wait == 0:
+                    return
+                await asyncio.sleep(wait)
+        except BaseException:
+            # Not awaited, so a cancelled task still gives up its place
+            self.rate_limiter.cancel(ticket)
+            raise
+
+    async def _observe(self, headers):
+        """Pass a response's rate-limit headers to the rate limiter."""
+        if self.rate_limiter is not None:
+            await asyncio.to_thread(self.rate_limiter.observe, headers)
+
+    async def _settle(self, estimated_tokens, actual_tokens):
+        """Correct the rate limiter's token estimate for a finished request."""
+        if self.rate_limiter is not None:
+            await asyncio.to_thread(self.rate_limiter.settle, estimated_tokens, actual_tokens)
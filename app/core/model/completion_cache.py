@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+class CompletionCache:
+    def __init__(self, cache_path="./data/cache/completions.sqlite3", max_entries=10000,
+                 max_bytes=256 * 1024 * 1024, max_age_seconds=30 * 24 * 3600):
+        """Initialize a persistent completion cache.
+
+        Entries are content-addressed by a hash of the request parameters and
+        stored in SQLite, which serializes writers across threads and processes.
+        The cache is trimmed to ``max_entries`` and ``max_bytes`` by evicting the
+        least recently used entries, and entries older than ``max_age_seconds``
+        are never returned.
+        """
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, "
+                "completion TEXT NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_completions_accessed "
+                "ON completions (accessed_at)"
+            )
+
+    @staticmethod
+    def make_key(model, prompt, max_tokens, temperature):
+        """Return the content hash identifying a completion request."""
+        payload = json.dumps(
+            {"model": model, "prompt": prompt, "max_tokens": max_tokens,
+             "temperature": temperature},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached completion for a key, or None on a miss."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT completion, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.max_age_seconds:
+                conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute(
+                    "UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0]
+
+    def set(self, key, completion):
+        """Store a completion and evict entries beyond the configured limits."""
+        now = time.time()
+        size = len(completion.encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions "
+                "(key, completion, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, completion, size, now, now)
+            )
+            self._evict(conn, now)
+
+    def clear(self):
+        """Remove every cached completion."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM completions")
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache."""
+        with self._connect() as conn:
+            entries, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total_bytes
+        }
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then least recently used ones over the limits."""
+        conn.execute(
+            "DELETE FROM completions WHERE created_at < ?", (now - self.max_age_seconds,)
+        )
+        entries, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+        ).fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        rows = conn.execute(
+            "SELECT key, size FROM completions ORDER BY accessed_at ASC"
+        )
+        stale = []
+        for key, size in rows:
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            stale.append((key,))
+            entries -= 1
+            total_bytes -= size
+        conn.executemany("DELETE FROM completions WHERE key = ?", stale)
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that waits for concurrent writers instead of failing."""
+        conn = sqlite3.connect(self.cache_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
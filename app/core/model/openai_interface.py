@@ -1,25 +1,306 @@
 from openai import OpenAI
-import backoff
+import openai
+import httpx
+import logging
+import random
 import time
 
+from app.core.few_shot.token_counter import MESSAGE_OVERHEAD_TOKENS, TokenCounter
+from app.core.model.rate_limiter import INTERACTIVE, retry_after_seconds
+from app.core.monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: network failures and timeouts, rate limits and 5xx responses.
+# A stream that breaks mid-response raises the underlying httpx error.
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError,
+                    httpx.TransportError)
+
+REQUEST_MAX_TRIES = 5
+STREAM_MAX_TRIES = 5
+
+CONTINUE_INSTRUCTION = ("Your previous message was cut off. Continue exactly where it stopped, "
+                        "without repeating anything you already wrote.")
+
+def trim_repeated_prefix(partial, text, min_overlap=8):
+    """Drop the start of ``text`` that repeats the end of ``partial``.
+
+    Models asked to continue sometimes restate the last words they wrote, or
+    start over entirely, which repeats all of ``partial``; overlaps shorter
+    than ``min_overlap`` characters are kept because they are likely to be
+    coincidental. ``text`` must be long enough to contain the whole repeat.
+    """
+    for size in range(min(len(partial), len(text)), min_overlap - 1, -1):
+        if partial.endswith(text[:size]):
+            return text[size:]
+    return text
+
+def retry_delay(error, attempt, rate_limited=False):
+    """Return how long to wait before retrying a failed call.
+
+    The server's Retry-After is honored when the error carries one; otherwise
+    the delay is exponential with full jitter. With ``rate_limited`` the
+    Retry-After has already been passed to the rate limiter, whose next
+    acquire waits for it, so no delay is added on top.
+    """
+    response = getattr(error, "response", None)
+    delay = retry_after_seconds(getattr(response, "headers", None))
+    if delay is not None:
+        return 0.0 if rate_limited else delay
+    return random.uniform(0, 2 ** attempt)
+
+def continuation_messages(prompt, partial=""):
+    """Return the chat messages for a prompt, asking to resume after ``partial`` output if any."""
+    messages = [{"role": "user", "content": prompt}]
+    if partial:
+        messages.append({"role": "assistant", "content": partial})
+        messages.append({"role": "user", "content": CONTINUE_INSTRUCTION})
+    return messages
+
+class ResumableStream:
+    def __init__(self, prompt, prompt_tokens, max_tokens, token_counter):
+        """Track the text of a streamed completion across attempts, for resuming a broken stream.
+
+        Each attempt after the first asks the model to continue after the text
+        received so far. Its start is held back for as long as it could still be
+        repeating that text (while it occurs in it), then the repeat is trimmed,
+        so a model that restates its last words or starts over is never echoed.
+        ``attempt_prompt_tokens`` counts what the current attempt sends, which
+        for a resumed attempt includes the text received so far.
+        """
+        self.prompt = prompt
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self.parts = []
+        self.partial = ""
+        self.attempt_prompt_tokens = prompt_tokens
+        self._held = None
+
+    @property
+    def text(self):
+        """Return all text yielded so far."""
+        return "".join(self.parts)
+
+    def start_attempt(self):
+        """Begin an attempt; return its messages and token budget, or None once the budget is used up."""
+        self.partial = self.text
+        self.attempt_prompt_tokens = self.prompt_tokens
+        remaining = self.max_tokens
+        if self.partial:
+            partial_tokens = self.token_counter.count(self.partial)
+            remaining -= partial_tokens
+            # The partial output and the instruction to continue are two more messages
+            self.attempt_prompt_tokens += (partial_tokens + self.token_counter.count(CONTINUE_INSTRUCTION)
+                                           + 2 * MESSAGE_OVERHEAD_TOKENS)
+        if remaining <= 0:
+            return None
+        self._held = "" if self.partial else None
+        return continuation_messages(self.prompt, self.partial), remaining
+
+    def feed(self, chunk):
+        """Take one stream chunk and return the text to yield, possibly empty."""
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            return ""
+        if self._held is not None:
+            self._held += delta
+            if self._held in self.partial:
+                return ""
+            delta = trim_repeated_prefix(self.partial, self._held)
+            self._held = None
+        if delta:
+            self.parts.append(delta)
+        return delta
+
+    def finish_attempt(self):
+        """End a completed attempt and return any held-back text that is not a repeat."""
+        delta = trim_repeated_prefix(self.partial, self._held) if self._held else ""
+        self._held = None
+        if delta:
+            self.parts.append(delta)
+        return delta
+
+    def received(self):
+        """Return the text received in the current attempt."""
+        return self.text[len(self.partial):]
+
 class GPTInterface:
-    def __init__(self, api_key, model="gpt-3.5-turbo"):
-        """Initialize the GPT interface with API key and model."""
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key, model="gpt-3.5-turbo", cache=None, rate_limiter=None, priority=INTERACTIVE):
+        """Initialize the GPT interface with API key, model and optional completion cache.
+
+        With a RateLimiter every request first waits for capacity in the
+        ``priority`` lane, charged with its prompt tokens plus ``max_tokens``,
+        and the response's rate-limit headers and real usage are fed back.
+        """
+        # Retries are handled here so they honor the rate limiter
+        self.client = OpenAI(api_key=api_key, max_retries=0)
         self.model = model
-        
-    @backoff.on_exception(backoff.expo, Exception, max_tries=5)
-    def generate_completion(self, prompt, max_tokens=1000, temperature=0.7):
-        """Generate a completion using the GPT model with retry logic."""
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"Error calling OpenAI API: {e}")
-            time.sleep(2)  # Wait before retry
-            raise
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.priority = priority
+        self._token_counter = None
+
+    def generate_completion(self, prompt, max_tokens=1000, temperature=0.7, cacheable=None):
+        """Generate a completion, serving deterministic or cacheable requests from the cache.
+
+        By default only temperature-0 calls are cached; pass ``cacheable=True`` to
+        cache a sampled call or ``cacheable=False`` to always hit the API.
+        """
+        prompt_tokens = self._check_prompt_size(prompt, max_tokens)
+        if cacheable is None:
+            cacheable = temperature == 0
+        if self.cache is None or not cacheable:
+            return self._request_completion(prompt, max_tokens, temperature, prompt_tokens)
+
+        key = self.cache.make_key(self.model, prompt, max_tokens, temperature)
+        completion = self.cache.get(key)
+        metrics.record_cache("completion", completion is not None)
+        if completion is None:
+            completion = self._request_completion(prompt, max_tokens, temperature, prompt_tokens)
+            if completion is not None:
+                self.cache.set(key, completion)
+        return completion
+
+    def stream_completion(self, prompt, max_tokens=1000, temperature=0.7, cacheable=None):
+        """Generate a completion, yielding text deltas as they arrive.
+
+        Cached completions are yielded whole. If the stream breaks, the request
+        is retried with the text received so far as an assistant message and an
+        instruction to continue, so the output resumes instead of starting over.
+        The start of a resumed stream is held back while it may repeat earlier
+        text (see ResumableStream), so nothing already yielded is yielded again.
+        The complete text is cached under the same rules as generate_completion.
+        """
+        prompt_tokens = self._check_prompt_size(prompt, max_tokens)
+        if cacheable is None:
+            cacheable = temperature == 0
+        key = None
+        if self.cache is not None and cacheable:
+            key = self.cache.make_key(self.model, prompt, max_tokens, temperature)
+            completion = self.cache.get(key)
+            metrics.record_cache("completion", completion is not None)
+            if completion is not None:
+                yield completion
+                return
+
+        stream = ResumableStream(prompt, prompt_tokens, max_tokens, self._token_counter)
+        yield from metrics.timed_stream("generate", self._stream_attempts(stream, temperature),
+                                        first_stage="first_token")
+
+        if key is not None and stream.parts:
+            self.cache.set(key, stream.text)
+
+    def _stream_attempts(self, stream, temperature):
+        """Stream a completion, resuming it with a new request each time the stream breaks.
+
+        Timing is left to the caller, which pauses it while the consumer holds
+        each delta.
+        """
+        for attempt in range(1, STREAM_MAX_TRIES + 1):
+            request = stream.start_attempt()
+            if request is None:
+                break
+            messages, remaining = request
+            reserved_tokens = stream.attempt_prompt_tokens + remaining
+            self._acquire(reserved_tokens)
+            response = None
+            try:
+                response = self.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=remaining,
+                    temperature=temperature,
+                    stream=True
+                )
+                self._observe(response.headers)
+                with response.parse() as chunks:
+                    for chunk in chunks:
+                        delta = stream.feed(chunk)
+                        if delta:
+                            yield delta
+                delta = stream.finish_attempt()
+                if delta:
+                    yield delta
+                break
+            except RETRYABLE_ERRORS as e:
+                self._observe(getattr(getattr(e, "response", None), "headers", None))
+                if attempt == STREAM_MAX_TRIES:
+                    raise
+                metrics.record_retry("stream", e)
+                logger.warning("Error streaming from OpenAI API, resuming: %s", e)
+                error = e
+            finally:
+                self._settle(reserved_tokens, self._stream_usage(stream, response))
+            time.sleep(retry_delay(error, attempt, self.rate_limiter is not None))
+
+    def _check_prompt_size(self, prompt, max_tokens):
+        """Reject a prompt locally if it cannot fit the context window with the completion.
+
+        Returns the number of prompt tokens.
+        """
+        if self._token_counter is None:
+            self._token_counter = TokenCounter(self.model)
+        return self._token_counter.check_prompt(prompt, max_tokens)
+
+    @metrics.timed("generate")
+    def _request_completion(self, prompt, max_tokens, temperature, prompt_tokens):
+        """Call the chat completions API, retrying rate limits, server errors and network failures."""
+        estimated_tokens = prompt_tokens + max_tokens
+        for attempt in range(1, REQUEST_MAX_TRIES + 1):
+            self._acquire(estimated_tokens)
+            # A failed request has used none of its reservation
+            used_tokens = 0
+            try:
+                response = self.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                )
+                self._observe(response.headers)
+                completion = response.parse()
+                used_tokens = None
+                if completion.usage is not None:
+                    metrics.record_usage(self.model, completion.usage.prompt_tokens,
+                                         completion.usage.completion_tokens)
+                    used_tokens = completion.usage.total_tokens
+                return completion.choices[0].message.content
+            except RETRYABLE_ERRORS as e:
+                self._observe(getattr(getattr(e, "response", None), "headers", None))
+                if attempt == REQUEST_MAX_TRIES:
+                    raise
+                metrics.record_retry("completion", e)
+                logger.warning("Error calling OpenAI API, retrying: %s", e)
+                error = e
+            finally:
+                self._settle(estimated_tokens, used_tokens)
+            time.sleep(retry_delay(error, attempt, self.rate_limiter is not None))
+
+    def _stream_usage(self, stream, response):
+        """Record and return the tokens a stream attempt used, or 0 if its request was never answered.
+
+        Streams carry no usage, so the counts are local estimates. A stream
+        that broke midway, or that the consumer stopped reading, is still
+        billed for what it sent and received.
+        """
+        if response is None:
+            return 0
+        received_tokens = self._token_counter.count(stream.received())
+        metrics.record_usage(self.model, stream.attempt_prompt_tokens, received_tokens)
+        return stream.attempt_prompt_tokens + received_tokens
+
+    def _acquire(self, tokens):
+        """Wait for rate-limit capacity for one request."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(tokens, self.priority)
+
+    def _observe(self, headers):
+        """Pass a response's rate-limit headers to the rate limiter."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.observe(headers)
+
+    def _settle(self, estimated_tokens, actual_tokens):
+        """Correct the rate limiter's token estimate for a finished request."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.settle(estimated_tokens, actual_tokens)
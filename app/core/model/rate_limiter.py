@@ -0,0 +1,233 @@
+import os
+import re
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# Priority lanes: lower values are served first
+INTERACTIVE = 0
+BATCH = 1
+
+# Waiters that have not polled for this long belong to a process that went away
+WAITER_TIMEOUT = 30.0
+
+# Longest a waiter sleeps before checking the shared state again
+MAX_POLL_INTERVAL = 1.0
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+class RateLimiter:
+    def __init__(self, db_path="./data/ratelimit.sqlite3", requests_per_minute=None, tokens_per_minute=None,
+                 name="openai"):
+        """Initialize a token-bucket limiter for requests and tokens per minute.
+
+        The buckets live in SQLite, so every thread and process that opens the
+        same ``db_path`` and ``name`` draws from one budget and together stays
+        under the limits. Each bucket holds at most one minute of its limit and
+        refills continuously; a limit of None is not enforced. Callers wait in
+        priority lanes: while an INTERACTIVE request is waiting, BATCH requests
+        are not admitted, and within a lane requests are served in arrival
+        order. Rate-limit headers from the server (remaining requests and
+        tokens, Retry-After) correct the local buckets through observe().
+        """
+        self.db_path = db_path
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.name = name
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, "
+                "requests REAL NOT NULL, "
+                "tokens REAL NOT NULL, "
+                "blocked_until REAL NOT NULL DEFAULT 0, "
+                "updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS waiters ("
+                "ticket TEXT PRIMARY KEY, "
+                "name TEXT NOT NULL, "
+                "priority INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "seen_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_waiters_order ON waiters (name, priority, created_at)")
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, requests, tokens, updated_at) VALUES (?, ?, ?, ?)",
+                (name, requests_per_minute or 0, tokens_per_minute or 0, time.time())
+            )
+
+    def acquire(self, tokens, priority=BATCH):
+        """Block until one request of ``tokens`` estimated tokens fits the limits, then take it."""
+        ticket = uuid.uuid4().hex
+        try:
+            while True:
+                wait = self.try_acquire(ticket, tokens, priority)
+                if wait == 0:
+                    return
+                time.sleep(wait)
+        except BaseException:
+            self.cancel(ticket)
+            raise
+
+    def try_acquire(self, ticket, tokens, priority=BATCH):
+        """Take capacity for one request if it is this ticket's turn and it fits.
+
+        Returns 0 when the request was admitted, otherwise the number of
+        seconds to wait before trying again with the same ``ticket``; the
+        ticket keeps its place in its lane until it is admitted or cancelled.
+        """
+        # A request larger than the whole bucket could never be admitted
+        tokens = min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO waiters (ticket, name, priority, created_at, seen_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(ticket) DO UPDATE SET seen_at = excluded.seen_at",
+                (ticket, self.name, priority, now, now)
+            )
+            conn.execute("DELETE FROM waiters WHERE name = ? AND seen_at < ?", (self.name, now - WAITER_TIMEOUT))
+            first = conn.execute(
+                "SELECT ticket FROM waiters WHERE name = ? ORDER BY priority, created_at LIMIT 1",
+                (self.name,)
+            ).fetchone()[0]
+            requests, available, blocked_until = self._refill(conn, now)
+
+            wait = max(blocked_until - now, 0.0)
+            if self.requests_per_minute and requests < 1:
+                wait = max(wait, (1 - requests) * 60.0 / self.requests_per_minute)
+            if tokens and available < tokens:
+                wait = max(wait, (tokens - available) * 60.0 / self.tokens_per_minute)
+            if first != ticket:
+                # Someone ahead is waiting; let them go first
+                return min(max(wait, 0.05), MAX_POLL_INTERVAL)
+            if wait > 0:
+                return min(wait, MAX_POLL_INTERVAL)
+
+            conn.execute("UPDATE buckets SET requests = ?, tokens = ? WHERE name = ?",
+                         (requests - 1, available - tokens, self.name))
+            conn.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+        return 0
+
+    def cancel(self, ticket):
+        """Give up a ticket's place in its lane."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Return unused tokens to the bucket, or take the overrun, once a request's real usage is known."""
+        if not self.tokens_per_minute or actual_tokens is None:
+            return
+        estimated_tokens = min(estimated_tokens, self.tokens_per_minute)
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE buckets SET tokens = MIN(tokens + ?, ?) WHERE name = ?",
+                (estimated_tokens - actual_tokens, self.tokens_per_minute, self.name)
+            )
+
+    def observe(self, headers):
+        """Correct the buckets from a response's rate-limit headers.
+
+        The server's remaining requests and tokens cap the local buckets. A
+        Retry-After header, or an exhausted limit with its reset time, pauses
+        every caller until it has passed.
+        """
+        if headers is None:
+            return
+        remaining_requests = _float_header(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _float_header(headers, "x-ratelimit-remaining-tokens")
+        retry_after = retry_after_seconds(headers)
+        for remaining, reset_header in ((remaining_requests, "x-ratelimit-reset-requests"),
+                                        (remaining_tokens, "x-ratelimit-reset-tokens")):
+            reset = parse_duration(headers.get(reset_header)) if remaining is not None and remaining < 1 else None
+            if reset is not None:
+                retry_after = max(retry_after or 0.0, reset)
+        if remaining_requests is None and remaining_tokens is None and retry_after is None:
+            return
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            requests, tokens, blocked_until = self._refill(conn, now)
+            if remaining_requests is not None:
+                requests = min(requests, remaining_requests)
+            if remaining_tokens is not None:
+                tokens = min(tokens, remaining_tokens)
+            if retry_after is not None:
+                blocked_until = max(blocked_until, now + retry_after)
+            conn.execute("UPDATE buckets SET requests = ?, tokens = ?, blocked_until = ? WHERE name = ?",
+                         (requests, tokens, blocked_until, self.name))
+
+    def _refill(self, conn, now):
+        """Top up the buckets for the time since their last update and return (requests, tokens, blocked_until)."""
+        requests, tokens, blocked_until, updated_at = conn.execute(
+            "SELECT requests, tokens, blocked_until, updated_at FROM buckets WHERE name = ?", (self.name,)
+        ).fetchone()
+        elapsed = max(now - updated_at, 0.0)
+        if self.requests_per_minute:
+            requests = min(requests + elapsed * self.requests_per_minute / 60.0, self.requests_per_minute)
+        if self.tokens_per_minute:
+            tokens = min(tokens + elapsed * self.tokens_per_minute / 60.0, self.tokens_per_minute)
+        conn.execute("UPDATE buckets SET requests = ?, tokens = ?, updated_at = ? WHERE name = ?",
+                     (requests, tokens, now, self.name))
+        return requests, tokens, blocked_until
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and always closes."""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+def retry_after_seconds(headers):
+    """Return the delay a response asks for in Retry-After or retry-after-ms, or None."""
+    if headers is None:
+        return None
+    milliseconds = _float_header(headers, "retry-after-ms")
+    if milliseconds is not None:
+        return milliseconds / 1000.0
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def parse_duration(value):
+    """Parse a rate-limit reset duration such as ``1s``, ``6m0s`` or ``20ms`` into seconds."""
+    parts = DURATION_PART.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+def _float_header(headers, name):
+    """Return a numeric header value, or None if it is missing or malformed."""
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
@@ -0,0 +1,396 @@
+import json
+import time
+import bisect
+import itertools
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+PREFIX = "videorecap_"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# US dollars per million (prompt, completion) tokens; looked up by longest model name prefix
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4": (30.00, 60.00),
+    "gpt-4-32k": (60.00, 120.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# US dollars per minute of audio
+TRANSCRIPTION_PRICES = {
+    "whisper-1": 0.006,
+}
+
+# Metric name -> (Prometheus type, help text)
+METRICS = {
+    "stage_duration_seconds": ("histogram", "Time spent in each pipeline stage"),
+    "stage_errors_total": ("counter", "Pipeline stages that raised, by stage and error"),
+    "model_requests_total": ("counter", "Model API requests that returned a response"),
+    "tokens_total": ("counter", "Model tokens by model and kind (prompt or completion)"),
+    "cost_usd_total": ("counter", "Estimated model spend in US dollars"),
+    "retries_total": ("counter", "Retried model API calls by operation and error"),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result (hit or miss)"),
+    "audio_seconds_total": ("counter", "Seconds of audio transcribed through the API"),
+}
+
+_NOOP = nullcontext()
+_current_span = ContextVar("current_span", default=None)
+
+class MetricsRegistry:
+    def __init__(self, enabled=False, record_spans=False, prices=None, max_spans=100000):
+        """Initialize an in-process metrics registry.
+
+        Pipeline code reports into it through span(), timed() and the record_*
+        helpers; while ``enabled`` is False each of these returns immediately,
+        so instrumentation costs next to nothing when unused. Span durations
+        are kept as histograms per stage; with ``record_spans`` every span is
+        also kept (up to ``max_spans``) with its parent, for profiles. Costs use
+        ``prices``, US dollars per million prompt and completion tokens by model
+        name prefix, defaulting to MODEL_PRICES.
+        """
+        self.enabled = enabled
+        self.record_spans = record_spans
+        self.prices = dict(MODEL_PRICES if prices is None else prices)
+        self.max_spans = max_spans
+        self._counters = {}
+        self._histograms = {}
+        self._spans = []
+        self._span_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._origin = time.perf_counter()
+
+    def configure(self, enabled=True, record_spans=None):
+        """Turn collection on or off, and optionally span recording."""
+        self.enabled = enabled
+        if record_spans is not None:
+            self.record_spans = record_spans
+
+    def reset(self):
+        """Drop everything collected so far."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._spans.clear()
+            self._started_at = time.time()
+            self._origin = time.perf_counter()
+
+    def span(self, stage, **attributes):
+        """Return a context manager that times a pipeline stage.
+
+        ``attributes`` are kept with recorded spans only, so they do not
+        multiply the number of metric series.
+        """
+        if not self.enabled:
+            return _NOOP
+        return self._span(stage, attributes)
+
+    def timed(self, stage):
+        """Decorate a function so every call is timed as a span of ``stage``."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self._span(stage, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def timed_stream(self, stage, items, first_stage=None):
+        """Yield from ``items``, timing it as a span of ``stage`` that excludes the consumer's time.
+
+        Only the time spent producing items counts, not the time the consumer
+        holds each one between yields. With ``first_stage`` the wait for the
+        first item, such as a model's time to first token, is recorded as a
+        span of that stage too.
+        """
+        if not self.enabled:
+            yield from items
+            return
+        iterator = iter(items)
+        timer = _StreamTimer(self, stage, first_stage)
+        try:
+            while True:
+                with timer:
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+        except BaseException as e:
+            timer.fail(e)
+            raise
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+            timer.finish()
+
+    async def timed_async_stream(self, stage, items, first_stage=None):
+        """Async version of timed_stream() for an async iterable."""
+        iterator = aiter(items)
+        if not self.enabled:
+            try:
+                async for item in iterator:
+                    yield item
+            finally:
+                if hasattr(iterator, "aclose"):
+                    await iterator.aclose()
+            return
+        timer = _StreamTimer(self, stage, first_stage)
+        try:
+            while True:
+                with timer:
+                    try:
+                        item = await anext(iterator)
+                    except StopAsyncIteration:
+                        return
+                yield item
+        except BaseException as e:
+            timer.fail(e)
+            raise
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+            timer.finish()
+
+    def increment(self, name, value=1, **labels):
+        """Add to a counter."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(DURATION_BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(DURATION_BUCKETS, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def record_usage(self, model, prompt_tokens, completion_tokens):
+        """Count one model response's tokens and estimated cost."""
+        if not self.enabled:
+            return
+        self.increment("model_requests_total", model=model)
+        self.increment("tokens_total", prompt_tokens, model=model, kind="prompt")
+        self.increment("tokens_total", completion_tokens, model=model, kind="completion")
+        self.increment("cost_usd_total", self.cost(model, prompt_tokens, completion_tokens), model=model)
+
+    def record_transcription(self, model, audio_seconds):
+        """Count audio sent to a transcription API and its estimated cost."""
+        if not self.enabled or not audio_seconds:
+            return
+        self.increment("model_requests_total", model=model)
+        self.increment("audio_seconds_total", audio_seconds, model=model)
+        self.increment("cost_usd_total", TRANSCRIPTION_PRICES.get(model, 0.0) * audio_seconds / 60, model=model)
+
+    def record_retry(self, operation, error):
+        """Count a retried API call."""
+        self.increment("retries_total", operation=operation, error=type(error).__name__)
+
+    def record_cache(self, cache, hit):
+        """Count a cache lookup."""
+        self.increment("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+    def cost(self, model, prompt_tokens, completion_tokens):
+        """Return the estimated US dollar cost of a request, or 0 for unknown models."""
+        model = model or ""
+        matches = [name for name in self.prices if model.startswith(name)]
+        if not matches:
+            return 0.0
+        prompt_price, completion_price = self.prices[max(matches, key=len)]
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+    def snapshot(self):
+        """Return everything collected as a JSON-serializable dict."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(buckets), total, count) for key, (buckets, total, count)
+                          in self._histograms.items()}
+            spans = list(self._spans)
+
+        stages = {}
+        for (name, labels), (_, total, count) in histograms.items():
+            if name == "stage_duration_seconds":
+                stage = dict(labels)["stage"]
+                stages[stage] = {"count": count, "total_seconds": total, "mean_seconds": total / count,
+                                 "errors": 0}
+        models = {}
+        retries = {}
+        caches = {}
+        for (name, labels), value in counters.items():
+            labels = dict(labels)
+            if name == "stage_errors_total":
+                stages.setdefault(labels["stage"], {"count": 0, "total_seconds": 0.0, "mean_seconds": 0.0,
+                                                    "errors": 0})["errors"] += value
+            elif name in ("model_requests_total", "tokens_total", "cost_usd_total", "audio_seconds_total"):
+                entry = models.setdefault(labels["model"], {"requests": 0, "prompt_tokens": 0,
+                                                            "completion_tokens": 0, "audio_seconds": 0.0,
+                                                            "cost_usd": 0.0})
+                if name == "model_requests_total":
+                    entry["requests"] += value
+                elif name == "tokens_total":
+                    entry[f"{labels['kind']}_tokens"] += value
+                elif name == "audio_seconds_total":
+                    entry["audio_seconds"] += value
+                else:
+                    entry["cost_usd"] += value
+            elif name == "retries_total":
+                key = f"{labels['operation']}:{labels['error']}"
+                retries[key] = retries.get(key, 0) + value
+            elif name == "cache_requests_total":
+                entry = caches.setdefault(labels["cache"], {"hits": 0, "misses": 0})
+                entry["hits" if labels["result"] == "hit" else "misses"] += value
+        for entry in caches.values():
+            lookups = entry["hits"] + entry["misses"]
+            entry["hit_rate"] = entry["hits"] / lookups if lookups else 0.0
+
+        return {
+            "started_at": self._started_at,
+            "elapsed_seconds": time.perf_counter() - self._origin,
+            "stages": stages,
+            "models": models,
+            "total_cost_usd": sum(entry["cost_usd"] for entry in models.values()),
+            "retries": retries,
+            "caches": caches,
+            "spans": spans
+        }
+
+    def write_profile(self, path):
+        """Write snapshot() to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def prometheus(self):
+        """Return the collected metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(buckets), total, count) for key, (buckets, total, count)
+                          in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            if kind == "histogram":
+                series = sorted((labels, value) for (metric, labels), value in histograms.items() if metric == name)
+            else:
+                series = sorted((labels, value) for (metric, labels), value in counters.items() if metric == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for labels, value in series:
+                if kind == "histogram":
+                    buckets, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(DURATION_BUCKETS + (float("inf"),), buckets):
+                        cumulative += bucket_count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total}")
+                    lines.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+                else:
+                    lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    @contextmanager
+    def _span(self, stage, attributes):
+        """Time a stage and record it, nested under the enclosing span of this thread or task."""
+        parent = _current_span.get()
+        span_id = next(self._span_ids)
+        token = _current_span.set(span_id)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except GeneratorExit:
+            # A streaming generator whose consumer stopped early, not a failure
+            raise
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # A span held across a generator's yields can be closed from another context
+                _current_span.set(parent)
+            self._record_span(span_id, parent, stage, start, duration, error, attributes)
+
+    def _record_span(self, span_id, parent, stage, start, duration, error=None, attributes=None):
+        """Record a finished span's duration and error, and keep it if spans are recorded."""
+        self.observe("stage_duration_seconds", duration, stage=stage)
+        if error is not None:
+            self.increment("stage_errors_total", stage=stage, error=error)
+        if self.record_spans:
+            with self._lock:
+                if len(self._spans) < self.max_spans:
+                    self._spans.append({
+                        "id": span_id,
+                        "parent": parent,
+                        "stage": stage,
+                        "start_seconds": start - self._origin,
+                        "duration_seconds": duration,
+                        "thread": threading.current_thread().name,
+                        "error": error,
+                        "attributes": attributes or {}
+                    })
+
+class _StreamTimer:
+    def __init__(self, registry, stage, first_stage):
+        """Accumulate the time a stream spends producing items, entered around each wait for one."""
+        self.registry = registry
+        self.stage = stage
+        self.first_stage = first_stage
+        self.parent = _current_span.get()
+        self.span_id = next(registry._span_ids)
+        self.start = time.perf_counter()
+        self.busy = 0.0
+        self.error = None
+        self._resumed = None
+
+    def __enter__(self):
+        self._resumed = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.busy += time.perf_counter() - self._resumed
+        if self.first_stage is not None:
+            self.registry._record_span(next(self.registry._span_ids), self.span_id, self.first_stage,
+                                       self.start, self.busy)
+            self.first_stage = None
+        return False
+
+    def fail(self, error):
+        """Note the error the stream raised; a consumer that stopped early is not a failure."""
+        if not isinstance(error, GeneratorExit):
+            self.error = type(error).__name__
+
+    def finish(self):
+        """Record the stream's span."""
+        self.registry._record_span(self.span_id, self.parent, self.stage, self.start, self.busy, self.error)
+
+def _labels(labels):
+    """Format label pairs as ``{name="value",...}``."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _escape(value):
+    """Escape a label value for the exposition format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# The process-wide registry; disabled until an entry point configures it
+metrics = MetricsRegistry()
@@ -0,0 +1,199 @@
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+DEFAULT_FILLER_WORDS = ['um', 'uh', 'ah', 'like', 'you know', 'actually', 'basically', 'literally']
+# Timestamps such as [00:15:30]
+DEFAULT_TIMESTAMP_PATTERNS = [r'\[\d{2}:\d{2}:\d{2}\]']
+# Speaker identifications such as "Speaker 1: "
+DEFAULT_SPEAKER_PATTERNS = [r'Speaker \d+: ']
+
+class TranscriptCleaner:
+    def __init__(self, filler_words=None, timestamp_patterns=None, speaker_patterns=None,
+                 lookahead=64):
+        """Initialize the cleaner and compile its single-pass pattern.
+
+        Filler words are matched case-insensitively on word boundaries;
+        timestamp and speaker patterns are regular expressions matched as given.
+        ``lookahead`` is the longest removable token the streaming API has to
+        hold back at a chunk boundary. It is raised to cover every filler word
+        and the longest match of every pattern; for patterns with unbounded
+        repeats, such as ``Speaker \\d+: ``, only matches up to ``lookahead``
+        characters are guaranteed to be found across chunk boundaries.
+        """
+        self.filler_words = list(DEFAULT_FILLER_WORDS if filler_words is None else filler_words)
+        self.timestamp_patterns = list(DEFAULT_TIMESTAMP_PATTERNS if timestamp_patterns is None
+                                       else timestamp_patterns)
+        self.speaker_patterns = list(DEFAULT_SPEAKER_PATTERNS if speaker_patterns is None
+                                     else speaker_patterns)
+        patterns = self.timestamp_patterns + self.speaker_patterns
+        self.lookahead = max([lookahead] + [len(word) + 1 for word in self.filler_words] +
+                             [_max_match_length(pattern) + 1 for pattern in patterns])
+
+        removals = [f'(?:{pattern})' for pattern in patterns]
+        # Characters a removable token can start with, used to skip positions quickly.
+        # None when some configured pattern has no recognizable literal first character.
+        first_chars = {_literal_first_char(pattern) for pattern in patterns}
+        if self.filler_words:
+            # Longest first so multi-word fillers win over their prefixes. As in the old
+            # multi-pass cleaner, a filler must end on a word boundary once the timestamps
+            # and labels after it are removed, so "like[00:00:01]cats" keeps "like". Unlike
+            # it, text before a filler is not re-joined across removed tokens:
+            # "a[00:00:01]like" drops "like" and "l[00:00:01]ike" is not a filler.
+            words = sorted(self.filler_words, key=len, reverse=True)
+            word_starts = {char for word in words for char in (word[0].lower(), word[0].upper())}
+            first_chars |= word_starts
+            word_end = r'\b'
+            if removals:
+                # No word character after the run of tokens that directly follows
+                tokens = '|'.join(removals)
+                word_end = r'\b(?!(?:' + tokens + r')*(?!' + tokens + r')\w)'
+            # Case-insensitive alternations are slow to try at every position, so the
+            # fillers are guarded by a lookahead on their first letters
+            removals.append(_char_class_lookahead(word_starts) + r'(?i:\b(?:' +
+                            '|'.join(re.escape(word) for word in words) + r')' + word_end + ')')
+
+        # Whitespace that needs normalizing: anything but a lone space
+        irregular_space = r'(?:\s{2,}|[^\S ])\s*'
+        if removals:
+            self._token_pattern = re.compile('|'.join(removals))
+            # A run of removable tokens with the whitespace around them is replaced in
+            # one match; groups 1 and 2 record whether it contained any whitespace
+            # outside the tokens. Lone spaces between words are never matched.
+            token_run = r'(\s*)(?:' + self._token_pattern.pattern + r')(?:(\s+)|' + \
+                self._token_pattern.pattern + r')*'
+            prefix = ''
+            if None not in first_chars:
+                prefix = _char_class_lookahead(first_chars, r'\s')
+            self._run_pattern = re.compile(prefix + '(?:' + token_run + '|' + irregular_space + ')')
+        else:
+            self._token_pattern = None
+            self._run_pattern = re.compile(irregular_space)
+
+    def clean(self, text):
+        """Remove timestamps, speaker labels and filler words, and collapse whitespace."""
+        return self._run_pattern.sub(self._replace_run, text).strip()
+
+    def clean_stream(self, chunks):
+        """Clean an iterable of text chunks, yielding cleaned text with bounded memory."""
+        stream = CleanerStream(self)
+        for chunk in chunks:
+            cleaned = stream.feed(chunk)
+            if cleaned:
+                yield cleaned
+        cleaned = stream.close()
+        if cleaned:
+            yield cleaned
+
+    @staticmethod
+    def _replace_run(match):
+        """Collapse a run to one space if it contained whitespace, otherwise drop it."""
+        if match.lastindex is None:
+            return ' '
+        return ' ' if match.group(1) or match.group(2) is not None else ''
+
+def _max_match_length(pattern):
+    """Return the longest match of a regex, or its shortest if it has unbounded repeats."""
+    shortest, longest = sre_parse.parse(pattern).getwidth()
+    return shortest if longest >= sre_parse.MAXREPEAT else longest
+
+def _literal_first_char(pattern):
+    """Return the literal character a regex must start with, or None if unknown."""
+    if '|' in pattern:
+        return None
+    if pattern[:1] == '\\' and len(pattern) > 1 and not pattern[1].isalnum():
+        return pattern[1]
+    if pattern[:1].isalnum() and pattern[1:2] not in ('?', '*', '{'):
+        return pattern[0]
+    return None
+
+def _char_class_lookahead(chars, extra=''):
+    """Build a lookahead that only succeeds before one of the given characters."""
+    return '(?=[' + extra + ''.join(re.escape(char) for char in sorted(chars)) + '])'
+
+class CleanerStream:
+    # Buffer size at which text without any whitespace is cut regardless
+    max_buffer = 1024 * 1024
+
+    def __init__(self, cleaner):
+        """Initialize an incremental cleaning session for one transcript."""
+        self.cleaner = cleaner
+        self._buffer = ''
+        self._started = False
+        self._pending_space = False
+
+    def feed(self, chunk):
+        """Add a chunk of raw text and return the cleaned text that is now final.
+
+        Text within ``lookahead`` characters of the end is held back, and cuts
+        are only made at the start of a whitespace run outside any removable
+        token, so matches that straddle chunk boundaries are handled the same
+        way as in a single pass.
+        """
+        self._buffer += chunk
+        cut = self._safe_cut()
+        if cut <= 0:
+            return ''
+        head, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return self._emit(head)
+
+    def close(self):
+        """Flush and return the cleaned remainder of the transcript."""
+        head, self._buffer = self._buffer, ''
+        return self._emit(head, final=True)
+
+    def _safe_cut(self):
+        """Return the buffer offset up to which text can be cleaned independently."""
+        buffer = self._buffer
+        limit = len(buffer) - self.cleaner.lookahead
+        if limit <= 0:
+            return 0
+
+        cut = self._whitespace_start(limit)
+        if cut <= 0:
+            return limit if len(buffer) > self.max_buffer else 0
+
+        # Never split a removable token that itself contains whitespace
+        token_pattern = self.cleaner._token_pattern
+        while cut > 0 and token_pattern is not None:
+            straddling = None
+            for match in token_pattern.finditer(buffer, max(0, cut - self.cleaner.lookahead),
+                                                cut + self.cleaner.lookahead):
+                if match.start() >= cut:
+                    break
+                if cut < match.end():
+                    straddling = match
+                    break
+            if straddling is None:
+                break
+            cut = self._whitespace_start(straddling.start())
+        return cut
+
+    def _whitespace_start(self, limit):
+        """Find the last whitespace run starting at or before ``limit``."""
+        buffer = self._buffer
+        floor = max(0, limit - self.cleaner.lookahead)
+        position = limit
+        while position > floor:
+            if buffer[position].isspace() and not buffer[position - 1].isspace():
+                return position
+            position -= 1
+        return 0
+
+    def _emit(self, text, final=False):
+        """Clean a piece of text and join it to the output with a single space."""
+        cleaned = self.cleaner._run_pattern.sub(self.cleaner._replace_run, text)
+        core = cleaned.strip()
+        if not core:
+            if not final:
+                self._pending_space = self._pending_space or ' ' in cleaned
+            return ''
+
+        if self._started and (self._pending_space or cleaned[0] == ' '):
+            core = ' ' + core
+        self._started = True
+        self._pending_space = cleaned[-1] == ' '
+        return core
@@ -1,49 +1,95 @@
 import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import sent_tokenize, word_tokenize
+import logging
+
+from app.core.preprocessing.cleaner import TranscriptCleaner
+from app.core.monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Fallback sentence boundary used when the NLTK punkt model is not installed
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=\S)')
+
+def nltk_resource_available(resource):
+    """Check whether an NLTK resource is installed locally, without downloading it."""
+    try:
+        import nltk
+        nltk.data.find(resource)
+        return True
+    except (ImportError, LookupError):
+        return False
 
 class TextPreprocessor:
-    def __init__(self):
-        """Initialize the text preprocessor."""
-        nltk.download('punkt', quiet=True)
-        nltk.download('stopwords', quiet=True)
-        self.stop_words = set(stopwords.words('english'))
-        
+    def __init__(self, cleaner=None, token_counter=None):
+        """Initialize the text preprocessor with an optional configured TranscriptCleaner.
+
+        ``token_counter`` maps text to its token count for the target model,
+        such as ``TokenCounter(model).count``; segment token budgets fall back
+        to a word-based estimate without it. NLTK and its resources are loaded
+        on first use and only from the local data path; install them once with
+        ``python -m nltk.downloader punkt stopwords``.
+        """
+        self.cleaner = cleaner or TranscriptCleaner()
+        self.token_counter = token_counter
+        self._stop_words = None
+        self._sent_tokenize = None
+
+    @property
+    def stop_words(self):
+        """English stopwords from NLTK, or an empty set if they are not installed."""
+        if self._stop_words is None:
+            if nltk_resource_available('corpora/stopwords'):
+                from nltk.corpus import stopwords
+                self._stop_words = set(stopwords.words('english'))
+            else:
+                logger.warning("NLTK stopwords not installed; continuing without stopwords")
+                self._stop_words = set()
+        return self._stop_words
+
+    @metrics.timed("clean")
     def clean_transcript(self, text):
         """Clean the transcript by removing timestamps, filler words, etc."""
-        # Remove timestamps (e.g., [00:15:30])
-        text = re.sub(r'\[\d{2}:\d{2}:\d{2}\]', '', text)
-        # Remove speaker identifications (e.g., "Speaker 1: ")
-        text = re.sub(r'Speaker \d+: ', '', text)
-        # Remove filler words
-        filler_words = ['um', 'uh', 'ah', 'like', 'you know', 'actually', 'basically', 'literally']
-        for word in filler_words:
-            text = re.sub(r'\b' + word + r'\b', '', text, flags=re.IGNORECASE)
-        # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        return text
-    
-    def segment_by_topics(self, text, min_sentences=3):
-        """Segment the transcript into logical sections based on topics."""
-        sentences = sent_tokenize(text)
-        segments = []
-        current_segment = []
-        
-        for sentence in sentences:
-            current_segment.append(sentence)
-            if len(current_segment) >= min_sentences and self._is_segment_break(sentence):
-                segments.append(' '.join(current_segment))
-                current_segment = []
-        
-        # Add any remaining sentences
-        if current_segment:
-            segments.append(' '.join(current_segment))
-            
-        return segments
-    
-    def _is_segment_break(self, sentence):
-        """Check if a sentence is likely to be a segment break."""
-        segment_indicators = ['next', 'now let\'s', 'moving on', 'let\'s talk about', 'in this section', 'chapter']
-        return any(indicator in sentence.lower() for indicator in segment_indicators)
+        return self.cleaner.clean(text)
+
+    def clean_transcript_stream(self, chunks):
+        """Clean a transcript given as an iterable of chunks, yielding cleaned text."""
+        return self.cleaner.clean_stream(chunks)
+
+    @metrics.timed("segment")
+    def segment_by_topics(self, text, min_sentences=3, max_tokens=None, token_counter=None):
+        """Segment the transcript into logical sections based on topics.
+
+        Boundaries come from lexical cohesion between neighbouring sentence
+        windows (see TopicSegmenter). With ``max_tokens`` every segment is kept
+        within that many tokens, as counted by ``token_counter`` or the
+        preprocessor's own, so it fits a single model request.
+        """
+        from app.core.preprocessing.topic_segmenter import TopicSegmenter
+        segmenter = TopicSegmenter(
+            min_sentences=min_sentences,
+            max_tokens=max_tokens,
+            token_counter=token_counter or self.token_counter,
+            stop_words=self.stop_words
+        )
+        return segmenter.segment(self.split_sentences(text))
+
+    def split_sentences(self, text):
+        """Split text into sentences with NLTK punkt, or a regex if it is not installed."""
+        if self._sent_tokenize is None:
+            if nltk_resource_available('tokenizers/punkt') or nltk_resource_available('tokenizers/punkt_tab'):
+                from nltk.tokenize import sent_tokenize
+                self._sent_tokenize = sent_tokenize
+            else:
+                logger.warning("NLTK punkt not installed; using regex sentence splitting")
+                self._sent_tokenize = self._regex_sent_tokenize
+        try:
+            return self._sent_tokenize(text)
+        except LookupError:
+            # Newer NLTK releases need punkt_tab rather than punkt
+            logger.warning("NLTK punkt_tab not installed; using regex sentence splitting")
+            self._sent_tokenize = self._regex_sent_tokenize
+            return self._sent_tokenize(text)
+
+    @staticmethod
+    def _regex_sent_tokenize(text):
+        """Split text on sentence-ending punctuation followed by whitespace."""
+        return [sentence for sentence in SENTENCE_BOUNDARY.split(text) if sentence]
@@ -0,0 +1,238 @@
+import re
+import itertools
+from collections import defaultdict
+import numpy as np
+
+# Words, plus the separator placed between sentences before tokenizing
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+|\x00")
+SENTENCE_SEPARATOR = "\x00"
+
+class TopicSegmenter:
+    def __init__(self, window=10, smoothing=2, dims=256, min_sentences=3, cutoff_std=1.0,
+                 max_tokens=None, token_counter=None, stop_words=None, block_size=4096):
+        """Initialize a TextTiling-style segmenter.
+
+        Sentences are turned into hashed term-count vectors of ``dims``
+        dimensions. For every gap between sentences the cosine similarity of the
+        ``window`` sentences before and after it is computed, smoothed, and
+        converted into a depth score. Valleys deeper than the mean valley depth
+        plus ``cutoff_std`` standard deviations become segment boundaries, at
+        least ``min_sentences`` apart. If ``max_tokens`` is set, segments above
+        that budget are split further at their deepest gaps so each one fits a
+        single model request; a single sentence above it is split between words
+        by segment() and fit_budget(). ``token_counter`` maps text to its token
+        count and defaults to a word-based estimate.
+        """
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = window
+        self.smoothing = smoothing
+        self.dims = dims
+        self.min_sentences = max(1, min_sentences)
+        self.cutoff_std = cutoff_std
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self.stop_words = frozenset(stop_words or ())
+        self.block_size = block_size
+
+    def segment(self, sentences):
+        """Group sentences into topic segments and return them as strings."""
+        starts = [0] + self.boundaries(sentences) + [len(sentences)]
+        return [piece for a, b in zip(starts, starts[1:]) if b > a
+                for piece in self.fit_budget(' '.join(sentences[a:b]))]
+
+    def boundaries(self, sentences):
+        """Return the indices of the sentences that start a new segment.
+
+        With ``max_tokens`` every segment of several sentences is within the
+        budget, but a single sentence above it is a segment of its own; pass
+        the segments through fit_budget() to split those.
+        """
+        n = len(sentences)
+        if n < 2:
+            return []
+
+        counts, word_counts = self._term_counts(sentences)
+        depth = self.depth_scores(counts)
+        boundaries = self._select_boundaries(depth)
+
+        if self.max_tokens:
+            tokens = self._token_counts(sentences, word_counts)
+            boundaries = self._enforce_budget(boundaries, depth, tokens)
+        return boundaries
+
+    def depth_scores(self, counts):
+        """Return the depth score of every gap, where gap ``g`` precedes sentence ``g + 1``."""
+        similarity = self._smooth(self._gap_similarities(counts))
+        n_gaps = len(similarity)
+        index = np.arange(n_gaps)
+
+        # Climb left from each gap while the similarity keeps rising
+        left_start = np.ones(n_gaps, dtype=bool)
+        left_start[1:] = similarity[:-1] < similarity[1:]
+        left_peak = similarity[np.maximum.accumulate(np.where(left_start, index, 0))]
+
+        # Climb right from each gap while the similarity keeps rising
+        right_stop = np.ones(n_gaps, dtype=bool)
+        right_stop[:-1] = similarity[1:] < similarity[:-1]
+        right_index = np.where(right_stop, index, n_gaps - 1)
+        right_peak = similarity[np.minimum.accumulate(right_index[::-1])[::-1]]
+
+        return (left_peak - similarity) + (right_peak - similarity)
+
+    def _term_counts(self, sentences):
+        """Build the (dims x sentences) hashed term-count matrix and per-sentence word counts.
+
+        Column ``window + 1 + i`` holds sentence ``i``. The zero columns on both
+        sides let cumulative sums give clipped window totals by plain slicing.
+        """
+        n = len(sentences)
+        text = SENTENCE_SEPARATOR.join(sentences).lower() + SENTENCE_SEPARATOR
+        tokens = TOKEN_PATTERN.findall(text)
+
+        # Term ids in order of first appearance, with the separator as id 0
+        vocabulary = defaultdict(itertools.count().__next__)
+        vocabulary[SENTENCE_SEPARATOR]
+        ids = np.fromiter(map(vocabulary.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+
+        is_separator = ids == 0
+        # Sentence index of every token: separators seen before it
+        sentence_index = np.cumsum(is_separator) - is_separator
+        is_word = ~is_separator
+        word_counts = np.bincount(sentence_index[is_word], minlength=n)[:n]
+
+        stop_ids = [vocabulary[word] for word in self.stop_words if word in vocabulary]
+        is_term = is_word & ~np.isin(ids, stop_ids)
+        rows = ids[is_term] % self.dims
+        width = n + 1 + 2 * self.window
+        columns = sentence_index[is_term] + self.window + 1
+
+        # Count a band of rows at a time to bound the bincount scratch space
+        counts = np.zeros((self.dims, width), dtype=np.float32)
+        band = max(1, self.block_size * 1024 // width)
+        for lo in range(0, self.dims, band):
+            hi = min(self.dims, lo + band)
+            in_band = (rows >= lo) & (rows < hi)
+            flat = (rows[in_band] - lo) * width + columns[in_band]
+            counts[lo:hi] = np.bincount(flat, minlength=(hi - lo) * width).reshape(hi - lo, width)
+        return counts, word_counts
+
+    def _gap_similarities(self, counts):
+        """Return the cosine similarity of the windows on either side of every gap."""
+        cumulative = np.cumsum(counts, axis=1, out=counts)
+        w = self.window
+        n = cumulative.shape[1] - 1 - 2 * w
+        similarity = np.empty(n - 1, dtype=np.float64)
+
+        # Gap g sits after column w + g of the cumulative sums
+        for start in range(1, n, self.block_size):
+            stop = min(n, start + self.block_size)
+            here = cumulative[:, w + start:w + stop]
+            left = here - cumulative[:, start:stop]
+            right = cumulative[:, 2 * w + start:2 * w + stop] - here
+            dot = np.einsum('ij,ij->j', left, right)
+            norms = np.sqrt(np.einsum('ij,ij->j', left, left) * np.einsum('ij,ij->j', right, right))
+            similarity[start - 1:stop - 1] = np.divide(dot, norms, out=np.zeros_like(dot),
+                                                       where=norms > 0)
+        return similarity
+
+    def _smooth(self, values):
+        """Average each value with its neighbors within the smoothing radius."""
+        if self.smoothing <= 0 or len(values) < 3:
+            return values
+        kernel = np.ones(2 * self.smoothing + 1)
+        totals = np.convolve(values, kernel, mode='same')
+        support = np.convolve(np.ones_like(values), kernel, mode='same')
+        return totals / support
+
+    def _select_boundaries(self, depth):
+        """Pick the deepest valleys that are at least ``min_sentences`` apart."""
+        n_gaps = len(depth)
+        if n_gaps == 0:
+            return []
+
+        is_valley = depth > 0
+        is_valley[1:] &= depth[1:] >= depth[:-1]
+        is_valley[:-1] &= depth[:-1] > depth[1:]
+        valleys = np.flatnonzero(is_valley)
+        if len(valleys) == 0:
+            return []
+        valley_depth = depth[valleys]
+        candidates = valleys[valley_depth > valley_depth.mean() + self.cutoff_std * valley_depth.std()]
+        # Deepest first; ties keep document order so results are deterministic
+        candidates = candidates[np.argsort(-depth[candidates], kind='stable')]
+
+        n_sentences = n_gaps + 1
+        taken = np.zeros(n_sentences + 1, dtype=bool)
+        accepted = []
+        for gap in candidates:
+            start = gap + 1
+            if start < self.min_sentences or n_sentences - start < self.min_sentences:
+                continue
+            lo = max(0, start - self.min_sentences + 1)
+            if taken[lo:start + self.min_sentences].any():
+                continue
+            taken[start] = True
+            accepted.append(start)
+        return sorted(accepted)
+
+    def fit_budget(self, text):
+        """Split a segment above ``max_tokens`` between words into pieces within the budget.
+
+        Words are counted one at a time, with the space before them, and a
+        single word above the budget is kept whole.
+        """
+        if not self.max_tokens or self._count(text) <= self.max_tokens:
+            return [text]
+        pieces = []
+        current = []
+        used = 0
+        for word in text.split():
+            tokens = self._count(' ' + word)
+            if current and used + tokens > self.max_tokens:
+                pieces.append(' '.join(current))
+                current = []
+                used = 0
+            current.append(word)
+            used += tokens
+        if current:
+            pieces.append(' '.join(current))
+        return pieces
+
+    def _count(self, text):
+        """Return the token count of a piece of text."""
+        if self.token_counter is None:
+            return int(np.ceil(len(TOKEN_PATTERN.findall(text.lower())) * 4 / 3))
+        return self.token_counter(text)
+
+    def _token_counts(self, sentences, word_counts):
+        """Return the token count of every sentence."""
+        if self.token_counter is None:
+            # Roughly four tokens for every three English words
+            return np.ceil(word_counts * 4 / 3).astype(np.int64)
+        return np.fromiter((self.token_counter(sentence) for sentence in sentences),
+                           dtype=np.int64, count=len(sentences))
+
+    def _enforce_budget(self, boundaries, depth, tokens):
+        """Split segments above ``max_tokens`` at their deepest admissible gaps."""
+        cumulative = np.concatenate(([0], np.cumsum(tokens)))
+        n = len(tokens)
+        starts = [0] + boundaries + [n]
+        result = []
+
+        for a, b in zip(starts, starts[1:]):
+            while cumulative[b] - cumulative[a] > self.max_tokens:
+                # Last sentence end that keeps [a, end) within budget
+                end = int(np.searchsorted(cumulative, cumulative[a] + self.max_tokens, side='right')) - 1
+                end = max(end, a + 1)
+                lo = min(a + self.min_sentences, end)
+                if lo < end:
+                    # Gap g precedes sentence g + 1, so sentence s starts after gap s - 1
+                    split = lo + int(np.argmax(depth[lo - 1:end]))
+                else:
+                    split = end
+                result.append(split)
+                a = split
+            if b < n:
+                result.append(b)
+        return result
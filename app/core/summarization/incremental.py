@@ -0,0 +1,176 @@
+from app.core.few_shot.few_shot_learner import FewShotLearner
+from app.core.few_shot.prompt_templates import PromptTemplates
+from app.core.preprocessing.cleaner import CleanerStream
+from app.core.preprocessing.preprocessor import TextPreprocessor
+from app.core.preprocessing.topic_segmenter import TopicSegmenter
+from app.core.summarization.map_reduce import batch_summaries
+
+class IncrementalSummarizer:
+    def __init__(self, gpt_interface, preprocessor=None, few_shot_learner=None, segment_tokens=3000,
+                 settle_sentences=None, tail_tokens=None, map_max_tokens=600, summary_max_tokens=1500,
+                 merge_tokens=None, merge_fan_in=8, cacheable=True):
+        """Initialize a rolling summarizer for a transcript that is still growing.
+
+        Appended text is cleaned incrementally and split into sentences. Only
+        the tail of sentences that are not yet part of a finished segment is
+        re-segmented on each update, and segments are kept within
+        ``segment_tokens``. A segment is finished once at least
+        ``settle_sentences`` sentences follow its end (by default the
+        segmenter's window). Appended text can still shift later boundaries,
+        since the cutoff depth is taken over the whole tail, but a finished
+        segment is never revisited. Each finished segment is summarized once
+        and the new chapter summaries are folded into the running summary, so
+        the cost of an update depends on the new text, not on the whole history.
+        Each fold request holds the running summary plus at most
+        ``merge_fan_in`` new summaries within ``merge_tokens`` tokens (by
+        default ``segment_tokens``, but room for at least one new summary);
+        larger backlogs, e.g. the first update of a long transcript, are first
+        merged level by level. The unfinished tail is only summarized again
+        once it has grown by ``tail_tokens`` (a quarter of ``segment_tokens``
+        by default), so frequent updates do not resend it.
+        """
+        if merge_fan_in < 2:
+            raise ValueError("merge_fan_in must be at least 2")
+        if merge_tokens is None:
+            merge_tokens = max(segment_tokens, summary_max_tokens + map_max_tokens)
+        if merge_tokens <= summary_max_tokens:
+            raise ValueError("merge_tokens must leave room for new summaries next to the running summary")
+        self.gpt_interface = gpt_interface
+        self.preprocessor = preprocessor or TextPreprocessor()
+        self.few_shot_learner = few_shot_learner or FewShotLearner()
+        self.model = getattr(gpt_interface, "model", None)
+        self.map_max_tokens = map_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.merge_tokens = merge_tokens
+        self.merge_fan_in = merge_fan_in
+        self.cacheable = cacheable
+        self.segmenter = TopicSegmenter(
+            max_tokens=segment_tokens,
+            token_counter=self.few_shot_learner.token_counter(self.model).count,
+            stop_words=self.preprocessor.stop_words
+        )
+        self.settle_sentences = self.segmenter.window if settle_sentences is None else settle_sentences
+        self.tail_tokens = segment_tokens // 4 if tail_tokens is None else tail_tokens
+
+        self.summary = ""
+        self.segments_summarized = 0
+        self._cleaner = CleanerStream(self.preprocessor.cleaner)
+        self._pending_text = ""
+        self._tail = []
+        self._new_summaries = []
+        self._tail_summary = None
+        self._tail_summary_tokens = 0
+        self._closed = False
+
+    def append(self, chunk):
+        """Add raw transcript text to the end of the transcript."""
+        if self._closed:
+            raise ValueError("Cannot append to a closed transcript")
+        self._add_cleaned(self._cleaner.feed(chunk))
+
+    def update(self, include_tail=False):
+        """Summarize newly finished segments, fold them into the running summary and return it.
+
+        With ``include_tail`` a summary of the unfinished tail is appended to
+        the returned text without being folded into the running summary. It is
+        made again only when segments were folded since the last one or the
+        tail has grown by ``tail_tokens``; otherwise the previous one is reused.
+        """
+        for segment in self._finished_segments():
+            self._new_summaries.append(self._summarize_segment(segment))
+        if self._new_summaries:
+            self._merge()
+            # The previous tail summary covers text that is now in the running summary
+            self._tail_summary = None
+
+        if include_tail and self._tail:
+            tail = " ".join(self._tail)
+            tail_tokens = self.segmenter.token_counter(tail)
+            if self._tail_summary is None or tail_tokens - self._tail_summary_tokens >= self.tail_tokens:
+                self._tail_summary = self._summarize_segment(tail)
+                self._tail_summary_tokens = tail_tokens
+            return f"{self.summary}\n\n{self._tail_summary}".strip()
+        return self.summary
+
+    def close(self):
+        """Finish the transcript, summarize everything that is left and return the final summary."""
+        if not self._closed:
+            self._add_cleaned(self._cleaner.close())
+            if self._pending_text.strip():
+                self._tail.append(self._pending_text.strip())
+            self._pending_text = ""
+            self._closed = True
+        return self.update()
+
+    def _add_cleaned(self, text):
+        """Split newly cleaned text into sentences, holding back the last, possibly unfinished, one."""
+        if not text:
+            return
+        sentences = self.preprocessor.split_sentences(self._pending_text + text)
+        if not sentences:
+            return
+        self._pending_text = sentences.pop()
+        self._tail.extend(sentences)
+
+    def _finished_segments(self):
+        """Remove the finished segments from the tail and return them as strings."""
+        if self._closed:
+            segments = self.segmenter.segment(self._tail) if self._tail else []
+            self._tail = []
+            return segments
+
+        starts = [0] + self.segmenter.boundaries(self._tail)
+        # A boundary is final once enough sentences follow it to fill the segmenter's window
+        cut = 0
+        for start in starts[1:]:
+            if len(self._tail) - start >= self.settle_sentences:
+                cut = start
+        if cut == 0:
+            return []
+        finished = [s for s in starts if s <= cut]
+        segments = [piece for a, b in zip(finished, finished[1:])
+                    for piece in self.segmenter.fit_budget(" ".join(self._tail[a:b]))]
+        self._tail = self._tail[cut:]
+        return segments
+
+    def _summarize_segment(self, text):
+        """Summarize one segment as a chapter."""
+        return self._complete(text, PromptTemplates.chapter_summary_template(), self.map_max_tokens)
+
+    def _merge(self):
+        """Fold the pending chapter summaries into the running summary."""
+        count_tokens = self.segmenter.token_counter
+        # The running summary is at most summary_max_tokens long, so this always leaves room
+        budget = self.merge_tokens - (count_tokens(self.summary) if self.summary else 0)
+        first = self.segments_summarized + 1
+        summaries = self._new_summaries
+        batches = batch_summaries(summaries, count_tokens, self.merge_fan_in, budget)
+        # Merge the new summaries level by level until they fit one fold request
+        while len(batches) > 1:
+            template = PromptTemplates.merge_summaries_template()
+            summaries = [self._complete(self._join_sections(batch, first), template, self.map_max_tokens)
+                         for batch in batches]
+            batches = batch_summaries(summaries, count_tokens, self.merge_fan_in, budget)
+
+        new_sections = self._join_sections(batches[0], first)
+        if self.summary:
+            text = f"Current Summary:\n{self.summary}\n\nNew Section Summaries:\n{new_sections}"
+            template = PromptTemplates.running_summary_update_template()
+        else:
+            text = new_sections
+            template = PromptTemplates.merge_summaries_template()
+        self.summary = self._complete(text, template, self.summary_max_tokens)
+        self.segments_summarized += len(self._new_summaries)
+        self._new_summaries = []
+
+    def _complete(self, text, template, max_tokens):
+        """Build a few-shot prompt that fits the model and run one completion."""
+        prompt = self.few_shot_learner.create_prompt(text, template=template, model=self.model,
+                                                     max_tokens=max_tokens)
+        return self.gpt_interface.generate_completion(prompt, max_tokens=max_tokens,
+                                                      cacheable=self.cacheable)
+
+    @staticmethod
+    def _join_sections(summaries, first):
+        """Join summaries with section headers numbered from ``first``."""
+        return "\n\n".join(f"Section {i}:\n{summary}" for i, summary in enumerate(summaries, first))
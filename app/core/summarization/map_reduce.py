@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.few_shot.few_shot_learner import FewShotLearner
+from app.core.few_shot.prompt_templates import PromptTemplates
+
+class MapReduceSummarizer:
+    def __init__(self, gpt_interface, few_shot_learner=None, max_workers=4,
+                 max_group_tokens=3000, reduce_fan_in=8,
+                 map_max_tokens=600, reduce_max_tokens=1500, cacheable=None):
+        """Initialize the summarizer with a model interface and concurrency limits.
+
+        Segments are packed into groups of at most ``max_group_tokens`` tokens,
+        each group is summarized concurrently with at most ``max_workers`` requests
+        in flight, and the partial summaries are merged ``reduce_fan_in`` at a time
+        until a single recap remains. ``cacheable`` is forwarded to every
+        completion call.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if reduce_fan_in < 2:
+            raise ValueError("reduce_fan_in must be at least 2")
+        self.gpt_interface = gpt_interface
+        self.few_shot_learner = few_shot_learner or FewShotLearner()
+        self.max_workers = max_workers
+        self.max_group_tokens = max_group_tokens
+        self.model = getattr(gpt_interface, "model", None)
+        self.token_counter = self.few_shot_learner.token_counter(self.model)
+        self.reduce_fan_in = reduce_fan_in
+        self.map_max_tokens = map_max_tokens
+        self.reduce_max_tokens = reduce_max_tokens
+        self.cacheable = cacheable
+
+    def group_segments(self, segments):
+        """Pack consecutive segments into groups that fit the token budget."""
+        groups = []
+        current = []
+        current_len = 0
+
+        for segment in segments:
+            for piece in self._split_oversized(segment):
+                piece_len = self.token_counter.count(piece) + 1
+                if current and current_len + piece_len > self.max_group_tokens:
+                    groups.append("\n".join(current))
+                    current = []
+                    current_len = 0
+                current.append(piece)
+                current_len += piece_len
+
+        if current:
+            groups.append("\n".join(current))
+
+        return groups
+
+    def summarize(self, segments):
+        """Summarize the segments and return the final recap."""
+        text, template = self._final_request(segments)
+        return self._complete(text, template, self.reduce_max_tokens)
+
+    def summarize_stream(self, segments):
+        """Summarize the segments, yielding the final recap as it is generated.
+
+        Map and intermediate reduce steps run as usual; only the last request,
+        which produces the recap itself, is streamed.
+        """
+        text, template = self._final_request(segments)
+        prompt = self.few_shot_learner.create_prompt(text, template=template, model=self.model,
+                                                     max_tokens=self.reduce_max_tokens)
+        yield from self.gpt_interface.stream_completion(prompt, max_tokens=self.reduce_max_tokens,
+                                                        cacheable=self.cacheable)
+
+    def _final_request(self, segments):
+        """Run every step before the final request and return its input text and template."""
+        groups = self.group_segments(segments)
+        if not groups:
+            raise ValueError("No transcript content to summarize")
+
+        # A transcript that fits one request needs no map/reduce round trips
+        if len(groups) == 1:
+            return groups[0], PromptTemplates.video_recap_template()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            summaries = self._map(executor, groups)
+            return self._reduce(executor, summaries)
+
+    def _map(self, executor, groups):
+        """Summarize every group concurrently, preserving transcript order."""
+        template = PromptTemplates.chapter_summary_template()
+        return list(executor.map(
+            lambda group: self._complete(group, template, self.map_max_tokens),
+            groups
+        ))
+
+    def _reduce(self, executor, summaries):
+        """Merge partial summaries level by level until one batch remains.
+
+        Returns the input text and template of the final merge request.
+        """
+        template = PromptTemplates.merge_summaries_template()
+
+        while True:
+            batches = self._batch_summaries(summaries)
+            if len(batches) == 1:
+                return self._join_summaries(batches[0]), template
+
+            summaries = list(executor.map(
+                lambda batch: self._complete(self._join_summaries(batch), template,
+                                             self.map_max_tokens),
+                batches
+            ))
+
+    def _batch_summaries(self, summaries):
+        """Split summaries into batches bounded by fan-in and token budget."""
+        return batch_summaries(summaries, self.token_counter.count, self.reduce_fan_in,
+                               self.max_group_tokens)
+
+    def _complete(self, text, template, max_tokens):
+        """Build a few-shot prompt that fits the model and run one completion."""
+        prompt = self.few_shot_learner.create_prompt(text, template=template, model=self.model,
+                                                     max_tokens=max_tokens)
+        return self.gpt_interface.generate_completion(prompt, max_tokens=max_tokens,
+                                                      cacheable=self.cacheable)
+
+    def _split_oversized(self, text):
+        """Split a single segment that exceeds the group budget."""
+        if self.token_counter.count(text) <= self.max_group_tokens:
+            return [text]
+        return self.token_counter.split(text, self.max_group_tokens)
+
+    @staticmethod
+    def _join_summaries(summaries):
+        """Join partial summaries with numbered section headers."""
+        return "\n\n".join(
+            f"Section {i}:\n{summary}" for i, summary in enumerate(summaries, 1)
+        )
+
+def batch_summaries(summaries, count_tokens, fan_in, max_tokens):
+    """Split summaries into consecutive batches of at most ``fan_in`` summaries and ``max_tokens`` tokens."""
+    batches = []
+    current = []
+    current_len = 0
+
+    for summary in summaries:
+        summary_len = count_tokens(summary)
+        if current and (len(current) >= fan_in or current_len + summary_len > max_tokens):
+            batches.append(current)
+            current = []
+            current_len = 0
+        current.append(summary)
+        current_len += summary_len
+
+    if current:
+        batches.append(current)
+
+    # Guarantee progress when every summary is individually near the budget
+    if len(batches) == len(summaries) and len(summaries) > 1:
+        batches = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+
+    return batches
@@ -1,17 +1,28 @@
 import os
 import argparse
+import time
 import logging
 import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
-from app.core.data_collection.video_collector import VideoCollector
+from app.core.data_collection.video_collector import VideoCollector, youtube_video_id
 from app.core.data_collection.transcriber import Transcriber
+from app.core.data_collection.transcript_cache import TranscriptCache
+from app.core.data_collection.media_store import MediaStore
 from app.core.preprocessing.preprocessor import TextPreprocessor
 from app.core.model.openai_interface import GPTInterface
+from app.core.model.completion_cache import CompletionCache
+from app.core.model.rate_limiter import RateLimiter, INTERACTIVE, BATCH
 from app.core.few_shot.few_shot_learner import FewShotLearner
-from app.core.few_shot.prompt_templates import PromptTemplates
-from app.core.formatting.output_formatter import OutputFormatter
+from app.core.few_shot.example_index import ExampleIndex
+from app.core.formatting.output_formatter import FORMATS, OutputFormatter, output_paths, write_summary
+from app.core.summarization.map_reduce import MapReduceSummarizer
+from app.core.summarization.incremental import IncrementalSummarizer
+from app.core.jobs.job_queue import JobQueue
+from app.core.jobs.pipeline import VideoPipeline
+from app.core.jobs.batch_runner import BatchRunner, read_manifest
+from app.core.monitoring.metrics import metrics
 
 # Configure logging
 logging.basicConfig(
@@ -32,20 +43,38 @@ def validate_api_key(api_key):
 def process_video_input(args, video_collector, transcriber):
     """Process video input (URL or file) and return transcript"""
     try:
-        if args.url:
-            logger.info(f"Downloading video from URL: {args.url}")
-            video_path = video_collector.download_from_youtube(args.url)
-        else:
-            video_path = args.file
+        if args.audio_only:
+            # Decoded blocks are cut into chunks and transcribed as ffmpeg streams the audio;
+            # nothing is written to disk and the recording is never held in memory whole
+            if args.url:
+                source = video_collector.audio_stream_url(args.url)
+                source_id = f"youtube:{youtube_video_id(args.url)}"
+            else:
+                source = args.file
+                source_id = f"file:{TranscriptCache.fingerprint(args.file)}"
+            logger.info(f"Streaming and transcribing audio from {args.url or args.file}")
+            return transcriber.transcribe_stream(video_collector.stream_audio(source), source_id=source_id)["text"]
+
+        # Stored media stays referenced until it is transcribed, so other processes cannot evict it
+        download_key = f"youtube:{youtube_video_id(args.url)}:video" if args.url else None
+        with video_collector.media_reference(download_key):
+            if args.url:
+                logger.info(f"Downloading video from URL: {args.url}")
+                video_path = video_collector.download_from_youtube(args.url)
+            else:
+                video_path = args.file
+
+            has_store = video_collector.media_store is not None and video_path and os.path.exists(video_path)
+            audio_key = video_collector.audio_key(video_path) if has_store else None
+            with video_collector.media_reference(audio_key):
+                logger.info(f"Extracting audio from video: {video_path}")
+                audio_path = video_collector.extract_audio(video_path)
 
-        logger.info(f"Extracting audio from video: {video_path}")
-        audio_path = video_collector.extract_audio(video_path)
-        
-        if not audio_path or not Path(audio_path).exists():
-            raise FileNotFoundError("Audio extraction failed")
+                if not audio_path or not Path(audio_path).exists():
+                    raise FileNotFoundError("Audio extraction failed")
 
-        logger.info("Transcribing audio content")
-        transcript = transcriber.transcribe(audio_path)
+                logger.info("Transcribing audio content")
+                transcript = transcriber.transcribe(audio_path)
         return transcript
 
     except Exception as e:
@@ -61,19 +90,152 @@ def process_transcript_file(transcript_path):
         logger.error(f"Failed to read transcript file: {str(e)}")
         raise
 
+def build_media_store(args):
+    """Return the media store for downloads, or None when caches are bypassed"""
+    if args.no_cache:
+        return None
+    return MediaStore(args.media_dir, max_bytes=int(args.media_quota_gb * 1024 ** 3))
+
+def stream_summary(summarizer, segments, output_path):
+    """Write the recap to the output file as it is generated and return the full text"""
+    parts = []
+    with open(output_path, 'w') as f:
+        for delta in summarizer.summarize_stream(segments):
+            parts.append(delta)
+            f.write(delta)
+            f.flush()
+    return "".join(parts)
+
+def follow_transcript(args, gpt_interface, preprocessor, few_shot_learner, completion_cache, output_path):
+    """Summarize a transcript file that is still being written, rewriting output_path as it grows
+
+    Stops once the file has not grown for --follow_idle seconds and returns the final summary.
+    """
+    summarizer = IncrementalSummarizer(
+        gpt_interface,
+        preprocessor=preprocessor,
+        few_shot_learner=few_shot_learner,
+        segment_tokens=args.segment_tokens,
+        cacheable=completion_cache is not None
+    )
+    last_growth = time.monotonic()
+    with open(args.transcript, 'r') as f:
+        while time.monotonic() - last_growth < args.follow_idle:
+            chunk = f.read()
+            if not chunk:
+                time.sleep(args.follow_interval)
+                continue
+            last_growth = time.monotonic()
+            summarizer.append(chunk)
+            summary = summarizer.update(include_tail=True)
+            with open(output_path, 'w') as out:
+                out.write(summary)
+            logger.info(f"Summary covers {summarizer.segments_summarized} finished segments")
+    return summarizer.close()
+
+def write_profile(profile_path):
+    """Write the collected metrics to a JSON file and log where time and money went"""
+    metrics.write_profile(profile_path)
+    profile = metrics.snapshot()
+    for stage, stats in sorted(profile["stages"].items(), key=lambda item: -item[1]["total_seconds"]):
+        logger.info(f"  {stage}: {stats['count']} calls, {stats['total_seconds']:.2f}s total")
+    for model, usage in profile["models"].items():
+        logger.info(f"  {model}: {usage['requests']} requests, {usage['prompt_tokens']} prompt + "
+                    f"{usage['completion_tokens']} completion tokens, ${usage['cost_usd']:.4f}")
+    logger.info(f"Profile written to {profile_path} (estimated cost ${profile['total_cost_usd']:.4f})")
+
+def run_batch(args, video_collector, transcriber, preprocessor, summarizer, output_formatter):
+    """Summarize every input of a batch manifest through the pipelined stages"""
+    items = read_manifest(args.batch, output_dir=args.output_dir, format_type=args.format[0])
+    # Stage results are kept next to the manifest so a crashed batch resumes mid-pipeline
+    stage_store = JobQueue(args.batch + ".state.sqlite3")
+    pipeline = VideoPipeline(video_collector, transcriber, preprocessor, summarizer,
+                             job_queue=stage_store, segment_tokens=args.segment_tokens,
+                             audio_only=args.audio_only)
+    runner = BatchRunner(
+        pipeline,
+        output_formatter,
+        concurrency={
+            "download": args.download_concurrency,
+            "extract_audio": args.extract_concurrency,
+            "transcribe": args.transcribe_concurrency,
+            "summarize": args.summarize_concurrency
+        },
+        queue_size=args.queue_size,
+        progress_path=args.batch + ".progress.jsonl",
+        formats=args.format
+    )
+
+    logger.info(f"Processing {len(items)} manifest items from {args.batch}")
+    report = runner.run(items)
+
+    logger.info(f"Batch finished in {report['elapsed_seconds']:.1f}s: {report['completed']} completed, "
+                f"{report['skipped']} already done, {len(report['failed'])} failed "
+                f"({report['items_per_hour']:.1f} items/hour)")
+    for stage, stats in report["stages"].items():
+        logger.info(f"  {stage}: {stats['items']} items, {stats['mean_seconds']:.1f}s each, "
+                    f"{stats['workers']} workers at {stats['utilization']:.0%} utilization")
+    for failure in report["failed"]:
+        logger.error(f"  {failure['id']} failed in {failure['stage']}: {failure['error']}")
+    return report
+
 def main():
     parser = argparse.ArgumentParser(description="Video Recap AI - Summarize tutorial videos")
     parser.add_argument("--url", help="YouTube URL of the video to summarize")
     parser.add_argument("--file", help="Path to a local video file to summarize")
     parser.add_argument("--transcript", help="Path to a transcript file to summarize")
     parser.add_argument("--output", default="recap.md", help="Output file for the summary")
-    parser.add_argument("--format", choices=["markdown", "html", "json"], default="markdown", 
-                       help="Output format")
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=["markdown"],
+                       help="Output formats; with several, each is written next to --output with its own extension")
     parser.add_argument("--model", default="gpt-3.5-turbo", 
                        help="Model to use for summarization")
     parser.add_argument("--api_key", help="OpenAI API key (overrides environment variable)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                       help="Maximum number of summarization requests in flight")
+    parser.add_argument("--cache_path", default=os.getenv("COMPLETION_CACHE_PATH", "./data/cache/completions.sqlite3"),
+                       help="Path of the persistent completion cache")
+    parser.add_argument("--transcript_cache_path", default=os.getenv("TRANSCRIPT_CACHE_PATH", "./data/cache/transcripts.sqlite3"),
+                       help="Path of the persistent transcript cache")
+    parser.add_argument("--language", help="Spoken language of the video (ISO-639-1), detected if omitted")
+    parser.add_argument("--segment_tokens", type=int, default=3000,
+                       help="Maximum tokens per transcript segment sent to the model")
+    parser.add_argument("--chunked", action="store_true",
+                       help="Split long audio at silences and transcribe the chunks in parallel")
+    parser.add_argument("--transcribe_workers", type=int, help="Number of parallel transcription workers in chunked mode")
+    parser.add_argument("--no_cache", action="store_true", help="Bypass the completion, transcript and media caches")
+    parser.add_argument("--rpm", type=int, default=int(os.getenv("OPENAI_RPM", "0")),
+                       help="Requests per minute allowed by the OpenAI account, shared by all processes (0 for no limit)")
+    parser.add_argument("--tpm", type=int, default=int(os.getenv("OPENAI_TPM", "0")),
+                       help="Tokens per minute allowed by the OpenAI account, shared by all processes (0 for no limit)")
+    parser.add_argument("--rate_limit_db", default=os.getenv("RATE_LIMIT_DB_PATH", "./data/ratelimit.sqlite3"),
+                       help="Path of the rate limit state shared between processes")
+    parser.add_argument("--examples", default=os.getenv("EXAMPLES_PATH"),
+                       help="Saved example index directory, or JSON/JSONL file of transcript/summary pairs")
+    parser.add_argument("--media_dir", default=os.getenv("MEDIA_DIR", "./data/media"),
+                       help="Directory of the store for downloaded videos and extracted audio")
+    parser.add_argument("--media_quota_gb", type=float, default=float(os.getenv("MEDIA_QUOTA_GB", "20")),
+                       help="Disk quota of the media store; least recently used media is evicted beyond it")
+    parser.add_argument("--audio_only", action="store_true",
+                       help="Stream only the audio through ffmpeg into chunked transcription, without intermediate files")
+    parser.add_argument("--stream", action="store_true",
+                       help="Write the summary to the first format's output as it is generated, then rewrite it in --format when done")
+    parser.add_argument("--follow", action="store_true",
+                       help="Keep summarizing --transcript as it grows, updating --output, until it stops growing")
+    parser.add_argument("--follow_interval", type=float, default=2.0, help="Seconds between checks for new transcript text")
+    parser.add_argument("--follow_idle", type=float, default=300.0,
+                       help="Stop following after the transcript has not grown for this many seconds")
+    parser.add_argument("--batch", help="Manifest of URLs, video files or transcripts to summarize, one per line")
+    parser.add_argument("--output_dir", default="./recaps", help="Output directory for batch summaries")
+    parser.add_argument("--download_concurrency", type=int, default=2, help="Parallel downloads in batch mode")
+    parser.add_argument("--extract_concurrency", type=int, default=2, help="Parallel audio extractions in batch mode")
+    parser.add_argument("--transcribe_concurrency", type=int, default=2, help="Parallel transcriptions in batch mode")
+    parser.add_argument("--summarize_concurrency", type=int, default=2, help="Parallel summarizations in batch mode")
+    parser.add_argument("--queue_size", type=int, default=4, help="Items buffered between batch stages")
+    parser.add_argument("--profile", help="Write per-stage timings, token counts, cost, retries and cache hits to this JSON file")
     
     args = parser.parse_args()
+    if args.profile:
+        metrics.configure(enabled=True, record_spans=True)
     
     try:
         # Validate API configuration
@@ -81,14 +243,28 @@ def main():
         validate_api_key(api_key)
 
         # Initialize components
-        video_collector = VideoCollector()
-        transcriber = Transcriber(use_openai=True, api_key=api_key)
-        preprocessor = TextPreprocessor()
-        gpt_interface = GPTInterface(api_key=api_key, model=args.model)
-        few_shot_learner = FewShotLearner()
-        output_formatter = OutputFormatter(format_type=args.format)
-
-        # Add few-shot examples
+        completion_cache = None if args.no_cache else CompletionCache(args.cache_path)
+        rate_limiter = (RateLimiter(args.rate_limit_db, requests_per_minute=args.rpm or None,
+                                    tokens_per_minute=args.tpm or None)
+                        if args.rpm or args.tpm else None)
+        gpt_interface = GPTInterface(api_key=api_key, model=args.model, cache=completion_cache,
+                                     rate_limiter=rate_limiter, priority=BATCH if args.batch else INTERACTIVE)
+        example_index = ExampleIndex.open(args.examples) if args.examples else None
+        few_shot_learner = FewShotLearner(model=args.model, index=example_index)
+        # Segment budgets are counted with the model's own tokenizer
+        preprocessor = TextPreprocessor(token_counter=few_shot_learner.token_counter(args.model).count)
+        summarizer = MapReduceSummarizer(
+            gpt_interface,
+            few_shot_learner=few_shot_learner,
+            max_workers=args.concurrency,
+            cacheable=completion_cache is not None
+        )
+        output_formatter = OutputFormatter(format_type=args.format[0])
+        # Every format is rendered from one structured summary; the first is written while streaming
+        outputs = output_paths(args.output, args.format)
+        primary_output = outputs[args.format[0]]
+
+        # Built-in few-shot examples, used only when no example index is supplied
         example_pairs = [
             {
                 "input": "In this tutorial, we're going to be talking about neural networks...",
@@ -99,49 +275,71 @@ def main():
                 "output": "## Introduction to Python\n- Python is a high-level, interpreted programming language\n- Known for readability and simplicity\n- Great for beginners"
             }
         ]
-        few_shot_learner.add_examples(example_pairs)
+        if example_index is None:
+            few_shot_learner.add_examples(example_pairs)
+
+        if args.batch:
+            video_collector = VideoCollector(media_store=build_media_store(args))
+            transcript_cache = None if args.no_cache else TranscriptCache(args.transcript_cache_path)
+            transcriber = Transcriber(use_openai=True, api_key=api_key, language=args.language,
+                                      cache=transcript_cache, chunked=args.chunked,
+                                      max_workers=args.transcribe_workers)
+            report = run_batch(args, video_collector, transcriber, preprocessor, summarizer, output_formatter)
+            if report["failed"]:
+                raise SystemExit(1)
+            return
+
+        if args.follow:
+            if not args.transcript:
+                raise ValueError("--follow requires --transcript")
+            raw_summary = follow_transcript(args, gpt_interface, preprocessor, few_shot_learner, completion_cache,
+                                            primary_output)
+            write_summary(output_formatter.structure(raw_summary, {"source": args.transcript}), outputs)
+            logger.info(f"Successfully generated summary: {', '.join(outputs.values())}")
+            return
 
         # Process input and get transcript
         if args.url or args.file:
+            # Video components are only built when there is video to process
+            video_collector = VideoCollector(media_store=build_media_store(args))
+            transcript_cache = None if args.no_cache else TranscriptCache(args.transcript_cache_path)
+            transcriber = Transcriber(use_openai=True, api_key=api_key, language=args.language,
+                                      cache=transcript_cache, chunked=args.chunked,
+                                      max_workers=args.transcribe_workers)
             transcript = process_video_input(args, video_collector, transcriber)
         elif args.transcript:
             transcript = process_transcript_file(args.transcript)
         else:
-            raise ValueError("No input provided. Use --url, --file, or --transcript")
+            raise ValueError("No input provided. Use --url, --file, --transcript or --batch")
 
         # Preprocess transcript
         logger.info("Preprocessing transcript")
         cleaned_text = preprocessor.clean_transcript(transcript)
-        segments = preprocessor.segment_by_topics(cleaned_text)
-
-        # Generate summary prompt
-        logger.info("Creating few-shot prompt")
-        template = PromptTemplates.video_recap_template()
-        prompt = few_shot_learner.create_prompt(
-            "\n".join(segments), 
-            template=template
-        )
+        segments = preprocessor.segment_by_topics(cleaned_text, max_tokens=args.segment_tokens)
 
         # Generate summary
-        logger.info(f"Generating summary using {args.model}")
-        raw_summary = gpt_interface.generate_completion(prompt, max_tokens=1500)
-
-        # Format output
-        logger.info(f"Formatting output as {args.format}")
-        formatted_summary = output_formatter.format_summary(
-            raw_summary, 
-            {"source": args.url or args.file or args.transcript}
-        )
+        logger.info(f"Generating summary of {len(segments)} segments using {args.model}")
+        if args.stream:
+            raw_summary = stream_summary(summarizer, segments, primary_output)
+        else:
+            raw_summary = summarizer.summarize(segments)
+
+        # Format and save output
+        logger.info(f"Formatting output as {', '.join(outputs)}")
+        structured = output_formatter.structure(raw_summary, {"source": args.url or args.file or args.transcript})
+        write_summary(structured, outputs)
 
-        # Save output
-        with open(args.output, 'w') as f:
-            f.write(formatted_summary)
-        
-        logger.info(f"Successfully generated summary: {args.output}")
+        logger.info(f"Successfully generated summary: {', '.join(outputs.values())}")
+        if completion_cache is not None:
+            stats = completion_cache.stats()
+            logger.info(f"Completion cache: {stats['hits']} hits, {stats['misses']} misses")
 
     except Exception as e:
         logger.error(f"Processing failed: {str(e)}")
         raise SystemExit(1)
+    finally:
+        if args.profile:
+            write_profile(args.profile)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,137 @@
+"""Compare the legacy video-to-audio path against audio-only acquisition.
+
+Extraction: the legacy path decodes the whole video with moviepy, re-encodes
+the audio to MP3 on disk and then decodes that MP3 to 16 kHz samples the way
+Whisper does. The direct path decodes only the audio track of the video to
+16 kHz mono PCM through an ffmpeg pipe. Without ``--file`` a synthetic video of
+``--seconds`` length is generated with ffmpeg.
+
+Download size: with ``--url`` the progressive MP4 the legacy path downloads is
+compared with the best audio-only stream, using the sizes YouTube reports;
+``--download`` also times both downloads.
+
+Usage:
+    python benchmarks/audio_extraction_benchmark.py [--file video.mp4 | --seconds 600]
+        [--url https://youtu.be/...] [--download] [--runs 3] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.data_collection.video_collector import VideoCollector
+
+def synthetic_video(path, seconds):
+    """Write a 720p test-pattern video with a sine-tone audio track."""
+    subprocess.run([
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc=size=1280x720:rate=30:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", path
+    ], check=True)
+
+def legacy_extract(collector, video_path):
+    """moviepy to MP3 on disk, then decode the MP3 to 16 kHz samples."""
+    audio_path = collector.extract_audio(video_path)
+    if audio_path is None:
+        raise RuntimeError("moviepy extraction failed")
+    samples = collector.decode_audio(audio_path)
+    return samples, os.path.getsize(audio_path)
+
+def direct_extract(collector, video_path):
+    """Decode only the audio track straight to 16 kHz samples."""
+    return collector.decode_audio(video_path), 0
+
+def best_of(func, runs, *args):
+    """Return (result, fastest seconds) over several runs."""
+    best = None
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def download_sizes(url, download, output_dir):
+    """Return reported (and optionally measured) sizes of the progressive and audio-only streams."""
+    from pytube import YouTube
+    streams = YouTube(url).streams
+    progressive = streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
+    audio = VideoCollector._best_audio_stream(url)
+    result = {
+        "progressive_bytes": progressive.filesize,
+        "audio_only_bytes": audio.filesize,
+        "ratio": audio.filesize / progressive.filesize
+    }
+    if download:
+        collector = VideoCollector(output_dir=output_dir)
+        _, result["progressive_seconds"] = best_of(collector.download_from_youtube, 1, url, "progressive.mp4")
+        _, result["audio_only_seconds"] = best_of(collector.download_audio_from_youtube, 1, url, "audio")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audio acquisition and extraction")
+    parser.add_argument("--file", help="Video file to extract audio from")
+    parser.add_argument("--seconds", type=int, default=600, help="Length of the synthetic video without --file")
+    parser.add_argument("--url", help="YouTube URL to compare download sizes for")
+    parser.add_argument("--download", action="store_true", help="Also time both downloads of --url")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per extraction path; the fastest is reported")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") is None:
+        raise SystemExit("ffmpeg is required for this benchmark")
+
+    workdir = tempfile.mkdtemp(prefix="audio-bench-")
+    results = {}
+    try:
+        collector = VideoCollector(output_dir=workdir)
+        video_path = args.file
+        if video_path is None:
+            video_path = os.path.join(workdir, "synthetic.mp4")
+            print(f"Generating a {args.seconds}s synthetic video...")
+            synthetic_video(video_path, args.seconds)
+
+        (legacy_samples, mp3_bytes), legacy_seconds = best_of(legacy_extract, args.runs, collector, video_path)
+        (direct_samples, _), direct_seconds = best_of(direct_extract, args.runs, collector, video_path)
+        audio_seconds = len(direct_samples) / 16000
+        results["extraction"] = {
+            "video_bytes": os.path.getsize(video_path),
+            "audio_seconds": audio_seconds,
+            "legacy_seconds": legacy_seconds,
+            "legacy_intermediate_bytes": mp3_bytes,
+            "direct_seconds": direct_seconds,
+            "direct_intermediate_bytes": 0,
+            "speedup": legacy_seconds / direct_seconds,
+            "sample_count_difference": abs(len(legacy_samples) - len(direct_samples))
+        }
+        print(f"Extraction of {audio_seconds:.0f}s of audio from {results['extraction']['video_bytes'] / 1e6:.1f} MB video:")
+        print(f"  legacy (moviepy -> mp3 -> 16 kHz): {legacy_seconds:.2f}s, {mp3_bytes / 1e6:.1f} MB written")
+        print(f"  direct (ffmpeg pipe -> 16 kHz):    {direct_seconds:.2f}s, 0 MB written")
+        print(f"  speedup: {results['extraction']['speedup']:.1f}x")
+
+        if args.url:
+            results["download"] = download_sizes(args.url, args.download, workdir)
+            download = results["download"]
+            print(f"Download size for {args.url}:")
+            print(f"  progressive mp4: {download['progressive_bytes'] / 1e6:.1f} MB")
+            print(f"  audio only:      {download['audio_only_bytes'] / 1e6:.1f} MB "
+                  f"({download['ratio']:.1%} of the video)")
+            if args.download:
+                print(f"  download time: {download['progressive_seconds']:.1f}s vs {download['audio_only_seconds']:.1f}s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Compare the single-pass TranscriptCleaner against the previous multi-pass cleaner.
+
+Synthetic transcripts with timestamps, speaker labels and filler words are
+cleaned by the legacy implementation (one regex pass per filler word), by
+``TranscriptCleaner.clean`` and by ``TranscriptCleaner.clean_stream`` fed in
+64 KB chunks. Peak memory is measured with tracemalloc in a separate run so it
+does not distort the timings.
+
+Usage:
+    python benchmarks/cleaner_benchmark.py [--sizes 1 10 100] [--json results.json]
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.preprocessing.cleaner import TranscriptCleaner
+
+CHUNK_SIZE = 64 * 1024
+
+WORDS = ["the", "model", "learns", "a", "function", "from", "data", "and", "we", "can",
+         "see", "that", "gradient", "descent", "converges", "quickly", "here", "so",
+         "um", "uh", "like", "you know", "actually", "basically", "literally"]
+
+def legacy_clean(text):
+    """The multi-pass cleaner TextPreprocessor.clean_transcript used to run."""
+    text = re.sub(r'\[\d{2}:\d{2}:\d{2}\]', '', text)
+    text = re.sub(r'Speaker \d+: ', '', text)
+    filler_words = ['um', 'uh', 'ah', 'like', 'you know', 'actually', 'basically', 'literally']
+    for word in filler_words:
+        text = re.sub(r'\b' + word + r'\b', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+def synthetic_transcript(size_bytes, seed=0):
+    """Build a transcript of roughly ``size_bytes`` characters."""
+    rng = random.Random(seed)
+    lines = []
+    total = 0
+    second = 0
+    while total < size_bytes:
+        second += rng.randint(2, 9)
+        stamp = f"[{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}]"
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30)))
+        line = f"{stamp} Speaker {rng.randint(1, 4)}: {words.capitalize()}.\n"
+        lines.append(line)
+        total += len(line)
+    return "".join(lines)
+
+def chunked(text, size=CHUNK_SIZE):
+    """Yield fixed-size chunks of text."""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+def timed(func, *args):
+    """Return (result, seconds) for one call."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def peak_memory(func, *args):
+    """Return the peak traced allocation in bytes for one call."""
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcript cleaning")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100], help="Input sizes in MB")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc runs")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    cleaner = TranscriptCleaner()
+    stream_clean = lambda text: "".join(cleaner.clean_stream(chunked(text)))
+    implementations = {"legacy": legacy_clean, "single_pass": cleaner.clean, "streaming": stream_clean}
+
+    results = []
+    for size_mb in args.sizes:
+        text = synthetic_transcript(size_mb * 1024 * 1024)
+        row = {"size_mb": size_mb}
+        outputs = {}
+        for name, func in implementations.items():
+            outputs[name], row[f"{name}_seconds"] = timed(func, text)
+            if not args.no_memory:
+                row[f"{name}_peak_bytes"] = peak_memory(func, text)
+        row["speedup"] = row["legacy_seconds"] / row["single_pass_seconds"]
+        row["outputs_match"] = outputs["legacy"] == outputs["single_pass"] == outputs["streaming"]
+        results.append(row)
+
+        line = (f"{size_mb:4d} MB  legacy {row['legacy_seconds']:7.3f}s  "
+                f"single-pass {row['single_pass_seconds']:7.3f}s  "
+                f"streaming {row['streaming_seconds']:7.3f}s  "
+                f"speedup {row['speedup']:4.1f}x  match {row['outputs_match']}")
+        if not args.no_memory:
+            line += (f"  peak MB legacy {row['legacy_peak_bytes'] / 2**20:.0f} / "
+                     f"single-pass {row['single_pass_peak_bytes'] / 2**20:.0f} / "
+                     f"streaming {row['streaming_peak_bytes'] / 2**20:.0f}")
+        print(line)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""Offline end-to-end benchmark of the summarization pipeline against a stub OpenAI API.
+
+A local StubOpenAIServer stands in for the chat completion and transcription
+endpoints, so nothing is billed; its latency, token rate and error injection
+are configurable. Synthetic transcripts of each ``--words`` size (with
+timestamps, speaker labels, filler words and topic shifts) are run through:
+
+- the individual stages: ``clean_transcript``, ``segment_by_topics``,
+  ``create_prompt`` and ``generate_completion`` (one sample per segment), the
+  map/reduce ``summarize`` and OpenAI ``transcribe`` of a short WAV file;
+- ``app/main.py --transcript`` in a subprocess, up to ``--cli_max_words``;
+- ``app/api.py`` in-process: concurrent ``/api/summarize/text`` requests and
+  time to first event of ``/api/summarize/text/stream``.
+
+Every stage reports p50/p99 latency, throughput and peak memory (tracemalloc
+in a separate run, or peak RSS of the subprocess for the CLI). Results are
+written as JSON with the commit they were measured on; ``--baseline`` compares
+p50 latencies with an earlier results file and exits non-zero on regressions.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--words 1000 10000 100000 1000000]
+        [--latency 0.05] [--tokens_per_second 2000] [--error_rate 0.0]
+        [--json results.json] [--baseline previous.json]
+"""
+import os
+import sys
+import json
+import time
+import wave
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.stub_openai_server import StubOpenAIServer
+
+FILLERS = ["um", "uh", "like", "you know", "actually", "basically"]
+BACKGROUND = ["the", "a", "we", "and", "so", "that", "this", "is", "to", "of", "in", "it", "you", "can", "see"]
+
+def synthetic_transcript(n_words, words_per_topic=1500, seed=0):
+    """Return a transcript of about ``n_words`` words that changes topic every ``words_per_topic`` words."""
+    rng = random.Random(seed)
+    lines = []
+    written = 0
+    seconds = 0
+    while written < n_words:
+        topic = written // words_per_topic
+        vocabulary = [f"topic{topic}term{i}" for i in range(30)]
+        length = rng.randint(8, 20)
+        words = [rng.choice(vocabulary) if rng.random() < 0.4 else rng.choice(BACKGROUND) for _ in range(length)]
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), rng.choice(FILLERS))
+        seconds += rng.randint(2, 6)
+        timestamp = f"[{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}]"
+        lines.append(f"{timestamp} Speaker {rng.randint(1, 2)}: {' '.join(words).capitalize()}.")
+        written += length
+    return "\n".join(lines)
+
+def write_wav(path, seconds=10, sample_rate=16000):
+    """Write a silent 16 kHz mono WAV file."""
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(b"\0\0" * (seconds * sample_rate))
+
+def peak_memory(func):
+    """Return the peak bytes allocated by Python while running ``func`` once."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def summarize_samples(stage, words, samples, units, unit_name, peak_bytes, **extra):
+    """Turn latency samples (seconds) into a result row."""
+    samples = np.asarray(samples, dtype=np.float64)
+    total = float(samples.sum())
+    row = {
+        "stage": stage,
+        "words": words,
+        "samples": int(len(samples)),
+        "p50_ms": float(np.percentile(samples, 50) * 1000),
+        "p99_ms": float(np.percentile(samples, 99) * 1000),
+        "mean_ms": float(samples.mean() * 1000),
+        "throughput": units / total if total > 0 else None,
+        "throughput_unit": unit_name,
+        "peak_memory_bytes": peak_bytes
+    }
+    row.update(extra)
+    return row
+
+def timed(func, *args, **kwargs):
+    """Return (result, seconds) of one call."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def bench_stages(args, words, text, components):
+    """Benchmark the in-process stages on one transcript."""
+    from app.core.few_shot.prompt_templates import PromptTemplates
+    preprocessor, few_shot_learner, gpt_interface, summarizer = components
+    rows = []
+
+    samples = []
+    for _ in range(args.runs):
+        cleaned, seconds = timed(preprocessor.clean_transcript, text)
+        samples.append(seconds)
+    rows.append(summarize_samples("clean_transcript", words, samples, words * len(samples), "words/s",
+                                  peak_memory(lambda: preprocessor.clean_transcript(text))))
+
+    samples = []
+    for _ in range(args.runs):
+        segments, seconds = timed(preprocessor.segment_by_topics, cleaned, max_tokens=args.segment_tokens)
+        samples.append(seconds)
+    rows.append(summarize_samples(
+        "segment_by_topics", words, samples, words * len(samples), "words/s",
+        peak_memory(lambda: preprocessor.segment_by_topics(cleaned, max_tokens=args.segment_tokens)),
+        segments=len(segments)
+    ))
+
+    template = PromptTemplates.chapter_summary_template()
+    sample_segments = segments[:args.max_segments]
+    prompts = []
+    samples = []
+    for segment in sample_segments:
+        prompt, seconds = timed(few_shot_learner.create_prompt, segment, template=template, max_tokens=600)
+        prompts.append(prompt)
+        samples.append(seconds)
+    rows.append(summarize_samples(
+        "create_prompt", words, samples, len(samples), "prompts/s",
+        peak_memory(lambda: few_shot_learner.create_prompt(sample_segments[0], template=template, max_tokens=600))
+    ))
+
+    samples = []
+    for prompt in prompts:
+        _, seconds = timed(gpt_interface.generate_completion, prompt, max_tokens=600, cacheable=False)
+        samples.append(seconds)
+    rows.append(summarize_samples(
+        "generate_completion", words, samples, len(samples), "requests/s",
+        peak_memory(lambda: gpt_interface.generate_completion(prompts[0], max_tokens=600, cacheable=False))
+    ))
+
+    if words <= args.summarize_max_words:
+        # The map/reduce run is long, so its peak memory is traced on the timed run itself
+        tracemalloc.start()
+        _, seconds = timed(summarizer.summarize, segments)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rows.append(summarize_samples("summarize", words, [seconds], words, "words/s", peak,
+                                      segments=len(segments), note="timed with tracemalloc enabled"))
+    return rows
+
+def bench_transcribe(args, workdir, api_key):
+    """Benchmark OpenAI transcription of a short WAV file."""
+    from app.core.data_collection.transcriber import Transcriber
+    audio_path = os.path.join(workdir, "silence.wav")
+    write_wav(audio_path)
+    transcriber = Transcriber(use_openai=True, api_key=api_key)
+    samples = [timed(transcriber.transcribe, audio_path)[1] for _ in range(args.runs)]
+    return summarize_samples("transcribe", None, samples, 10 * len(samples), "audio seconds/s",
+                             peak_memory(lambda: transcriber.transcribe(audio_path)))
+
+def bench_cli(args, words, transcript_path, workdir, env):
+    """Benchmark ``app/main.py --transcript`` in fresh interpreters."""
+    output_path = os.path.join(workdir, "recap.md")
+    command = [sys.executable, "-m", "app.main", "--transcript", transcript_path, "--output", output_path,
+               "--no_cache", "--segment_tokens", str(args.segment_tokens)]
+    log_path = os.path.join(workdir, "cli.log")
+    samples = []
+    peak_rss = 0
+    for _ in range(args.runs):
+        with open(log_path, "w") as log:
+            start = time.perf_counter()
+            process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+            # wait4 reports this child's own peak RSS, unlike RUSAGE_CHILDREN's maximum over every child so far
+            _, status, usage = os.wait4(process.pid, 0)
+            samples.append(time.perf_counter() - start)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            with open(log_path) as log:
+                raise RuntimeError(f"main.py failed: {log.read().strip()[-500:]}")
+        # ru_maxrss is in kilobytes on Linux
+        peak_rss = max(peak_rss, usage.ru_maxrss * 1024)
+    return summarize_samples("cli", words, samples, words * len(samples), "words/s", None,
+                             peak_rss_bytes=peak_rss)
+
+def bench_api(args, text):
+    """Benchmark concurrent text summarization and streaming time to first event through app/api.py."""
+    import httpx
+    import app.api as api
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=600) as client:
+            async def summarize():
+                start = time.perf_counter()
+                response = await client.post("/api/summarize/text", json={"text": text})
+                response.raise_for_status()
+                return time.perf_counter() - start
+
+            async def first_event():
+                start = time.perf_counter()
+                async with client.stream("POST", "/api/summarize/text/stream", json={"text": text}) as response:
+                    response.raise_for_status()
+                    first = None
+                    async for line in response.aiter_lines():
+                        if first is None and line.startswith("data:"):
+                            first = time.perf_counter() - start
+                return first, time.perf_counter() - start
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(summarize() for _ in range(args.api_requests)))
+            wall = time.perf_counter() - start
+            streams = [await first_event() for _ in range(args.runs)]
+        await api.gpt_interface.aclose()
+        return latencies, wall, streams
+
+    latencies, wall, streams = asyncio.run(run())
+    words = len(text.split())
+    rows = [summarize_samples("api_summarize_text", words, latencies, 0, "requests/s", None,
+                              concurrency=args.api_requests)]
+    rows[0]["throughput"] = len(latencies) / wall
+    rows.append(summarize_samples("api_stream_first_event", words, [first for first, _ in streams],
+                                  len(streams), "streams/s", None,
+                                  p50_total_ms=float(np.percentile([total for _, total in streams], 50) * 1000)))
+    return rows
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, tolerance):
+    """Print p50 changes against a baseline results file and return the regressed rows."""
+    with open(baseline_path) as f:
+        baseline = {(row["stage"], row["words"]): row for row in json.load(f)["results"]}
+    regressions = []
+    print(f"Compared with {baseline_path}:")
+    for row in results:
+        previous = baseline.get((row["stage"], row["words"]))
+        if previous is None or not previous["p50_ms"]:
+            continue
+        ratio = row["p50_ms"] / previous["p50_ms"]
+        flag = "  REGRESSION" if ratio > tolerance else ""
+        print(f"  {row['stage']:24s} {str(row['words']):>8s} words  p50 {previous['p50_ms']:9.1f} -> "
+              f"{row['p50_ms']:9.1f} ms ({ratio:.2f}x){flag}")
+        if flag:
+            regressions.append(row)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline offline against a stub OpenAI API")
+    parser.add_argument("--words", type=int, nargs="+", default=[1000, 10000, 100000, 1000000],
+                        help="Synthetic transcript sizes")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per stage")
+    parser.add_argument("--segment_tokens", type=int, default=3000)
+    parser.add_argument("--max_segments", type=int, default=20,
+                        help="Segments per size sampled for create_prompt and generate_completion")
+    parser.add_argument("--summarize_max_words", type=int, default=1000000,
+                        help="Largest transcript run through the full map/reduce summarize")
+    parser.add_argument("--cli_max_words", type=int, default=100000, help="Largest transcript run through main.py")
+    parser.add_argument("--api_words", type=int, default=1500, help="Transcript size sent to the API")
+    parser.add_argument("--api_requests", type=int, default=32, help="Concurrent API requests")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["stages", "transcribe", "cli", "api"],
+                        help="Parts of the suite to skip")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub seconds before the first token")
+    parser.add_argument("--tokens_per_second", type=float, default=2000.0, help="Stub output token rate")
+    parser.add_argument("--completion_tokens", type=int, default=200, help="Stub tokens per completion")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of stub requests that fail")
+    parser.add_argument("--error_kind", type=int, choices=[429, 500], default=429)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    parser.add_argument("--baseline", help="Earlier --json results to compare p50 latencies with")
+    parser.add_argument("--tolerance", type=float, default=1.2,
+                        help="p50 ratio above which a stage counts as a regression")
+    args = parser.parse_args()
+
+    stub = StubOpenAIServer(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                            completion_tokens=args.completion_tokens, error_rate=args.error_rate,
+                            error_kind=args.error_kind).start()
+    api_key = "sk-benchmark"
+    workdir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    # Everything the entry points persist goes to the scratch directory
+    overrides = {
+        "OPENAI_API_KEY": api_key,
+        "OPENAI_BASE_URL": stub.base_url,
+        "COMPLETION_CACHE_PATH": os.path.join(workdir, "completions.sqlite3"),
+        "TRANSCRIPT_CACHE_PATH": os.path.join(workdir, "transcripts.sqlite3"),
+        "JOB_DB_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "MEDIA_DIR": os.path.join(workdir, "media"),
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "RATE_LIMIT_DB_PATH": os.path.join(workdir, "ratelimit.sqlite3"),
+    }
+    os.environ.update(overrides)
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+
+    from app.core.preprocessing.preprocessor import TextPreprocessor
+    from app.core.few_shot.few_shot_learner import FewShotLearner
+    from app.core.model.openai_interface import GPTInterface
+    from app.core.summarization.map_reduce import MapReduceSummarizer
+
+    gpt_interface = GPTInterface(api_key=api_key)
+    few_shot_learner = FewShotLearner()
+    components = (TextPreprocessor(), few_shot_learner, gpt_interface,
+                  MapReduceSummarizer(gpt_interface, few_shot_learner=few_shot_learner, cacheable=False))
+
+    # Load NLTK resources and warm caches so the first timed sample is not an outlier
+    components[0].segment_by_topics(components[0].clean_transcript(synthetic_transcript(200)))
+
+    results = []
+    try:
+        for words in args.words:
+            text = synthetic_transcript(words)
+            if "stages" not in args.skip:
+                results.extend(bench_stages(args, words, text, components))
+            if "cli" not in args.skip and words <= args.cli_max_words:
+                transcript_path = os.path.join(workdir, f"transcript-{words}.txt")
+                with open(transcript_path, "w") as f:
+                    f.write(text)
+                results.append(bench_cli(args, words, transcript_path, workdir, env))
+        if "transcribe" not in args.skip:
+            results.append(bench_transcribe(args, workdir, api_key))
+        if "api" not in args.skip:
+            results.extend(bench_api(args, synthetic_transcript(args.api_words, seed=1)))
+    finally:
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for row in results:
+        throughput = f"{row['throughput']:.1f} {row['throughput_unit']}" if row["throughput"] else "-"
+        memory = row["peak_memory_bytes"] or row.get("peak_rss_bytes")
+        print(f"{row['stage']:24s} {str(row['words'] or '-'):>8s} words  p50 {row['p50_ms']:9.1f} ms  "
+              f"p99 {row['p99_ms']:9.1f} ms  {throughput:>24s}  peak {memory / 1e6 if memory else 0:7.1f} MB")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.time(),
+            "args": vars(args)
+        },
+        "stub": stub.stats(),
+        "results": results
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark TopicSegmenter on synthetic transcripts with known topic boundaries.
+
+Each synthetic topic draws words from its own vocabulary mixed with a shared
+background vocabulary, so the true boundaries are known. The benchmark
+reports segmentation time, the number of segments produced, how many true
+boundaries were found within two sentences, and the largest segment in tokens.
+
+Usage:
+    python benchmarks/segmenter_benchmark.py [--sentences 1000 10000 50000] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.preprocessing.topic_segmenter import TopicSegmenter
+
+def synthetic_sentences(n_sentences, sentences_per_topic=250, topic_share=0.4, seed=0):
+    """Return (sentences, true boundary indices) for a synthetic transcript."""
+    rng = random.Random(seed)
+    background = [f"common{i}" for i in range(300)]
+    sentences = []
+    boundaries = []
+    topic = 0
+    while len(sentences) < n_sentences:
+        if sentences:
+            boundaries.append(len(sentences))
+        vocabulary = [f"topic{topic}term{i}" for i in range(40)]
+        for _ in range(min(sentences_per_topic, n_sentences - len(sentences))):
+            words = [rng.choice(vocabulary) if rng.random() < topic_share else rng.choice(background)
+                     for _ in range(rng.randint(8, 22))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        topic += 1
+    return sentences, boundaries
+
+def recall_within(found, truth, tolerance=2):
+    """Fraction of true boundaries with a found boundary within ``tolerance`` sentences."""
+    if not truth:
+        return 1.0
+    found = sorted(found)
+    hits = 0
+    for boundary in truth:
+        if any(abs(boundary - candidate) <= tolerance for candidate in found):
+            hits += 1
+    return hits / len(truth)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark topic segmentation")
+    parser.add_argument("--sentences", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--max_tokens", type=int, default=3000, help="Per-segment token budget")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per size (best is reported)")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    segmenter = TopicSegmenter(max_tokens=args.max_tokens)
+    results = []
+    for n in args.sentences:
+        sentences, truth = synthetic_sentences(n)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            found = segmenter.boundaries(sentences)
+            timings.append(time.perf_counter() - start)
+
+        starts = [0] + found + [len(sentences)]
+        word_counts = [sum(len(s.split()) for s in sentences[a:b]) for a, b in zip(starts, starts[1:])]
+        row = {
+            "sentences": n,
+            "seconds": min(timings),
+            "segments": len(found) + 1,
+            "true_segments": len(truth) + 1,
+            "boundary_recall": recall_within(found, truth),
+            "max_segment_tokens": max(word_counts) * 4 // 3
+        }
+        results.append(row)
+        print(f"{n:7d} sentences  {row['seconds'] * 1000:8.1f} ms  segments {row['segments']:5d} "
+              f"(true {row['true_segments']})  recall {row['boundary_recall']:.2f}  "
+              f"max segment ~{row['max_segment_tokens']} tokens")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Measure cold-start import time of each entry point against a fixed budget.
+
+Every measurement runs in a fresh interpreter so nothing is shared between
+runs. Besides wall-clock time, each entry point lists modules it must not pull
+in at import time (whisper/torch, moviepy, pytube, youtube_dl, nltk).
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 5] [--json results.json]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["whisper", "torch", "moviepy", "pytube", "youtube_dl", "nltk"]
+
+# Entry point name -> (import statement, budget in seconds)
+ENTRY_POINTS = {
+    "cli": ("import app.main", 1.5),
+    "api": ("import app.api", 2.5),
+    "preprocessor": ("import app.core.preprocessing.preprocessor", 0.2),
+    "transcriber": ("import app.core.data_collection.transcriber", 0.2),
+    "video_collector": ("import app.core.data_collection.video_collector", 0.2),
+}
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{"seconds": elapsed, "heavy_modules": heavy}}))
+"""
+
+def measure(statement, runs):
+    """Import an entry point in fresh interpreters and return timings and heavy imports."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    env.setdefault("OPENAI_API_KEY", "sk-startup-benchmark")
+    code = PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+    timings = []
+    heavy = []
+    # Run from a scratch directory so entry points that create data dirs leave no trace
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(runs):
+            completed = subprocess.run(
+                [sys.executable, "-c", code], cwd=workdir, env=env,
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            timings.append(result["seconds"])
+            heavy = result["heavy_modules"]
+    return {
+        "median_seconds": statistics.median(timings),
+        "max_seconds": max(timings),
+        "heavy_modules": heavy
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark entry point import time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreter runs per entry point")
+    parser.add_argument("--only", nargs="*", choices=sorted(ENTRY_POINTS), help="Entry points to measure")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    failed = False
+    for name in args.only or ENTRY_POINTS:
+        statement, budget = ENTRY_POINTS[name]
+        try:
+            result = measure(statement, args.runs)
+        except RuntimeError as e:
+            results[name] = {"error": str(e), "budget_seconds": budget, "passed": False}
+            print(f"{name:16s} ERROR {e}")
+            failed = True
+            continue
+
+        passed = result["median_seconds"] <= budget and not result["heavy_modules"]
+        result.update({"budget_seconds": budget, "passed": passed})
+        results[name] = result
+        failed = failed or not passed
+        heavy = ", ".join(result["heavy_modules"]) or "-"
+        print(f"{name:16s} median {result['median_seconds'] * 1000:8.1f} ms  "
+              f"budget {budget * 1000:7.0f} ms  heavy imports: {heavy}  "
+              f"{'ok' if passed else 'OVER BUDGET'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
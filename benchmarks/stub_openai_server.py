@@ -0,0 +1,209 @@
+"""A local stand-in for the OpenAI chat completion and transcription endpoints.
+
+Point a client at it with ``OPENAI_BASE_URL=http://127.0.0.1:<port>/v1``. Every
+chat request waits ``--latency`` seconds before the first token and then emits
+``--completion_tokens`` tokens (capped by the request's ``max_tokens``) at
+``--tokens_per_second``, streamed as server-sent events when the request asks
+for a stream. Transcription requests wait ``--latency`` plus
+``--transcription_seconds`` and return a verbose_json transcript. A fraction
+``--error_rate`` of requests fails with a 429 carrying Retry-After, or with a
+500 when ``--error_kind 500`` is given. Responses carry x-ratelimit headers.
+
+Usage:
+    python benchmarks/stub_openai_server.py [--port 8765] [--latency 0.2] [--tokens_per_second 200]
+        [--completion_tokens 200] [--error_rate 0.0] [--error_kind 429]
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the model explains how each layer transforms its input and why the training loop "
+         "updates weights with gradients computed from the loss").split()
+
+class StubOpenAIServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, tokens_per_second=200.0, completion_tokens=200,
+                 transcription_seconds=0.5, error_rate=0.0, error_kind=429, retry_after=0.1, seed=0):
+        """Initialize the stub server; port 0 picks a free port."""
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.transcription_seconds = transcription_seconds
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.retry_after = retry_after
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.server = ThreadingHTTPServer((host, port), _handler_class(self))
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        """The URL to use as the OpenAI base URL."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serve requests on a background thread and return self."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        """Return the number of requests served and errors injected."""
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors}
+
+    def _next_request(self):
+        """Count a request and decide whether it fails."""
+        with self._lock:
+            self.requests += 1
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return fail
+
+def _handler_class(stub):
+    """Return a request handler class bound to a stub configuration."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = self._read_body()
+            if stub._next_request():
+                time.sleep(stub.latency)
+                return self._error()
+            if self.path.endswith("/chat/completions"):
+                return self._chat(json.loads(body or b"{}"))
+            if self.path.endswith("/audio/transcriptions"):
+                return self._transcription()
+            self._json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+        def _read_body(self):
+            if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(parts)
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+
+        def _chat(self, request):
+            tokens = min(stub.completion_tokens, request.get("max_tokens") or stub.completion_tokens)
+            words = [WORDS[i % len(WORDS)] for i in range(tokens)]
+            created = int(time.time())
+            time.sleep(stub.latency)
+            if not request.get("stream"):
+                time.sleep(tokens / stub.tokens_per_second)
+                prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4
+                return self._json(200, {
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": created,
+                    "model": request.get("model", "stub"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": " ".join(words)}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": tokens,
+                              "total_tokens": prompt_tokens + tokens}
+                })
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self._rate_limit_headers()
+            self.end_headers()
+            for i, word in enumerate(words):
+                chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                         "model": request.get("model", "stub"),
+                         "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                      "finish_reason": None}]}
+                self._chunk(f"data: {json.dumps(chunk)}\n\n")
+                time.sleep(1 / stub.tokens_per_second)
+            self._chunk("data: [DONE]\n\n")
+            self._chunk("")
+
+        def _transcription(self):
+            time.sleep(stub.latency + stub.transcription_seconds)
+            text = " ".join(WORDS).capitalize() + "."
+            self._json(200, {"text": text, "language": "english", "duration": 10.0,
+                             "segments": [{"id": 0, "start": 0.0, "end": 10.0, "text": text}]})
+
+        def _error(self):
+            if stub.error_kind == 429:
+                self.send_response(429)
+                self.send_header("Retry-After", str(stub.retry_after))
+            else:
+                self.send_response(500)
+            body = json.dumps({"error": {"message": "Injected error", "type": "stub_error"}}).encode()
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self._rate_limit_headers()
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _chunk(self, text):
+            data = text.encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def _rate_limit_headers(self):
+            self.send_header("x-ratelimit-remaining-requests", "10000")
+            self.send_header("x-ratelimit-remaining-tokens", "10000000")
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the OpenAI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens_per_second", type=float, default=200.0, help="Output token rate")
+    parser.add_argument("--completion_tokens", type=int, default=200, help="Tokens per completion")
+    parser.add_argument("--transcription_seconds", type=float, default=0.5, help="Extra time per transcription")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error_kind", type=int, choices=[429, 500], default=429, help="Status of injected errors")
+    args = parser.parse_args()
+
+    stub = StubOpenAIServer(args.host, args.port, latency=args.latency, tokens_per_second=args.tokens_per_second,
+                            completion_tokens=args.completion_tokens,
+                            transcription_seconds=args.transcription_seconds,
+                            error_rate=args.error_rate, error_kind=args.error_kind)
+    print(f"Serving a stub OpenAI API at {stub.base_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+if __name__ == "__main__":
+    main()
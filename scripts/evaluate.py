@@ -0,0 +1,47 @@
+import os
+import sys
+import argparse
+import json
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.evaluation.model_evaluator import ModelEvaluator, read_pairs
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Score generated summaries against references")
+    parser.add_argument("--pairs", required=True, help="JSONL file with id, generated and reference fields")
+    parser.add_argument("--output", default="evaluation_report.json", help="Path to save the report")
+    parser.add_argument("--workers", type=int, help="Processes for ROUGE and BLEU (default: all CPUs)")
+    parser.add_argument("--no_bert", action="store_true", help="Skip BERTScore")
+    parser.add_argument("--bert_model", default="distilbert-base-uncased", help="Model used for BERTScore")
+    parser.add_argument("--bert_batch_size", type=int, default=32, help="Texts per BERTScore batch")
+    parser.add_argument("--bert_num_layers", type=int,
+                        help="Layer whose embeddings BERTScore uses (default: bert_score's choice for the model)")
+    parser.add_argument("--embedding_cache", default="./data/cache/bertscore",
+                        help="Directory caching reference embeddings")
+
+    args = parser.parse_args()
+
+    pairs = read_pairs(args.pairs)
+    logger.info(f"Evaluating {len(pairs)} pairs from {args.pairs}")
+    evaluator = ModelEvaluator(bert_model=args.bert_model, bert_batch_size=args.bert_batch_size,
+                               embedding_cache_dir=args.embedding_cache, num_layers=args.bert_num_layers)
+    report = evaluator.evaluate_corpus(pairs, workers=args.workers, bert=not args.no_bert)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for metric, stats in report["aggregate"].items():
+        logger.info(f"  {metric}: mean {stats['mean']:.4f}, median {stats['median']:.4f}")
+    logger.info(f"Scored {report['count']} pairs in {report['elapsed_seconds']:.1f}s; report saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
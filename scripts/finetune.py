@@ -1,10 +1,22 @@
 import os
+import re
+import sys
+import time
 import argparse
+import hashlib
+import itertools
 import json
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from dotenv import load_dotenv
 import openai
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.few_shot.token_counter import TokenCounter, context_window
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -15,44 +27,348 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-def prepare_training_data(input_file, output_file, format="pairs"):
+SYSTEM_PROMPT = "You are a helpful assistant that creates concise summaries of tutorial videos."
+USER_PROMPT_PREFIX = "Please summarize this tutorial transcript: "
+
+# Tokens the chat format adds per message, and once per example to prime the reply
+MESSAGE_TOKENS = 4
+REPLY_TOKENS = 3
+
+# Records sent to a worker process at a time, and batches in flight per worker
+BATCH_SIZE = 256
+BATCHES_IN_FLIGHT = 4
+
+# Characters read at a time when parsing a JSON array incrementally
+READ_CHUNK_CHARS = 1024 * 1024
+
+# Words per shingle hashed into a record's SimHash fingerprint
+SHINGLE_WORDS = 3
+SIMHASH_BANDS = 4
+SIMHASH_BAND_BITS = 64 // SIMHASH_BANDS
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def iter_records(path):
+    """Yield records from a JSONL file or a JSON array file without loading it whole.
+
+    A file whose first non-blank character is ``[`` is parsed one array item at
+    a time; anything else is read as JSON Lines.
+    """
+    with open(path, "r") as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if first == "[":
+            yield from _iter_json_array(f)
+        else:
+            f.seek(0)
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{line_number} is not valid JSON: {e}") from e
+
+def _iter_json_array(f):
+    """Yield the items of a JSON array from a file positioned after its ``[``, reading it in chunks."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(READ_CHUNK_CHARS)
+    eof = False
+    position = 0
+    expect_item = True
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n":
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            buffer, position, eof = _read_more(f, buffer, position)
+            continue
+        if buffer[position] == "]":
+            return
+        if not expect_item:
+            if buffer[position] != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, found {buffer[position]!r}")
+            position += 1
+            expect_item = True
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            buffer, position, eof = _read_more(f, buffer, position)
+            continue
+        if end == len(buffer) and not eof:
+            # A number at the end of the buffer may continue in the next chunk
+            buffer, position, eof = _read_more(f, buffer, position)
+            continue
+        yield item
+        position = end
+        expect_item = False
+
+def _read_more(f, buffer, position):
+    """Drop the consumed part of the buffer and append the next chunk.
+
+    The read size grows with the unparsed remainder, so a record larger than a
+    chunk is re-parsed a logarithmic rather than linear number of times.
+    """
+    remainder = buffer[position:]
+    chunk = f.read(max(READ_CHUNK_CHARS, len(remainder)))
+    return remainder + chunk, 0, not chunk
+
+def simhash(text):
+    """Return the 64-bit SimHash of a text's word shingles, or None if it has no words."""
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little")
+                       for s in shingles], dtype=np.uint64)
+    bits = np.unpackbits(hashes.view(np.uint8), bitorder="little").reshape(-1, 64)
+    majority = bits.sum(axis=0) * 2 > len(hashes)
+    return int(np.packbits(majority, bitorder="little").view(np.uint64)[0])
+
+class NearDuplicateFilter:
+    def __init__(self, max_distance=3):
+        """Initialize a filter of texts whose SimHash differs from an earlier one in at most ``max_distance`` bits.
+
+        Fingerprints are split into SIMHASH_BANDS bands; two fingerprints within
+        ``max_distance`` bits of each other share a band whenever
+        ``max_distance`` is below the number of bands, so only fingerprints in
+        the same band buckets are compared. Only the fingerprints are kept, a
+        few hundred bytes per unique record.
+        """
+        if max_distance >= SIMHASH_BANDS:
+            raise ValueError(f"max_distance must be below {SIMHASH_BANDS}")
+        self.max_distance = max_distance
+        self._buckets = [{} for _ in range(SIMHASH_BANDS)]
+
+    def add(self, fingerprint):
+        """Remember a fingerprint; return False if it is a near duplicate of one seen before."""
+        mask = (1 << SIMHASH_BAND_BITS) - 1
+        keys = [(fingerprint >> (band * SIMHASH_BAND_BITS)) & mask for band in range(SIMHASH_BANDS)]
+        for buckets, key in zip(self._buckets, keys):
+            for seen in buckets.get(key, ()):
+                if bin(seen ^ fingerprint).count("1") <= self.max_distance:
+                    return False
+        for buckets, key in zip(self._buckets, keys):
+            buckets.setdefault(key, []).append(fingerprint)
+        return True
+
+class ShardWriter:
+    def __init__(self, output_file, shard_size):
+        """Initialize a writer that splits JSONL lines into shards of ``shard_size`` examples.
+
+        Shards are named after ``output_file`` with a numeric suffix, e.g.
+        ``training_data-00000.jsonl``.
+        """
+        self.base, self.extension = os.path.splitext(output_file)
+        self.extension = self.extension or ".jsonl"
+        self.shard_size = shard_size
+        self.shards = []
+        self._file = None
+
+    def write(self, line, tokens):
+        """Append one serialized example, starting a new shard when the current one is full."""
+        if self._file is None or self.shards[-1]["examples"] >= self.shard_size:
+            self._open_next()
+        self._file.write(line + "\n")
+        shard = self.shards[-1]
+        shard["examples"] += 1
+        shard["tokens"] += tokens
+
+    def close(self):
+        """Close the current shard and record the size of every shard."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for shard in self.shards:
+            shard["bytes"] = os.path.getsize(shard["path"])
+
+    def _open_next(self):
+        if self._file is not None:
+            self._file.close()
+        path = f"{self.base}-{len(self.shards):05d}{self.extension}"
+        self._file = open(path, "w")
+        self.shards.append({"path": path, "examples": 0, "tokens": 0})
+
+def chat_example(transcript, summary):
+    """Return the chat-format training example for a transcript/summary pair."""
+    return {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": USER_PROMPT_PREFIX + transcript},
+            {"role": "assistant", "content": summary}
+        ]
+    }
+
+def count_example_tokens(counter, messages):
+    """Return the tokens a chat example uses, including the chat format overhead."""
+    return sum(counter.count(m["content"]) + MESSAGE_TOKENS for m in messages) + REPLY_TOKENS
+
+def _init_prepare_worker(model, max_tokens, format):
+    """Build one token counter per pool process."""
+    global _worker_settings
+    _worker_settings = (TokenCounter(model), max_tokens, format)
+
+def _prepare_batch(records):
+    """Prepare a batch of records in a pool process."""
+    return [prepare_record(record, *_worker_settings) for record in records]
+
+def prepare_record(record, counter, max_tokens, format="pairs"):
+    """Validate, truncate and serialize one input record.
+
+    Returns ``(status, line, tokens, fingerprint)`` where status is "ok",
+    "truncated" or the reason the record was skipped ("invalid", "empty" or
+    "too_long"). Pairs whose example exceeds ``max_tokens`` have their
+    transcript cut to fit; chat objects that do not fit are skipped.
+    """
+    if not isinstance(record, dict):
+        return "invalid", None, 0, None
+
+    if format == "pairs":
+        transcript = record.get("transcript", "")
+        summary = record.get("summary", "")
+        if not isinstance(transcript, str) or not isinstance(summary, str):
+            return "invalid", None, 0, None
+        transcript, summary = transcript.strip(), summary.strip()
+        if not transcript or not summary:
+            return "empty", None, 0, None
+        example = chat_example(transcript, summary)
+        tokens = count_example_tokens(counter, example["messages"])
+        status = "ok"
+        budget = counter.count(transcript)
+        # A cut transcript can encode to more tokens than its budget, so shrink until it fits
+        while tokens > max_tokens:
+            budget -= tokens - max_tokens
+            if budget < 1:
+                return "too_long", None, tokens, None
+            cut = counter.split(transcript, budget)[0]
+            example = chat_example(cut, summary)
+            tokens = count_example_tokens(counter, example["messages"])
+            status = "truncated"
+        if status == "truncated":
+            transcript = cut
+        source_text = transcript
+    else:
+        messages = record.get("messages")
+        if (not isinstance(messages, list) or not messages
+                or not all(isinstance(m, dict) and isinstance(m.get("role"), str)
+                           and isinstance(m.get("content"), str) for m in messages)
+                or messages[-1]["role"] != "assistant"):
+            return "invalid", None, 0, None
+        if not all(m["content"].strip() for m in messages):
+            return "empty", None, 0, None
+        example = {"messages": [{"role": m["role"], "content": m["content"]} for m in messages]}
+        tokens = count_example_tokens(counter, example["messages"])
+        if tokens > max_tokens:
+            return "too_long", None, tokens, None
+        status = "ok"
+        source_text = " ".join(m["content"] for m in messages if m["role"] == "user")
+
+    return status, json.dumps(example), tokens, simhash(source_text)
+
+def _batches(records, size):
+    """Group an iterable into lists of at most ``size`` items."""
+    iterator = iter(records)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+def _prepared_batches(records, model, max_tokens, format, workers):
+    """Yield prepared batches in input order, keeping a bounded number in flight."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        counter = TokenCounter(model)
+        for batch in _batches(records, BATCH_SIZE):
+            yield [prepare_record(record, counter, max_tokens, format) for record in batch]
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_prepare_worker,
+                             initargs=(model, max_tokens, format)) as executor:
+        pending = deque()
+        for batch in _batches(records, BATCH_SIZE):
+            pending.append(executor.submit(_prepare_batch, batch))
+            if len(pending) >= workers * BATCHES_IN_FLIGHT:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def prepare_training_data(input_file, output_file, format="pairs", model="gpt-3.5-turbo", max_tokens=None,
+                          shard_size=50000, workers=None, max_distance=3):
     """
     Prepare training data for fine-tuning.
-    
+
+    Records are streamed from the input and prepared on ``workers`` processes,
+    so memory use does not grow with the size of the dataset apart from one
+    SimHash fingerprint per kept example. Each record is validated, counted in
+    tokens and truncated to ``max_tokens``; records whose transcript is within
+    ``max_distance`` bits of an earlier one are dropped as near duplicates.
+
     Args:
-        input_file: Path to the input JSON file containing transcript-summary pairs
-        output_file: Path to save the formatted training data
-        format: Format of the input data ("pairs" or "objects")
+        input_file: Path to a JSONL or JSON array file of input records
+        output_file: Base path of the training data; shards are written next to it
+        format: Format of the input data ("pairs" of transcript/summary or chat "objects" with messages)
+        model: Model whose tokenizer and context window are used
+        max_tokens: Token limit per example (default: the model's context window)
+        shard_size: Examples per output shard
+        workers: Worker processes (default: all CPUs)
+        max_distance: SimHash bit distance treated as a duplicate, or None to keep duplicates
+
+    Returns:
+        The manifest, also saved next to the shards as ``<output>.manifest.json``
     """
     logger.info(f"Preparing training data from {input_file}")
-    
-    with open(input_file, 'r') as f:
-        data = json.load(f)
-    
-    training_data = []
-    
-    if format == "pairs":
-        for item in data:
-            transcript = item.get("transcript", "")
-            summary = item.get("summary", "")
-            
-            if not transcript or not summary:
-                continue
-                
-            training_example = {
-                "messages": [
-                    {"role": "system", "content": "You are a helpful assistant that creates concise summaries of tutorial videos."},
-                    {"role": "user", "content": f"Please summarize this tutorial transcript: {transcript}"},
-                    {"role": "assistant", "content": summary}
-                ]
-            }
-            training_data.append(training_example)
-    
-    with open(output_file, 'w') as f:
-        for item in training_data:
-            f.write(json.dumps(item) + "\n")
-    
-    logger.info(f"Training data saved to {output_file}")
+    started = time.perf_counter()
+    max_tokens = max_tokens or context_window(model)
+    dedup = NearDuplicateFilter(max_distance) if max_distance is not None else None
+    writer = ShardWriter(output_file, shard_size)
+    counts = {"read": 0, "written": 0, "truncated": 0, "duplicate": 0, "invalid": 0, "empty": 0, "too_long": 0}
+    token_stats = {"total": 0, "min": None, "max": 0}
+
+    try:
+        for batch in _prepared_batches(iter_records(input_file), model, max_tokens, format, workers):
+            for status, line, tokens, fingerprint in batch:
+                counts["read"] += 1
+                if line is None:
+                    counts[status] += 1
+                    continue
+                if dedup is not None and fingerprint is not None and not dedup.add(fingerprint):
+                    counts["duplicate"] += 1
+                    continue
+                if status == "truncated":
+                    counts["truncated"] += 1
+                counts["written"] += 1
+                writer.write(line, tokens)
+                token_stats["total"] += tokens
+                token_stats["max"] = max(token_stats["max"], tokens)
+                token_stats["min"] = tokens if token_stats["min"] is None else min(token_stats["min"], tokens)
+            if counts["read"] % (BATCH_SIZE * 100) < BATCH_SIZE:
+                logger.info(f"Processed {counts['read']} records, kept {counts['written']}")
+    finally:
+        writer.close()
+
+    token_stats["mean"] = token_stats["total"] / counts["written"] if counts["written"] else 0
+    manifest = {
+        "input": input_file,
+        "format": format,
+        "model": model,
+        "max_tokens": max_tokens,
+        "max_distance": max_distance,
+        "records": counts,
+        "tokens": token_stats,
+        "shards": writer.shards,
+        "elapsed_seconds": time.perf_counter() - started
+    }
+    manifest_path = f"{writer.base}.manifest.json"
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    skipped = counts["read"] - counts["written"]
+    logger.info(f"Wrote {counts['written']} examples ({token_stats['total']} tokens) in {len(writer.shards)} "
+                f"shard(s); skipped {skipped}, truncated {counts['truncated']}. Manifest: {manifest_path}")
+    return manifest
 
 def fine_tune_model(training_file, model_suffix, base_model="gpt-3.5-turbo"):
     """
@@ -102,8 +418,16 @@ def fine_tune_model(training_file, model_suffix, base_model="gpt-3.5-turbo"):
 def main():
     parser = argparse.ArgumentParser(description="Fine-tune a model for video recap generation")
     parser.add_argument("--input", required=True, help="Path to input data file")
-    parser.add_argument("--output", default="training_data.jsonl", help="Path to save prepared training data")
+    parser.add_argument("--output", default="training_data.jsonl",
+                        help="Base path of the training data; shards are written as e.g. "
+                             "training_data-00000.jsonl next to a training_data.manifest.json")
     parser.add_argument("--format", choices=["pairs", "objects"], default="pairs", help="Format of input data")
+    parser.add_argument("--max_tokens", type=int, help="Token limit per example (default: the model's context window)")
+    parser.add_argument("--shard_size", type=int, default=50000, help="Examples per output shard")
+    parser.add_argument("--workers", type=int, help="Processes preparing records (default: all CPUs)")
+    parser.add_argument("--max_distance", type=int, default=3, choices=range(-1, SIMHASH_BANDS),
+                        metavar=f"{{-1..{SIMHASH_BANDS - 1}}}",
+                        help="SimHash bit distance at which transcripts count as duplicates (-1 keeps duplicates)")
     parser.add_argument("--base_model", default="gpt-3.5-turbo", help="Base model to fine-tune")
     parser.add_argument("--model_suffix", default="video-recap", help="Suffix for the fine-tuned model")
     parser.add_argument("--prepare_only", action="store_true", help="Only prepare training data, don't start fine-tuning")
@@ -111,11 +435,24 @@ def main():
     args = parser.parse_args()
     
     # Prepare training data
-    prepare_training_data(args.input, args.output, args.format)
+    manifest = prepare_training_data(args.input, args.output, args.format, model=args.base_model,
+                                     max_tokens=args.max_tokens, shard_size=args.shard_size,
+                                     workers=args.workers,
+                                     max_distance=None if args.max_distance < 0 else args.max_distance)
     
     # Start fine-tuning if not in prepare-only mode
     if not args.prepare_only:
-        fine_tune_model(args.output, args.model_suffix, args.base_model)
+        shards = manifest["shards"]
+        if not shards:
+            logger.error("No training examples were prepared")
+            return
+        if len(shards) > 1:
+            # A fine-tuning job trains on a single file, so the other shards would be silently dropped
+            logger.error(f"Prepared {len(shards)} shards, but fine-tuning takes one training file. Use "
+                         f"--shard_size {manifest['records']['written']} or larger, or --prepare_only and "
+                         f"fine-tune on the shards listed in the manifest yourself.")
+            sys.exit(1)
+        fine_tune_model(shards[0]["path"], args.model_suffix, args.base_model)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+
+from app.core.formatting.output_formatter import OutputFormatter
+from app.core.jobs.batch_runner import BatchRunner
+
+class FakePipeline:
+    def __init__(self, fail_stage=None):
+        self.fail_stage = fail_stage
+        self.held = set()
+        self.events = []
+
+    @contextmanager
+    def _media_reference(self, key):
+        if key is None:
+            yield
+            return
+        self.held.add(key)
+        try:
+            yield
+        finally:
+            self.held.discard(key)
+
+    def _download_key(self, url):
+        return f"youtube:{url}:audio"
+
+    def _audio_key(self, video_path):
+        return f"audio:{video_path}"
+
+    def _run(self, stage, value):
+        self.events.append((stage, frozenset(self.held)))
+        if stage == self.fail_stage:
+            raise RuntimeError(f"{stage} failed")
+        return value
+
+    def download(self, url):
+        return self._run("download", f"{url}.mp4")
+
+    def extract_audio(self, video_path):
+        return self._run("extract_audio", f"{video_path}.wav")
+
+    def transcribe(self, audio_path):
+        return self._run("transcribe", "Some transcript.")
+
+    def summarize(self, text):
+        return self._run("summarize", "## Recap\n- point")
+
+def run(pipeline, tmp_path):
+    runner = BatchRunner(pipeline, OutputFormatter(format_type="markdown"))
+    return runner.run([{"id": "v1", "url": "v1", "output": str(tmp_path / "v1.md")}])
+
+def test_media_references_are_held_between_stages(tmp_path):
+    pipeline = FakePipeline()
+    report = run(pipeline, tmp_path)
+
+    assert report["completed"] == 1
+    assert dict(pipeline.events) == {
+        "download": {"youtube:v1:audio"},
+        "extract_audio": {"youtube:v1:audio", "audio:v1.mp4"},
+        "transcribe": {"audio:v1.mp4"},
+        "summarize": set(),
+    }
+    assert pipeline.held == set()
+
+def test_media_references_are_released_when_a_stage_fails(tmp_path):
+    for stage in ("download", "extract_audio", "transcribe"):
+        pipeline = FakePipeline(fail_stage=stage)
+        report = run(pipeline, tmp_path)
+        assert [failure["stage"] for failure in report["failed"]] == [stage]
+        assert pipeline.held == set()
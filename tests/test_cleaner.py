@@ -0,0 +1,107 @@
+import random
+import re
+
+import pytest
+
+from app.core.preprocessing.cleaner import CleanerStream, TranscriptCleaner
+
+TOKENS = ["um", "Um", "uh", "like", "likely", "you know", "you  know", "actually", "[00:01:02]",
+          "Speaker 1: ", "Speaker 12: ", "foo", "bar.", " ", "  ", "\n", "\t", "a", "l", "ike",
+          "um,", ",", "Speaker", "1:", "x"]
+
+def random_transcript(rng):
+    return "".join(rng.choice(TOKENS) + (" " if rng.random() < 0.6 else "") for _ in range(rng.randint(0, 25)))
+
+def random_chunks(rng, text, max_size):
+    chunks = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, max_size)
+        chunks.append(text[position:position + size])
+        position += size
+    return chunks
+
+def stream_clean(cleaner, chunks):
+    stream = CleanerStream(cleaner)
+    return "".join(stream.feed(chunk) for chunk in chunks) + stream.close()
+
+def test_clean_removes_labels_timestamps_and_fillers():
+    cleaner = TranscriptCleaner()
+    text = "Speaker 1: [00:00:05] Um, so  basically we\tlike   the likely outcome.\n\nSpeaker 2: Uh yes."
+    assert cleaner.clean(text) == ", so we the likely outcome. yes."
+
+@pytest.mark.parametrize("max_size", [1, 3, 10, 200])
+def test_stream_matches_one_shot_clean(max_size):
+    cleaner = TranscriptCleaner()
+    rng = random.Random(max_size)
+    for _ in range(2000):
+        text = random_transcript(rng)
+        assert stream_clean(cleaner, random_chunks(rng, text, max_size)) == cleaner.clean(text), repr(text)
+
+@pytest.mark.parametrize("options", [
+    {"filler_words": []},
+    {"timestamp_patterns": [], "speaker_patterns": []},
+    {"filler_words": ["so", "you see"], "speaker_patterns": [r"[A-Z]+: "]},
+])
+def test_stream_matches_one_shot_clean_with_custom_patterns(options):
+    cleaner = TranscriptCleaner(**options)
+    rng = random.Random(0)
+    tokens = TOKENS + ["so", "you see", "ALICE: ", "BOB: "]
+    for _ in range(1000):
+        text = "".join(rng.choice(tokens) + (" " if rng.random() < 0.6 else "") for _ in range(rng.randint(0, 25)))
+        assert stream_clean(cleaner, random_chunks(rng, text, 7)) == cleaner.clean(text), repr(text)
+
+def test_stream_of_long_transcript_emits_before_close():
+    cleaner = TranscriptCleaner()
+    rng = random.Random(1)
+    text = " ".join(random_transcript(rng) for _ in range(2000))
+    chunks = random_chunks(rng, text, 4096)
+    stream = CleanerStream(cleaner)
+    emitted = [stream.feed(chunk) for chunk in chunks]
+    # Only about ``lookahead`` characters are held back between chunks
+    assert len(stream._buffer) <= cleaner.lookahead + 4096
+    assert sum(map(len, emitted)) > 0
+    assert "".join(emitted) + stream.close() == cleaner.clean(text)
+
+def test_clean_stream_yields_the_same_text():
+    cleaner = TranscriptCleaner()
+    text = "Um [00:01:02] hello   there, Speaker 3: you know it works."
+    assert "".join(cleaner.clean_stream(text[i:i + 5] for i in range(0, len(text), 5))) == cleaner.clean(text)
+
+def baseline_clean(text):
+    """The multi-pass cleaner the single-pass engine replaced."""
+    text = re.sub(r'\[\d{2}:\d{2}:\d{2}\]', '', text)
+    text = re.sub(r'Speaker \d+: ', '', text)
+    for word in ['um', 'uh', 'ah', 'like', 'you know', 'actually', 'basically', 'literally']:
+        text = re.sub(r'\b' + word + r'\b', '', text, flags=re.IGNORECASE)
+    return re.sub(r'\s+', ' ', text).strip()
+
+@pytest.mark.parametrize("text", [
+    "I like[00:00:01]cats",
+    "likeSpeaker 1: hello",
+    "umSpeaker 1: [00:00:02]hello",
+    "so like[00:00:01] cats",
+    "like[00:00:01]Speaker 1: , so",
+    "[00:00:01]like it",
+    "you know[00:00:01]. Right",
+])
+def test_fillers_glued_to_removed_tokens_match_baseline(text):
+    assert TranscriptCleaner().clean(text) == baseline_clean(text)
+
+@pytest.mark.parametrize("text, expected, baseline", [
+    # Text before a filler is not re-joined across removed tokens
+    ("a[00:00:01]like", "a", "alike"),
+    ("l[00:00:01]ike", "like", ""),
+])
+def test_fillers_after_removed_tokens_differ_from_baseline(text, expected, baseline):
+    assert TranscriptCleaner().clean(text) == expected
+    assert baseline_clean(text) == baseline
+
+def test_lookahead_covers_every_removal_pattern():
+    cleaner = TranscriptCleaner(lookahead=1, speaker_patterns=[r"Moderator \(\w{1,20}\): "])
+    assert cleaner.lookahead >= len("Moderator (abcdefghijklmnopqrst): ")
+    rng = random.Random(2)
+    tokens = TOKENS + ["Moderator (alice): ", "Moderator (abcdefghijklmnopqrst): "]
+    for _ in range(1000):
+        text = "".join(rng.choice(tokens) + (" " if rng.random() < 0.6 else "") for _ in range(rng.randint(0, 25)))
+        assert stream_clean(cleaner, random_chunks(rng, text, 3)) == cleaner.clean(text), repr(text)
@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.core.model import completion_cache
+from app.core.model.completion_cache import CompletionCache
+from app.core.model.openai_interface import GPTInterface
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(completion_cache.time, "time", clock)
+    return clock
+
+def cache(tmp_path, **limits):
+    return CompletionCache(str(tmp_path / "cache" / "completions.sqlite3"), **limits)
+
+def test_key_covers_every_request_parameter():
+    key = CompletionCache.make_key("gpt-4o", "Summarize this.", 500, 0)
+    assert CompletionCache.make_key("gpt-4o", "Summarize this.", 500, 0) == key
+    assert len({
+        key,
+        CompletionCache.make_key("gpt-4o-mini", "Summarize this.", 500, 0),
+        CompletionCache.make_key("gpt-4o", "Summarize that.", 500, 0),
+        CompletionCache.make_key("gpt-4o", "Summarize this.", 501, 0),
+        CompletionCache.make_key("gpt-4o", "Summarize this.", 500, 0.7),
+    }) == 5
+
+def test_completions_persist_across_instances(tmp_path, clock):
+    key = CompletionCache.make_key("gpt-4o", "prompt", 100, 0)
+    assert cache(tmp_path).get(key) is None
+    cache(tmp_path).set(key, "résumé")
+
+    reopened = cache(tmp_path)
+    assert reopened.get(key) == "résumé"
+    assert reopened.stats() == {"hits": 1, "misses": 0, "hit_rate": 1.0, "entries": 1,
+                                "bytes": len("résumé".encode("utf-8"))}
+
+def test_expired_entries_are_not_returned(tmp_path, clock):
+    store = cache(tmp_path, max_age_seconds=60)
+    store.set("old", "stale summary")
+    clock.now += 61
+    assert store.get("old") is None
+    assert store.stats()["entries"] == 0
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    store = cache(tmp_path, max_entries=2)
+    for key in ("a", "b"):
+        store.set(key, key)
+        clock.now += 1
+    store.get("a")
+    clock.now += 1
+    store.set("c", "c")
+
+    assert store.get("b") is None
+    assert store.get("a") == "a"
+    assert store.get("c") == "c"
+
+def test_entries_are_evicted_to_fit_max_bytes(tmp_path, clock):
+    store = cache(tmp_path, max_bytes=10)
+    store.set("a", "x" * 6)
+    clock.now += 1
+    store.set("b", "y" * 6)
+
+    assert store.get("a") is None
+    assert store.stats()["bytes"] == 6
+
+def test_clear_invalidates_everything(tmp_path, clock):
+    store = cache(tmp_path)
+    store.set("a", "summary")
+    store.clear()
+    assert store.get("a") is None
+    assert store.stats()["entries"] == 0
+
+def test_interface_caches_deterministic_completions_only(tmp_path):
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="summary"))],
+                                     usage=None)
+        return SimpleNamespace(headers=httpx.Headers(), parse=lambda: completion)
+
+    gpt = GPTInterface(api_key="sk-test", cache=cache(tmp_path))
+    gpt.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        with_raw_response=SimpleNamespace(create=create))))
+
+    for _ in range(2):
+        assert gpt.generate_completion("prompt", max_tokens=50, temperature=0) == "summary"
+    assert len(requests) == 1
+    # Sampled calls always reach the API unless marked cacheable
+    for _ in range(2):
+        gpt.generate_completion("prompt", max_tokens=50, temperature=0.7)
+    assert len(requests) == 3
+    gpt.generate_completion("prompt", max_tokens=50, temperature=0.7, cacheable=True)
+    gpt.generate_completion("prompt", max_tokens=50, temperature=0.7, cacheable=True)
+    assert len(requests) == 4
@@ -0,0 +1,104 @@
+import json
+
+import numpy as np
+
+from app.core.few_shot import example_index
+from app.core.few_shot.example_index import ExampleIndex
+
+EXAMPLES = [
+    {"input": "neural networks learn weights with gradient descent", "output": "ml"},
+    {"input": "python lists and dictionaries for beginners", "output": "python"},
+    {"input": "baking sourdough bread with a starter", "output": "baking"},
+    {"input": "convolutional neural networks for images", "output": "cnn"},
+]
+
+def reference_scores(index, text):
+    """Score every example by brute force over the stored rows."""
+    terms, counts = index._term_counts(text)
+    idf = index._idf(terms)
+    query = (1 + np.log(counts)) * idf
+    query = dict(zip(terms.tolist(), (query / np.linalg.norm(query) * idf).tolist()))
+    scores = []
+    for example in index.examples:
+        row_terms, row_counts = index._term_counts(example["input"])
+        weights = 1 + np.log(row_counts)
+        weights /= np.linalg.norm(weights)
+        scores.append(sum(query.get(t, 0.0) * w for t, w in zip(row_terms.tolist(), weights.tolist())))
+    return np.array(scores)
+
+def test_added_examples_are_searchable_without_rebuilding(monkeypatch):
+    index = ExampleIndex(dims=2 ** 12)
+    index.add_examples(EXAMPLES[:3])
+    index._compact()
+    base = index._base_postings
+
+    def fail():
+        raise AssertionError("search must not rebuild the postings")
+
+    monkeypatch.setattr(index, "_compact", fail)
+    index.add_example(EXAMPLES[3]["input"], EXAMPLES[3]["output"])
+    assert index._base_postings is base
+
+    results = index.search("neural networks for images", k=2)
+    assert [position for _, position in results] == [3, 0]
+    expected = reference_scores(index, "neural networks for images")
+    np.testing.assert_allclose([score for score, _ in results], np.sort(expected)[::-1][:2], rtol=1e-5)
+
+def test_idf_reflects_examples_added_after_the_base():
+    incremental = ExampleIndex(dims=2 ** 12)
+    incremental.add_examples(EXAMPLES[:2])
+    incremental._compact()
+    incremental.add_examples(EXAMPLES[2:])
+
+    rebuilt = ExampleIndex(dims=2 ** 12)
+    rebuilt.add_examples(EXAMPLES)
+    rebuilt._compact()
+
+    for query in ("neural networks", "bread starter", "python for beginners"):
+        incremental_results = incremental.search(query, k=4)
+        rebuilt_results = rebuilt.search(query, k=4)
+        assert [p for _, p in incremental_results] == [p for _, p in rebuilt_results]
+        np.testing.assert_allclose([s for s, _ in incremental_results], [s for s, _ in rebuilt_results], rtol=1e-5)
+        np.testing.assert_allclose(sorted(s for s, _ in incremental.search(query, k=4)),
+                                   sorted(reference_scores(incremental, query)), rtol=1e-5)
+
+def test_compacts_once_recent_postings_outnumber_the_base(monkeypatch):
+    monkeypatch.setattr(example_index, "MIN_COMPACT_POSTINGS", 4)
+    index = ExampleIndex(dims=2 ** 12)
+    index.add_examples(EXAMPLES)
+    assert index._recent_nnz <= max(len(index._base_postings[1]), 4)
+    assert len(index._base_postings[1]) > 0
+    assert index.top_k("sourdough bread", k=1) == [EXAMPLES[2]]
+
+def test_ties_are_broken_by_insertion_order():
+    index = ExampleIndex(dims=2 ** 12)
+    index.add_examples([{"input": "same words here", "output": str(i)} for i in range(5)])
+    assert [position for _, position in index.search("same words", k=5)] == [0, 1, 2, 3, 4]
+    assert index.search("unrelated", k=3) == [(0.0, 0), (0.0, 1), (0.0, 2)]
+    assert index.search("", k=3) == []
+
+def test_save_load_round_trip_and_add_after_load(tmp_path):
+    index = ExampleIndex(dims=2 ** 12)
+    index.add_examples(EXAMPLES[:3])
+    index.save(tmp_path / "index")
+
+    loaded = ExampleIndex.load(tmp_path / "index")
+    assert loaded.examples == index.examples
+    assert loaded.search("gradient descent", k=3) == index.search("gradient descent", k=3)
+
+    loaded.add_example(EXAMPLES[3]["input"], EXAMPLES[3]["output"])
+    index.add_example(EXAMPLES[3]["input"], EXAMPLES[3]["output"])
+    assert loaded.search("neural networks for images", k=4) == index.search("neural networks for images", k=4)
+
+def test_rebuilds_postings_of_indexes_saved_before_the_version(tmp_path):
+    index = ExampleIndex(dims=2 ** 12)
+    index.add_examples(EXAMPLES)
+    index.save(tmp_path / "index")
+    meta_path = tmp_path / "index" / "meta.json"
+    meta = json.loads(meta_path.read_text())
+    del meta["postings_version"]
+    meta_path.write_text(json.dumps(meta))
+    np.save(tmp_path / "index" / "posting_weights.npy", np.zeros_like(index._base_postings[2]))
+
+    loaded = ExampleIndex.load(tmp_path / "index")
+    assert loaded.search("bread", k=2) == index.search("bread", k=2)
@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+
+from app.core.few_shot.few_shot_learner import FewShotLearner
+from app.core.few_shot.token_counter import MESSAGE_OVERHEAD_TOKENS, PromptTooLargeError
+
+TEMPLATE = "Examples:\n{examples}\nInput:\n{input}"
+
+def examples(n, words=40):
+    return [{"input": " ".join([f"input{i}"] * words), "output": f"summary {i}"} for i in range(n)]
+
+def test_examples_are_packed_within_the_budget():
+    learner = FewShotLearner(examples(10))
+    counter = learner.token_counter()
+    budget = 400 - 100 - MESSAGE_OVERHEAD_TOKENS
+
+    packed = learner.create_packed_prompt("a short transcript", n_shots=10, template=TEMPLATE,
+                                          max_tokens=100, context_window=400)
+    assert 0 < packed["examples"] < 10
+    assert packed["prompt_tokens"] == counter.count(packed["prompt"])
+    assert packed["prompt_tokens"] + packed["remaining_tokens"] == budget
+    assert 0 <= packed["remaining_tokens"]
+    # One more example would not have fitted
+    one_more = learner._format_example(learner.examples[packed["examples"]])
+    assert packed["prompt_tokens"] + counter.count(one_more) > budget
+
+def test_example_prefix_is_identical_across_inputs():
+    learner = FewShotLearner(examples(10))
+    first = learner.create_packed_prompt("first transcript", n_shots=3, template=TEMPLATE)
+    second = learner.create_packed_prompt("second transcript, somewhat longer", n_shots=3, template=TEMPLATE)
+    assert first["examples"] == second["examples"] == 3
+    prefix = first["prompt"][:first["prompt"].index("Input:")]
+    assert second["prompt"].startswith(prefix)
+
+def test_input_that_does_not_fit_is_rejected_before_sending():
+    learner = FewShotLearner(examples(2))
+    with pytest.raises(PromptTooLargeError) as error:
+        learner.create_packed_prompt(" ".join(["word"] * 500), template=TEMPLATE, max_tokens=100,
+                                     context_window=400)
+    assert error.value.budget == 400 - 100 - MESSAGE_OVERHEAD_TOKENS
+    assert error.value.prompt_tokens > error.value.budget
+
+def test_token_report_is_logged(caplog):
+    learner = FewShotLearner(examples(2))
+    with caplog.at_level(logging.DEBUG, logger="app.core.few_shot.few_shot_learner"):
+        packed = learner.create_packed_prompt("transcript", template=TEMPLATE)
+    assert f"{packed['prompt_tokens']}-token prompt" in caplog.text
+    assert f"{packed['remaining_tokens']} tokens of the budget left" in caplog.text
@@ -0,0 +1,148 @@
+import json
+
+import pytest
+
+from scripts import finetune
+from scripts.finetune import NearDuplicateFilter, iter_records, prepare_record, prepare_training_data, simhash
+
+RECORDS = [
+    {"transcript": "a [nested] \"quoted\" ] , transcript", "summary": "s1"},
+    {"transcript": "x" * 50, "summary": "long ☃ text", "views": 1234567890},
+    [1, 2.5e10, None, True],
+    "plain string",
+    -0.000125,
+    {}
+]
+
+TOPICS = ["gradient descent", "binary search trees", "sourdough baking", "tax returns", "jazz harmony",
+          "volcano formation", "chess openings", "container networking"]
+
+def transcript(topic, variant=""):
+    words = " ".join(f"{topic} step {n} explains why {topic} matters" for n in range(20))
+    return f"Welcome to this tutorial about {topic}. {words} {variant}".strip()
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(finetune, "READ_CHUNK_CHARS", 7)
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_json_array_is_streamed_item_by_item(tmp_path, small_chunks, indent):
+    path = tmp_path / "records.json"
+    path.write_text("\n  " + json.dumps(RECORDS, indent=indent, ensure_ascii=False))
+    assert list(iter_records(str(path))) == RECORDS
+
+def test_json_array_items_are_yielded_before_the_file_is_read(tmp_path, small_chunks):
+    path = tmp_path / "records.json"
+    path.write_text(json.dumps(RECORDS) + "\n")
+    with open(path) as f:
+        f.read(1)
+        items = finetune._iter_json_array(f)
+        assert next(items) == RECORDS[0]
+        assert f.tell() < len(path.read_bytes())
+
+def test_empty_json_array(tmp_path):
+    path = tmp_path / "records.json"
+    path.write_text("[ ]")
+    assert list(iter_records(str(path))) == []
+
+@pytest.mark.parametrize("text", ["[{\"a\": 1}, {\"b\": 2}", "[{\"a\": 1} {\"b\": 2}]", "[{\"a\": 1}, {\"b\": "])
+def test_malformed_json_array_raises(tmp_path, small_chunks, text):
+    path = tmp_path / "records.json"
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        list(iter_records(str(path)))
+
+def test_jsonl_skips_blank_lines_and_reports_bad_lines(tmp_path):
+    path = tmp_path / "records.jsonl"
+    path.write_text("{\"a\": 1}\n\n{\"b\": 2}\n")
+    assert list(iter_records(str(path))) == [{"a": 1}, {"b": 2}]
+
+    path.write_text("{\"a\": 1}\n{\"b\": \n")
+    with pytest.raises(ValueError, match=":2 "):
+        list(iter_records(str(path)))
+
+def test_simhash_is_close_for_near_duplicates():
+    base = simhash(transcript("gradient descent"))
+    assert simhash(transcript("gradient descent").upper()) == base
+    near = simhash(transcript("gradient descent", "Thanks for watching."))
+    assert bin(base ^ near).count("1") <= 3
+    assert bin(base ^ simhash(transcript("sourdough baking"))).count("1") > 3
+    assert simhash("!!!") is None
+
+def test_near_duplicate_filter():
+    dedup = NearDuplicateFilter(max_distance=3)
+    fingerprints = [simhash(transcript(topic)) for topic in TOPICS]
+    assert all(dedup.add(fingerprint) for fingerprint in fingerprints)
+    assert not dedup.add(fingerprints[0])
+    assert not dedup.add(fingerprints[3] ^ 0b10100001)
+    assert dedup.add(fingerprints[3] ^ 0b11110000)
+
+    exact = NearDuplicateFilter(max_distance=0)
+    assert exact.add(fingerprints[0])
+    assert exact.add(fingerprints[0] ^ 1)
+    assert not exact.add(fingerprints[0])
+
+def test_near_duplicate_filter_rejects_unsupported_distance():
+    with pytest.raises(ValueError):
+        NearDuplicateFilter(max_distance=finetune.SIMHASH_BANDS)
+
+class WordCounter:
+    """Counts words, and one extra token for a transcript cut by split()."""
+
+    def count(self, text):
+        return len(text.split()) + text.count("~")
+
+    def split(self, text, max_tokens):
+        return [" ".join(text.split()[:max_tokens]) + "~"]
+
+@pytest.mark.parametrize("max_tokens", [40, 100, 301])
+def test_truncated_examples_fit_max_tokens(max_tokens):
+    record = {"transcript": " ".join(f"w{n}" for n in range(500)), "summary": "a short summary"}
+    status, line, tokens, fingerprint = prepare_record(record, WordCounter(), max_tokens)
+    assert status == "truncated"
+    assert tokens <= max_tokens
+    assert tokens == finetune.count_example_tokens(WordCounter(), json.loads(line)["messages"])
+    assert fingerprint is not None
+
+def test_example_that_cannot_fit_is_too_long():
+    record = {"transcript": "some words here", "summary": " ".join(["summary"] * 50)}
+    assert prepare_record(record, WordCounter(), 30)[0] == "too_long"
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_prepare_training_data_removes_duplicates(tmp_path, small_chunks, workers):
+    records = [{"transcript": transcript(topic), "summary": f"About {topic}."} for topic in TOPICS]
+    records.insert(3, dict(records[0]))
+    records.insert(5, {"transcript": transcript(TOPICS[2], "Thanks for watching."), "summary": "Again."})
+    records += [{"transcript": "", "summary": "x"}, {"transcript": 5, "summary": "x"}, "not a record"]
+    input_path = tmp_path / "records.json"
+    input_path.write_text(json.dumps(records))
+
+    manifest = prepare_training_data(str(input_path), str(tmp_path / "train.jsonl"), shard_size=3,
+                                     workers=workers)
+    assert manifest["records"] == {"read": 13, "written": 8, "truncated": 0, "duplicate": 2, "invalid": 2,
+                                   "empty": 1, "too_long": 0}
+    lines = []
+    for shard in manifest["shards"]:
+        with open(shard["path"]) as f:
+            lines += [json.loads(line) for line in f]
+    assert [shard["examples"] for shard in manifest["shards"]] == [3, 3, 2]
+    assert [example["messages"][2]["content"] for example in lines] == [f"About {topic}." for topic in TOPICS]
+    assert json.loads((tmp_path / "train.manifest.json").read_text())["records"] == manifest["records"]
+
+def test_main_refuses_to_fine_tune_on_one_of_several_shards(tmp_path, monkeypatch):
+    source = tmp_path / "records.jsonl"
+    source.write_text("".join(json.dumps({"transcript": transcript(topic), "summary": topic}) + "\n"
+                              for topic in TOPICS[:3]))
+    started = []
+    monkeypatch.setattr(finetune, "fine_tune_model", lambda *args: started.append(args))
+    monkeypatch.setattr("sys.argv", ["finetune.py", "--input", str(source), "--output",
+                                     str(tmp_path / "train.jsonl"), "--shard_size", "2", "--workers", "1"])
+    with pytest.raises(SystemExit) as exit_info:
+        finetune.main()
+    assert exit_info.value.code == 1
+    assert started == []
+
+    monkeypatch.setattr("sys.argv", ["finetune.py", "--input", str(source), "--output",
+                                     str(tmp_path / "train.jsonl"), "--workers", "1"])
+    finetune.main()
+    assert started == [(str(tmp_path / "train-00000.jsonl"), "video-recap", "gpt-3.5-turbo")]
@@ -0,0 +1,74 @@
+import random
+import re
+
+import pytest
+
+from app.core.few_shot.few_shot_learner import FewShotLearner
+from app.core.summarization.incremental import IncrementalSummarizer
+
+TOPICS = [
+    ["neural", "network", "layer", "weights", "gradient", "training", "loss", "activation"],
+    ["python", "list", "dictionary", "function", "loop", "variable", "module", "import"],
+    ["bread", "dough", "flour", "oven", "yeast", "starter", "knead", "crust"],
+    ["guitar", "chord", "string", "fret", "strum", "melody", "tuning", "scale"],
+]
+
+SECTION = re.compile(r"Section \d+:")
+
+class FakeGPT:
+    model = "gpt-4"
+
+    def __init__(self, summary_words=300):
+        self.summary_words = summary_words
+        self.prompts = []
+        self.counter = FewShotLearner().token_counter(self.model)
+
+    def generate_completion(self, prompt, max_tokens=None, cacheable=None):
+        self.prompts.append(prompt)
+        assert self.counter.count(prompt) + max_tokens <= self.counter.context_window
+        return " ".join(["point"] * self.summary_words)
+
+def transcript(sentences_per_topic=120, rounds=3):
+    rng = random.Random(0)
+    sentences = []
+    for _ in range(rounds):
+        for topic in TOPICS:
+            for _ in range(sentences_per_topic):
+                sentences.append(" ".join(rng.choices(topic, k=12)).capitalize() + ".")
+    return " ".join(sentences)
+
+def merge_prompts(gpt):
+    return [p for p in gpt.prompts if SECTION.search(p)]
+
+def test_first_update_of_a_long_transcript_merges_within_budget():
+    gpt = FakeGPT()
+    summarizer = IncrementalSummarizer(gpt, segment_tokens=1000, merge_tokens=2500, merge_fan_in=4,
+                                       summary_max_tokens=1200, map_max_tokens=500)
+    summarizer.append(transcript())
+    summary = summarizer.close()
+
+    assert summary
+    assert summarizer.segments_summarized > 8
+    counter = gpt.counter
+    merges = merge_prompts(gpt)
+    assert len(merges) > 1
+    for prompt in merges:
+        assert len(SECTION.findall(prompt)) <= 4
+        # The running summary and the new sections stay within merge_tokens, plus their headers
+        start = prompt.find("Current Summary:")
+        body = prompt[start if start >= 0 else SECTION.search(prompt).start():]
+        assert counter.count(body) <= 2500 + 50
+
+def test_one_fold_when_the_new_summaries_fit():
+    gpt = FakeGPT(summary_words=20)
+    summarizer = IncrementalSummarizer(gpt, segment_tokens=1000, merge_fan_in=64)
+    summarizer.append(transcript(rounds=1))
+    summarizer.close()
+
+    merges = merge_prompts(gpt)
+    assert len(merges) == 1
+    assert f"Section {summarizer.segments_summarized}:" in merges[0]
+
+def test_rejects_merge_budget_without_room_for_new_summaries():
+    with pytest.raises(ValueError):
+        IncrementalSummarizer(FakeGPT(), merge_tokens=1000, summary_max_tokens=1500)
@@ -0,0 +1,234 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.core.jobs.job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue
+from app.core.jobs.worker_pool import JobWorkerPool
+
+def test_claim_leases_oldest_job_once(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    first = queue.submit("youtube", {"url": "a"})
+    second = queue.submit("youtube", {"url": "b"})
+
+    job = queue.claim()
+    assert job["id"] == first
+    assert job["payload"] == {"url": "a"}
+    assert job["attempts"] == 1
+    assert queue.claim()["id"] == second
+    assert queue.claim() is None
+    assert queue.stats() == {RUNNING: 2}
+
+def test_concurrent_claims_never_share_a_job(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    submitter = JobQueue(path)
+    job_ids = {submitter.submit("upload", {"n": n}) for n in range(40)}
+    claimed = []
+    lock = threading.Lock()
+
+    def work():
+        queue = JobQueue(path)
+        while (job := queue.claim()) is not None:
+            with lock:
+                claimed.append(job["id"])
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(job_ids)
+
+def test_complete_stores_result(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = queue.submit("youtube", {"url": "a"})
+    queue.claim()
+    queue.set_stage(job_id, "summarize")
+
+    assert queue.complete(job_id, {"summary": "text"})
+    job = queue.get(job_id)
+    assert job["status"] == DONE
+    assert job["stage"] == "summarize"
+    assert job["result"] == {"summary": "text"}
+
+def test_other_owner_does_not_requeue_a_live_lease(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    worker = JobQueue(path, lease_seconds=60)
+    job_id = worker.submit("youtube", {"url": "a"})
+    worker.claim()
+
+    # A second process starting up must not take over the running job
+    other = JobQueue(path, lease_seconds=60)
+    assert other.requeue_expired() == 0
+    assert other.claim() is None
+    assert worker.complete(job_id, "done")
+
+def test_expired_lease_is_claimed_again_and_stale_owner_is_rejected(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    crashed = JobQueue(path, lease_seconds=0.1)
+    job_id = crashed.submit("youtube", {"url": "a"})
+    crashed.claim()
+    time.sleep(0.2)
+
+    other = JobQueue(path)
+    job = other.claim()
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+    assert not crashed.complete(job_id, "late")
+    assert not crashed.fail(job_id, "late")
+    assert other.complete(job_id, "done")
+    assert other.get(job_id)["result"] == "done"
+
+def test_renew_keeps_lease_alive(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    worker = JobQueue(path, lease_seconds=0.3)
+    job_id = worker.submit("youtube", {"url": "a"})
+    worker.claim()
+    for _ in range(3):
+        time.sleep(0.15)
+        assert worker.renew() == 1
+    assert JobQueue(path).claim() is None
+    assert worker.complete(job_id, "done")
+
+def test_expired_lease_out_of_attempts_fails(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=1, lease_seconds=0.05)
+    job_id = queue.submit("youtube", {"url": "a"})
+    queue.claim()
+    time.sleep(0.1)
+
+    assert queue.requeue_expired() == 1
+    job = queue.get(job_id)
+    assert job["status"] == FAILED
+    assert job["error"] == "Worker stopped while running the job"
+
+def test_failed_job_waits_for_backoff_then_fails_for_good(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2, retry_delay=0.2)
+    job_id = queue.submit("youtube", {"url": "a"})
+    queue.claim()
+
+    assert queue.fail(job_id, "network down")
+    job = queue.get(job_id)
+    assert job["status"] == QUEUED
+    assert job["error"] == "network down"
+    assert queue.claim() is None
+    time.sleep(0.25)
+    assert queue.claim()["attempts"] == 2
+
+    assert queue.fail(job_id, "still down")
+    assert queue.get(job_id)["status"] == FAILED
+    assert queue.claim() is None
+
+def test_legacy_database_is_migrated(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+        "status TEXT NOT NULL, stage TEXT, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO jobs VALUES ('old', 'youtube', '{}', 'queued', NULL, NULL, NULL, 0, 1, 1)")
+    conn.commit()
+    conn.close()
+
+    assert JobQueue(path).claim()["id"] == "old"
+
+def test_run_stage_computes_once_across_threads(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    calls = []
+    start = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"path": "audio.m4a"}
+
+    def run():
+        start.wait()
+        results.append(queue.run_stage("audio:abc", compute))
+
+    results = []
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{"path": "audio.m4a"}] * 8
+
+def test_run_stage_recomputes_invalid_result(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(path)
+    assert queue.run_stage("transcript:a", lambda: "first") == "first"
+    # Stored results are shared with other queues on the same database
+    assert JobQueue(path).run_stage("transcript:a", lambda: "second") == "first"
+    assert queue.run_stage("transcript:a", lambda: "second", is_valid=lambda value: value != "first") == "second"
+
+def test_run_stage_computes_once_across_processes(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    # Queues with their own owners stand in for separate processes
+    queues = [JobQueue(path) for _ in range(4)]
+    calls = []
+    start = threading.Barrier(len(queues))
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.3)
+        return "audio.m4a"
+
+    def run(queue):
+        start.wait()
+        results.append(queue.run_stage("audio:abc", compute))
+
+    results = []
+    threads = [threading.Thread(target=run, args=(queue,)) for queue in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ["audio.m4a"] * len(queues)
+    assert queues[0]._stage_locks == {}
+
+def test_run_stage_takes_over_expired_claim(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    crashed = JobQueue(path, lease_seconds=0.1)
+    assert crashed._claim_stage("audio:abc")
+    assert not JobQueue(path)._claim_stage("audio:abc")
+
+    time.sleep(0.2)
+    assert JobQueue(path).run_stage("audio:abc", lambda: "audio.m4a") == "audio.m4a"
+
+def test_run_stage_releases_claim_when_compute_fails(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(path)
+
+    def compute():
+        raise RuntimeError("download failed")
+
+    with pytest.raises(RuntimeError):
+        queue.run_stage("download:abc", compute)
+    assert queue._stage_locks == {}
+    assert JobQueue(path).run_stage("download:abc", lambda: "video.mp4") == "video.mp4"
+
+def test_worker_survives_queue_errors(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = queue.submit("youtube", {})
+    claim = queue.claim
+    failures = [sqlite3.OperationalError("database is locked")] * 2
+
+    def flaky_claim():
+        if failures:
+            raise failures.pop()
+        return claim()
+
+    queue.claim = flaky_claim
+    pool = JobWorkerPool(queue, lambda job, set_stage: "ok", num_workers=1, poll_interval=0.01)
+    pool.start()
+    try:
+        deadline = time.time() + 5
+        while queue.get(job_id)["status"] != "done" and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        pool.stop()
+    assert queue.get(job_id)["result"] == "ok"
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.core.data_collection import media_store
+from app.core.data_collection.media_store import MediaStore
+
+DATA = bytes(range(256)) * 400
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.ranges.append(self.headers.get("Range"))
+        start, end = self.headers["Range"].split("=")[1].split("-")
+        start, end = int(start), min(int(end), len(DATA) - 1)
+        if start >= len(DATA):
+            self.send_response(416)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = DATA[start:end + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if server.failures > 0 and start > 0:
+            # Drop the connection partway through the body
+            server.failures -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    httpd.ranges = []
+    httpd.failures = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture(autouse=True)
+def no_retry_sleep(monkeypatch):
+    monkeypatch.setattr(media_store.time, "sleep", lambda seconds: None)
+
+def url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/audio.m4a"
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_fetch_downloads_in_ranges_and_caches(tmp_path, server):
+    store = MediaStore(str(tmp_path), segment_bytes=30000)
+    path = store.fetch("youtube:abc:audio", url(server), extension=".m4a")
+
+    assert read(path) == DATA
+    assert path.endswith(".m4a")
+    assert server.ranges[:2] == ["bytes=0-29999", "bytes=30000-59999"]
+    requests = len(server.ranges)
+    assert store.fetch("youtube:abc:audio", lambda: pytest.fail("URL resolved for a stored key")) == path
+    assert len(server.ranges) == requests
+
+def test_fetch_resumes_after_dropped_connection(tmp_path, server):
+    server.failures = 2
+    store = MediaStore(str(tmp_path), segment_bytes=30000)
+    path = store.fetch("youtube:abc:audio", url(server))
+
+    assert read(path) == DATA
+    # The retries of the broken second segment do not download the first one again
+    assert server.ranges[:4] == ["bytes=0-29999"] + ["bytes=30000-59999"] * 3
+
+def test_fetch_resumes_partial_file_from_earlier_run(tmp_path, server):
+    store = MediaStore(str(tmp_path), segment_bytes=1 << 20)
+    part_path = os.path.join(store.root, "partial",
+                             media_store.hashlib.sha256(b"youtube:abc:audio").hexdigest() + ".part")
+    with open(part_path, "wb") as f:
+        f.write(DATA[:50000])
+
+    path = store.fetch("youtube:abc:audio", url(server))
+    assert read(path) == DATA
+    assert server.ranges[0].startswith("bytes=50000-")
+
+def test_add_stores_identical_content_once(tmp_path):
+    store = MediaStore(str(tmp_path / "store"))
+    for name in ("a.mp3", "b.mp3"):
+        (tmp_path / name).write_bytes(b"same audio")
+    first = store.add("audio:a", str(tmp_path / "a.mp3"))
+    second = store.add("audio:b", str(tmp_path / "b.mp3"))
+
+    assert first == second
+    assert store.stats()["bytes"] == len(b"same audio")
+
+def add_file(store, tmp_path, key, size):
+    path = tmp_path / f"{key.replace(':', '_')}.bin"
+    path.write_bytes(key.encode().ljust(size, b"\0"))
+    return store.add(key, str(path))
+
+def test_evict_removes_least_recently_used(tmp_path):
+    store = MediaStore(str(tmp_path / "store"), max_bytes=250)
+    first = add_file(store, tmp_path, "a", 100)
+    add_file(store, tmp_path, "b", 100)
+    store.get("a")
+    add_file(store, tmp_path, "c", 100)
+
+    assert store.get("b") is None
+    assert store.get("a") == first
+    assert store.get("c") is not None
+    assert store.stats()["bytes"] == 200
+
+def test_partial_downloads_count_toward_quota(tmp_path):
+    store = MediaStore(str(tmp_path / "store"), max_bytes=250)
+    add_file(store, tmp_path, "a", 100)
+    add_file(store, tmp_path, "b", 100)
+    # An interrupted download waiting to be resumed
+    (tmp_path / "store" / "partial" / "c.part").write_bytes(b"\0" * 100)
+    assert store.stats()["partial_bytes"] == 100
+
+    store.evict()
+    assert store.get("a") is None
+    assert store.get("b") is not None
+    assert store.stats()["bytes"] == 200
+
+def test_download_makes_room_as_it_arrives(tmp_path, server, monkeypatch):
+    store = MediaStore(str(tmp_path / "store"), max_bytes=len(DATA), segment_bytes=30000)
+    add_file(store, tmp_path, "old", 100)
+    added = []
+    monkeypatch.setattr(store, "add", lambda key, path, extension=None: added.append(store.get("old")))
+
+    store.fetch("youtube:abc:audio", url(server))
+    # The old entry went before the download finished
+    assert added == [None]
+
+def test_referenced_entries_are_not_evicted(tmp_path):
+    store = MediaStore(str(tmp_path / "store"), max_bytes=150)
+    with store.reference("a"):
+        add_file(store, tmp_path, "a", 100)
+        with store.reference("a"):
+            add_file(store, tmp_path, "b", 100)
+            assert store.get("a") is not None
+            assert store.get("b") is not None
+        # One of the two references is still held
+        add_file(store, tmp_path, "c", 100)
+        assert store.get("a") is not None
+        assert store.get("b") is None
+    add_file(store, tmp_path, "d", 100)
+    assert store.get("a") is None
+
+def test_references_of_exited_processes_are_pruned(tmp_path):
+    root = str(tmp_path / "store")
+    store = MediaStore(root, max_bytes=150)
+    add_file(store, tmp_path, "a", 100)
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    conn = sqlite3.connect(store.db_path)
+    conn.execute("INSERT INTO refs (key, host, pid, count) VALUES ('a', ?, ?, 1)",
+                 (media_store.socket.gethostname(), exited.pid))
+    conn.commit()
+    conn.close()
+    store.acquire("b")
+
+    # Opening the store again keeps the live process's reference
+    assert MediaStore(root, max_bytes=150).prune_references() == 1
+    add_file(store, tmp_path, "b", 100)
+    add_file(store, tmp_path, "c", 100)
+    assert store.get("a") is None
+    assert store.get("b") is not None
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from app.core.monitoring import metrics as metrics_module
+from app.core.monitoring.metrics import MetricsRegistry
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(metrics_module.time, "perf_counter", clock)
+    return clock
+
+def produce(clock, delays, error=None, closed=None):
+    """Yield one item per delay, advancing the clock by it first, as a model stream would."""
+    try:
+        for n, delay in enumerate(delays):
+            clock.now += delay
+            yield n
+        if error is not None:
+            raise error
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+def stage(registry, name):
+    return registry.snapshot()["stages"][name]
+
+def test_timed_stream_excludes_consumer_time(clock):
+    registry = MetricsRegistry(enabled=True)
+    for _ in registry.timed_stream("generate", produce(clock, [2.0, 0.5, 0.5]), first_stage="first_token"):
+        # The consumer takes its time with every item
+        clock.now += 10.0
+
+    assert stage(registry, "generate")["total_seconds"] == pytest.approx(3.0)
+    assert stage(registry, "first_token")["total_seconds"] == pytest.approx(2.0)
+
+def test_timed_stream_records_errors_but_not_early_close(clock):
+    registry = MetricsRegistry(enabled=True)
+    with pytest.raises(ValueError):
+        list(registry.timed_stream("generate", produce(clock, [1.0], error=ValueError("broken"))))
+    assert stage(registry, "generate")["errors"] == 1
+
+    closed = []
+    stream = registry.timed_stream("generate", produce(clock, [1.0, 1.0], closed=closed))
+    assert next(stream) == 0
+    stream.close()
+    # Stopping early closes the underlying stream and is not an error
+    assert closed == [True]
+    assert stage(registry, "generate") == {"count": 2, "total_seconds": pytest.approx(2.0),
+                                          "mean_seconds": pytest.approx(1.0), "errors": 1}
+
+def test_timed_async_stream_excludes_consumer_time(clock):
+    registry = MetricsRegistry(enabled=True)
+
+    async def produce_async(delays):
+        for item in produce(clock, delays):
+            yield item
+
+    async def consume():
+        async for _ in registry.timed_async_stream("generate", produce_async([1.5, 0.5]),
+                                                   first_stage="first_token"):
+            clock.now += 10.0
+
+    asyncio.run(consume())
+    assert stage(registry, "generate")["total_seconds"] == pytest.approx(2.0)
+    assert stage(registry, "first_token")["total_seconds"] == pytest.approx(1.5)
+
+def test_timed_stream_passes_items_through_when_disabled(clock):
+    registry = MetricsRegistry()
+    assert list(registry.timed_stream("generate", produce(clock, [1.0, 1.0]))) == [0, 1]
+    assert registry.snapshot()["stages"] == {}
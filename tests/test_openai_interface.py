@@ -0,0 +1,178 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app.core.model import openai_interface
+from app.core.model.async_openai_interface import AsyncGPTInterface
+from app.core.model.openai_interface import GPTInterface, retry_delay
+
+class FakeLimiter:
+    def __init__(self):
+        self.calls = []
+
+    def acquire(self, tokens, priority):
+        self.calls.append(("acquire", tokens))
+
+    def try_acquire(self, ticket, tokens, priority):
+        self.calls.append(("acquire", tokens))
+        return 0
+
+    def cancel(self, ticket):
+        pass
+
+    def observe(self, headers):
+        self.calls.append(("observe", headers.get("retry-after") if headers is not None else None))
+
+    def settle(self, estimated_tokens, actual_tokens):
+        self.calls.append(("settle", estimated_tokens, actual_tokens))
+
+class FakeChunks:
+    def __init__(self, deltas, error=None):
+        self.deltas = deltas
+        self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        for delta in self.deltas:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+        if self.error is not None:
+            raise self.error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        for chunk in self:
+            yield chunk
+
+class FakeResponse:
+    def __init__(self, result):
+        self.headers = httpx.Headers()
+        self.result = result
+
+    def parse(self):
+        return self.result
+
+class FakeCreate:
+    """Stand-in for ``client.chat.completions.with_raw_response.create`` replaying scripted outcomes."""
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    def __call__(self, **kwargs):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+class AsyncFakeCreate(FakeCreate):
+    async def __call__(self, **kwargs):
+        return super().__call__(**kwargs)
+
+def fake_client(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        with_raw_response=SimpleNamespace(create=create))))
+
+def rate_limit_error(retry_after):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+def completion(text, total_tokens):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=SimpleNamespace(prompt_tokens=total_tokens - 1, completion_tokens=1, total_tokens=total_tokens)
+    )
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(openai_interface.time, "sleep", sleeps.append)
+    return sleeps
+
+def interface(outcomes, rate_limiter=None):
+    gpt = GPTInterface(api_key="sk-test", rate_limiter=rate_limiter)
+    gpt.client = fake_client(FakeCreate(outcomes))
+    return gpt
+
+def test_retry_delay_leaves_retry_after_to_the_rate_limiter():
+    error = rate_limit_error("7")
+    assert retry_delay(error, 1) == 7
+    assert retry_delay(error, 1, rate_limited=True) == 0
+
+def test_rate_limited_retry_waits_only_in_the_limiter(sleeps):
+    limiter = FakeLimiter()
+    gpt = interface([rate_limit_error("7"), completion("done", 12)], rate_limiter=limiter)
+
+    assert gpt.generate_completion("prompt", max_tokens=10) == "done"
+    assert sleeps == [0]
+    # The 429 reached the limiter, which blocks the next acquire, and its reservation was returned
+    estimated = limiter.calls[0][1]
+    assert limiter.calls[:3] == [("acquire", estimated), ("observe", "7"), ("settle", estimated, 0)]
+    assert limiter.calls[-1] == ("settle", estimated, 12)
+
+def test_retry_after_is_slept_without_a_rate_limiter(sleeps):
+    gpt = interface([rate_limit_error("7"), completion("done", 12)])
+    assert gpt.generate_completion("prompt", max_tokens=10) == "done"
+    assert sleeps == [7]
+
+def test_broken_stream_settles_the_tokens_it_used(sleeps):
+    limiter = FakeLimiter()
+    broken = FakeChunks(["Hello there, ", "general"], error=httpx.ReadError("connection reset"))
+    gpt = interface([broken, FakeChunks([" Kenobi."])], rate_limiter=limiter)
+
+    assert "".join(gpt.stream_completion("prompt", max_tokens=50)) == "Hello there, general Kenobi."
+    settles = [call for call in limiter.calls if call[0] == "settle"]
+    acquires = [call for call in limiter.calls if call[0] == "acquire"]
+    assert len(settles) == 2
+    # Each attempt returns what it reserved less what it sent and received
+    for (_, reserved), (_, estimated, used) in zip(acquires, settles):
+        assert estimated == reserved
+        assert 0 < used < reserved
+
+def test_abandoned_stream_settles_its_reservation(sleeps):
+    limiter = FakeLimiter()
+    gpt = interface([FakeChunks(["one ", "two ", "three"])], rate_limiter=limiter)
+
+    stream = gpt.stream_completion("prompt", max_tokens=50)
+    assert next(stream) == "one "
+    stream.close()
+    assert [call[0] for call in limiter.calls] == ["acquire", "observe", "settle"]
+    _, estimated, used = limiter.calls[-1]
+    assert 0 < used < estimated
+
+def test_async_broken_stream_settles_without_sleeping_on_retry_after(monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    limiter = FakeLimiter()
+    gpt = AsyncGPTInterface(api_key="sk-test", rate_limiter=limiter)
+    gpt.client = fake_client(AsyncFakeCreate([
+        FakeChunks(["partial "], error=httpx.ReadError("connection reset")),
+        rate_limit_error("7"),
+        FakeChunks(["answer"]),
+    ]))
+
+    async def collect():
+        return "".join([delta async for delta in gpt.stream_completion("prompt", max_tokens=50)])
+
+    assert asyncio.run(collect()) == "partial answer"
+    settles = [call for call in limiter.calls if call[0] == "settle"]
+    assert len(settles) == 3
+    assert 0 < settles[0][2] < settles[0][1]
+    # The 429 was never answered, so none of its reservation was used
+    assert settles[1][2] == 0
+    assert sleeps[-1] == 0
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from app.core.formatting import output_formatter
+from app.core.formatting.output_formatter import OutputFormatter, output_paths, parse_summary, write_summary
+
+SUMMARY = """# Scaling Postgres
+
+Intro paragraph about the talk.
+
+## [00:30] Indexes
+- [01:15] B-tree basics
+  - Covering indexes with **INCLUDE**
+- Partial indexes
+1. Measure first
+2. Then add the index
+
+**Takeaways:**
+- Use `EXPLAIN ANALYZE`
+- [1:02:03] Q&A
+"""
+
+def test_parse_splits_title_sections_and_timestamps():
+    parsed = parse_summary(SUMMARY)
+    assert parsed["title"] == "Scaling Postgres"
+    assert [section["title"] for section in parsed["sections"]] == [None, "Indexes", "Takeaways"]
+
+    indexes = parsed["sections"][1]
+    assert indexes["timestamp"] == {"seconds": 30, "label": "00:30"}
+    first, nested = indexes["items"][:2]
+    assert (first["text"], first["timestamp"]["seconds"], first["depth"]) == ("B-tree basics", 75, 0)
+    assert (nested["depth"], nested["ordered"]) == (1, False)
+    assert [item["ordered"] for item in indexes["items"][3:]] == [True, True]
+    assert parsed["sections"][2]["items"][1]["timestamp"] == {"seconds": 3723, "label": "1:02:03"}
+
+def test_markdown_round_trips_through_the_parser():
+    structured = OutputFormatter().structure(SUMMARY)
+    rendered = OutputFormatter("markdown").render(structured)
+
+    reparsed = parse_summary(rendered)
+    assert reparsed["title"] == structured["title"]
+    assert reparsed["sections"] == structured["sections"]
+    # Rendering the reparsed summary again changes nothing
+    assert OutputFormatter("markdown").format_summary(rendered) == rendered
+
+def test_json_round_trips_to_the_structured_summary(monkeypatch):
+    monkeypatch.setattr(output_formatter, "JSON_CHUNK_CHARS", 100)
+    structured = OutputFormatter().structure(SUMMARY, {"video_id": "abc", "duration": "1:05:00"})
+    pieces = list(OutputFormatter("json").render_stream(structured))
+
+    assert len(pieces) > 1
+    assert json.loads("".join(pieces)) == structured
+
+def test_html_keeps_structure_and_escapes_text():
+    structured = OutputFormatter().structure("## <Intro>\n- [00:05] a **bold** & `code` point\n")
+    rendered = OutputFormatter("html").render(structured)
+
+    assert "<title>Video Summary</title>" in rendered
+    assert "<h2>&lt;Intro&gt;</h2>" in rendered
+    assert ('<li><time class="timestamp" data-seconds="5">00:05</time> '
+            'a <strong>bold</strong> &amp; <code>code</code> point</li>') in rendered
+
+def test_every_format_is_written_from_one_structured_summary(tmp_path):
+    structured = OutputFormatter().structure(SUMMARY, {"video_id": "abc"})
+    paths = output_paths(str(tmp_path / "out" / "summary.md"), ["markdown", "json", "html", "json"])
+    assert paths == {"markdown": str(tmp_path / "out" / "summary.md"),
+                     "json": str(tmp_path / "out" / "summary.json"),
+                     "html": str(tmp_path / "out" / "summary.html")}
+
+    write_summary(structured, paths)
+    for format_type, path in paths.items():
+        with open(path) as f:
+            assert f.read() == OutputFormatter(format_type).render(structured)
+    assert output_paths("summary.txt", ["html"]) == {"html": "summary.txt"}
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        OutputFormatter("pdf")
@@ -0,0 +1,137 @@
+import pytest
+
+from app.core.model import rate_limiter
+from app.core.model.rate_limiter import (BATCH, INTERACTIVE, MAX_POLL_INTERVAL, WAITER_TIMEOUT, RateLimiter,
+                                         parse_duration, retry_after_seconds)
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "time", clock)
+    return clock
+
+def limiter(tmp_path, **limits):
+    return RateLimiter(str(tmp_path / "ratelimit.sqlite3"), **limits)
+
+def exhaust(limits):
+    """Take every request in a full bucket, leaving one to refill each second at 60 per minute."""
+    for n in range(limits.requests_per_minute):
+        assert limits.try_acquire(f"fill-{n}", 0) == 0
+
+def test_request_bucket_refills_over_time(tmp_path, clock):
+    limits = limiter(tmp_path, requests_per_minute=2)
+    assert limits.try_acquire("a", 0) == 0
+    assert limits.try_acquire("b", 0) == 0
+    # The next request is 30 seconds away, but waiters poll at least every MAX_POLL_INTERVAL
+    assert limits.try_acquire("c", 0) == MAX_POLL_INTERVAL
+    clock.now += 29
+    assert limits.try_acquire("c", 0) > 0
+    clock.now += 1
+    assert limits.try_acquire("c", 0) == 0
+
+def test_token_bucket_waits_for_tokens(tmp_path, clock):
+    limits = limiter(tmp_path, tokens_per_minute=1200)
+    assert limits.try_acquire("a", 1000) == 0
+    assert limits.try_acquire("b", 500) == MAX_POLL_INTERVAL
+    # 300 missing tokens refill at 20 per second
+    clock.now += 14
+    assert limits.try_acquire("b", 500) == pytest.approx(1.0)
+    clock.now += 1
+    assert limits.try_acquire("b", 500) == 0
+
+def test_settle_returns_unused_tokens(tmp_path, clock):
+    limits = limiter(tmp_path, tokens_per_minute=1000)
+    assert limits.try_acquire("a", 900) == 0
+    assert limits.try_acquire("b", 900) > 0
+    limits.settle(900, 100)
+    assert limits.try_acquire("b", 900) == 0
+
+def test_request_larger_than_bucket_is_admitted_when_full(tmp_path, clock):
+    limits = limiter(tmp_path, tokens_per_minute=1000)
+    assert limits.try_acquire("a", 5000) == 0
+    assert limits.try_acquire("b", 1) > 0
+
+def test_limiters_on_one_database_share_the_budget(tmp_path, clock):
+    first = limiter(tmp_path, requests_per_minute=1)
+    second = limiter(tmp_path, requests_per_minute=1)
+    assert first.try_acquire("a", 0) == 0
+    assert second.try_acquire("b", 0) > 0
+
+def test_named_buckets_are_independent(tmp_path, clock):
+    path = str(tmp_path / "ratelimit.sqlite3")
+    assert RateLimiter(path, requests_per_minute=1, name="chat").try_acquire("a", 0) == 0
+    assert RateLimiter(path, requests_per_minute=1, name="audio").try_acquire("b", 0) == 0
+
+def test_interactive_lane_goes_before_batch(tmp_path, clock):
+    limits = limiter(tmp_path, requests_per_minute=60)
+    exhaust(limits)
+    assert limits.try_acquire("batch", 0, BATCH) > 0
+    clock.now += 0.5
+    assert limits.try_acquire("interactive", 0, INTERACTIVE) > 0
+
+    clock.now += 0.5
+    # The batch request arrived first but waits while an interactive one is queued
+    assert limits.try_acquire("batch", 0, BATCH) > 0
+    assert limits.try_acquire("interactive", 0, INTERACTIVE) == 0
+    clock.now += 1
+    assert limits.try_acquire("batch", 0, BATCH) == 0
+
+def test_lane_is_served_in_arrival_order(tmp_path, clock):
+    limits = limiter(tmp_path, requests_per_minute=60)
+    exhaust(limits)
+    assert limits.try_acquire("early", 0) > 0
+    clock.now += 0.5
+    assert limits.try_acquire("late", 0) > 0
+    clock.now += 0.5
+    assert limits.try_acquire("late", 0) > 0
+    assert limits.try_acquire("early", 0) == 0
+
+def test_cancelled_and_abandoned_waiters_give_up_their_place(tmp_path, clock):
+    limits = limiter(tmp_path, requests_per_minute=60)
+    exhaust(limits)
+    assert limits.try_acquire("cancelled", 0) > 0
+    clock.now += 1
+    assert limits.try_acquire("abandoned", 0) > 0
+    clock.now += 1
+    assert limits.try_acquire("waiting", 0) > 0
+    limits.cancel("cancelled")
+
+    # There is capacity again, but only the waiter that kept polling still has a place
+    clock.now += WAITER_TIMEOUT - 1
+    assert limits.try_acquire("waiting", 0) > 0
+    clock.now += 2
+    assert limits.try_acquire("waiting", 0) == 0
+
+def test_observe_caps_buckets_and_honors_reset(tmp_path, clock):
+    limits = limiter(tmp_path, requests_per_minute=100, tokens_per_minute=10000)
+    limits.observe({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s"})
+    assert limits.try_acquire("a", 10) > 0
+    clock.now += 2
+    assert limits.try_acquire("a", 10) == 0
+
+    limits.observe({"x-ratelimit-remaining-tokens": "50"})
+    assert limits.try_acquire("b", 100) > 0
+
+def test_observe_retry_after_blocks_every_caller(tmp_path, clock):
+    limits = limiter(tmp_path)
+    limits.observe({"retry-after": "5"})
+    assert limits.try_acquire("a", 0) == MAX_POLL_INTERVAL
+    clock.now += 5
+    assert limits.try_acquire("a", 0) == 0
+
+def test_header_parsing():
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1h2m3.5s") == pytest.approx(3723.5)
+    assert parse_duration(None) is None
+    assert retry_after_seconds({"retry-after-ms": "1500", "retry-after": "9"}) == 1.5
+    assert retry_after_seconds({"retry-after": "3"}) == 3
+    assert retry_after_seconds({"retry-after": "soon"}) is None
+    assert retry_after_seconds({}) is None
@@ -0,0 +1,35 @@
+from app.core.few_shot.token_counter import TokenCounter
+from app.core.preprocessing.preprocessor import TextPreprocessor
+from app.core.preprocessing.topic_segmenter import TopicSegmenter
+
+def sentences(topic, n):
+    return [f"The {topic} part {i} covers {topic} details and {topic} examples." for i in range(n)]
+
+def test_segments_stay_within_budget_of_the_given_counter():
+    counter = TokenCounter("gpt-3.5-turbo").count
+    segmenter = TopicSegmenter(max_tokens=60, token_counter=counter)
+    segments = segmenter.segment(sentences("python", 30) + sentences("baking", 30))
+    assert len(segments) > 2
+    assert all(counter(segment) <= 60 for segment in segments)
+
+def test_single_sentence_above_budget_is_split_between_words():
+    counter = TokenCounter("gpt-3.5-turbo").count
+    long_sentence = " ".join(f"word{i}" for i in range(300)) + "."
+    segmenter = TopicSegmenter(max_tokens=50, token_counter=counter)
+    text = sentences("python", 3) + [long_sentence] + sentences("python", 3)
+
+    segments = segmenter.segment(text)
+    assert all(counter(segment) <= 50 for segment in segments)
+    assert " ".join(segments).split() == " ".join(text).split()
+
+def test_preprocessor_passes_its_token_counter():
+    calls = []
+
+    def counter(text):
+        calls.append(text)
+        return len(text.split())
+
+    preprocessor = TextPreprocessor(token_counter=counter)
+    segments = preprocessor.segment_by_topics(" ".join(sentences("python", 20)), max_tokens=30)
+    assert calls
+    assert all(len(segment.split()) <= 30 for segment in segments)
@@ -0,0 +1,54 @@
+import stat
+import sys
+
+import numpy as np
+import pytest
+
+from app.core.data_collection import video_collector
+from app.core.data_collection.audio_chunker import SAMPLE_RATE, AudioChunker
+from app.core.data_collection.transcriber import Transcriber
+from app.core.data_collection.video_collector import stream_audio
+
+def fake_ffmpeg(tmp_path, script):
+    path = tmp_path / "ffmpeg"
+    path.write_text("#!/bin/sh\n" + script)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+@pytest.fixture
+def transcriber(monkeypatch):
+    transcriber = Transcriber(use_openai=True, api_key="sk-test", chunked=True, max_workers=2,
+                              chunker=AudioChunker(window_seconds=10, overlap_seconds=1, search_seconds=2))
+    sent = []
+
+    def transcribe_samples(samples):
+        sent.append(len(samples))
+        return {"text": f"chunk {len(sent)}", "language": "en", "segments": []}
+
+    monkeypatch.setattr(transcriber, "_transcribe_openai_result", transcribe_samples)
+    yield transcriber, sent
+    transcriber.close()
+
+def test_empty_audio_sends_nothing(transcriber):
+    transcriber, sent = transcriber
+    result = transcriber.transcribe_detailed(np.zeros(0, dtype=np.float32))
+    assert sent == []
+    assert result == {"text": "", "language": None, "segments": []}
+
+def test_chunked_file_is_decoded_with_ffmpeg(transcriber, tmp_path, monkeypatch):
+    transcriber, sent = transcriber
+    # 25 s of 16-bit silence, read through the ffmpeg pipe rather than Whisper's loader
+    ffmpeg = fake_ffmpeg(tmp_path, f"head -c {25 * SAMPLE_RATE * 2} /dev/zero\n")
+    monkeypatch.setattr(video_collector, "stream_audio",
+                        lambda source: stream_audio(source, ffmpeg, block_seconds=4))
+    monkeypatch.setitem(sys.modules, "whisper", None)
+
+    result = transcriber.transcribe_detailed(str(tmp_path / "talk.m4a"))
+    assert sum(sent) >= 25 * SAMPLE_RATE
+    assert len(sent) == 3
+    assert result["text"] == "chunk 1 chunk 2 chunk 3"
+
+def test_stream_audio_error_includes_ffmpeg_output(tmp_path):
+    ffmpeg = fake_ffmpeg(tmp_path, "echo 'talk.m4a: Invalid data found when processing input' >&2\nexit 1\n")
+    with pytest.raises(RuntimeError, match="Invalid data found"):
+        list(stream_audio("talk.m4a", ffmpeg))
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from app.core.data_collection import transcript_cache
+from app.core.data_collection.transcriber import Transcriber
+from app.core.data_collection.transcript_cache import TranscriptCache
+
+RESULT = {"text": "hello world", "language": "en",
+          "segments": [{"start": 0.0, "end": 1.5, "text": "hello world"}]}
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(transcript_cache.time, "time", clock)
+    return clock
+
+def cache(tmp_path, **limits):
+    return TranscriptCache(str(tmp_path / "cache" / "transcripts.sqlite3"), **limits)
+
+def test_fingerprint_follows_content_not_path(tmp_path):
+    for name, data in (("a.wav", b"audio"), ("b.wav", b"audio"), ("c.wav", b"other")):
+        (tmp_path / name).write_bytes(data)
+    assert TranscriptCache.fingerprint(str(tmp_path / "a.wav")) == TranscriptCache.fingerprint(str(tmp_path / "b.wav"))
+    assert TranscriptCache.fingerprint(str(tmp_path / "a.wav")) != TranscriptCache.fingerprint(str(tmp_path / "c.wav"))
+
+    samples = np.zeros(16000, dtype=np.float32)
+    assert TranscriptCache.fingerprint_samples(samples) == TranscriptCache.fingerprint_samples(samples.copy())
+    samples[0] = 0.5
+    assert TranscriptCache.fingerprint_samples(samples) != TranscriptCache.fingerprint_samples(np.zeros(16000, np.float32))
+
+def test_key_covers_model_and_language():
+    key = TranscriptCache.make_key("abc", "base", "en")
+    assert TranscriptCache.make_key("abc", "base", "en") == key
+    assert len({
+        key,
+        TranscriptCache.make_key("abd", "base", "en"),
+        TranscriptCache.make_key("abc", "small", "en"),
+        TranscriptCache.make_key("abc", "base", "de"),
+        TranscriptCache.make_key("abc", "base"),
+    }) == 5
+    # No language is the same as an empty one
+    assert TranscriptCache.make_key("abc", "base", None) == TranscriptCache.make_key("abc", "base", "")
+
+def test_results_persist_across_instances(tmp_path, clock):
+    key = TranscriptCache.make_key("abc", "base", "en")
+    assert cache(tmp_path).get(key) is None
+    cache(tmp_path).set(key, RESULT, "abc", "base", "en")
+
+    reopened = cache(tmp_path)
+    assert reopened.get(key) == RESULT
+    assert reopened.stats() == {"hits": 1, "misses": 0, "hit_rate": 1.0, "entries": 1}
+
+def test_least_recently_used_results_are_evicted(tmp_path, clock):
+    store = cache(tmp_path, max_entries=2)
+    for key in ("a", "b"):
+        store.set(key, RESULT, key, "base")
+        clock.now += 1
+    store.get("a")
+    clock.now += 1
+    store.set("c", RESULT, "c", "base")
+
+    assert store.get("b") is None
+    assert store.get("a") == RESULT
+    assert store.get("c") == RESULT
+
+class CountingTranscriber(Transcriber):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.runs = 0
+
+    def _transcribe_result(self, audio):
+        self.runs += 1
+        return dict(RESULT, language=self.language)
+
+def test_transcriber_reuses_results_for_the_same_audio_and_settings(tmp_path):
+    store = cache(tmp_path)
+    audio = tmp_path / "talk.wav"
+    audio.write_bytes(b"recording")
+    transcriber = CountingTranscriber(language="en", cache=store)
+
+    assert transcriber.transcribe(str(audio)) == "hello world"
+    # A copy of the recording elsewhere is the same audio
+    copy = tmp_path / "copy.wav"
+    copy.write_bytes(b"recording")
+    transcriber.transcribe_detailed(str(copy))
+    assert transcriber.runs == 1
+
+    # Another language or model is transcribed again
+    CountingTranscriber(language="de", cache=store).transcribe(str(audio))
+    other_model = CountingTranscriber(model_name="small", language="en", cache=store)
+    other_model.transcribe(str(audio))
+    assert other_model.runs == 1
+    assert store.stats()["entries"] == 3
+
+    # Changed audio is a miss
+    audio.write_bytes(b"re-recorded")
+    transcriber.transcribe(str(audio))
+    assert transcriber.runs == 2